@@ -0,0 +1,388 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+# Benchmarks the monitor -> decide -> execute hot paths offline. The MonitoringAgent,
+# DeciderAgent and ExecutorAgent behaviours are driven directly, one call per cycle, with
+# simulation.py's fake Azure clients (no latency) and an outbox in place of XMPP; each
+# sweep's metrics messages go to the decider and its decisions to the executor.
+#
+#   python benchmark_agents.py                          # 10, 1k and 100k VMs
+#   python benchmark_agents.py --vms 1000 --compare     # against the previous 1k run
+#
+# Per stage: messages per second and p50/p99 latency per message (a monitor message is timed
+# from the previous one). Memory per tracked VM comes from a separate tracemalloc pass, so
+# tracing does not slow the timed pass. Startup is the import time of each agent and of the
+# Azure SDK modules, each in a fresh interpreter. Every run is appended as one JSON line to
+# --output. The agents log nothing (their per-VM INFO lines are not part of the timings).
+logging.basicConfig(handlers=[logging.NullHandler()], level=logging.WARNING)
+
+import decider_agent  # noqa: E402
+import executor_agent  # noqa: E402
+import monitoring_agent  # noqa: E402
+import telemetry  # noqa: E402
+from metric_cache import MetricWindowCache, percentile  # noqa: E402
+from metrics_protocol import ONTOLOGY  # noqa: E402
+from simulation import (DECIDER_JID, EXECUTOR_JID, MONITOR_JID, FakeComputeClient, FakeMetricsClient,  # noqa: E402
+                        SimulatedFleet, SimulationStats, SyntheticWorkload, build_parser, configure_agents)
+from sku_optimizer import STATIC_CATALOG  # noqa: E402
+from spade.container import Container  # noqa: E402
+from vm_inventory import VMInventory  # noqa: E402
+
+FLEET_SIZES = [10, 1_000, 100_000]
+SWEEPS = 3  # Monitor sweeps per fleet size, each followed by the decider and the executor
+FLEET_AGE_SECONDS = 150  # Two closed minutes of datapoints are queryable at the first sweep
+RESIZE_EVERY = 20  # Every 20th decision is turned into a scale_up so resizes are exercised
+# (no_action is sent as well, so the executor stage still sees one message per VM per sweep)
+STARTUP_MODULES = [
+    "azure.identity.aio",
+    "azure.mgmt.compute.aio",
+    "azure.mgmt.compute.models",
+    "azure.monitor.query.aio",
+    "spade",
+    "numpy",
+    "monitoring_agent",
+    "decider_agent",
+    "executor_agent"
+]
+STARTUP_REPEATS = 3
+# Imports one module in a fresh interpreter and prints how long that took (agent logging
+# goes nowhere, as here)
+IMPORT_PROBE = ("import logging, sys, time; logging.basicConfig(handlers=[logging.NullHandler()]); "
+                "started = time.perf_counter(); __import__(sys.argv[1]); print(time.perf_counter() - started)")
+
+
+class Outbox:
+    # Stands in for the XMPP container: keeps what the behaviours send and when
+
+    def __init__(self):
+        self.messages = []
+        self.sent_at = []
+
+    async def send(self, msg, behaviour):
+        self.messages.append(msg)
+        self.sent_at.append(time.perf_counter())
+
+    def take(self):
+        messages, self.messages, self.sent_at = self.messages, [], []
+        return messages
+
+
+class StageTimer:
+    # Latencies of one stage and how many messages (and records) it handled
+
+    def __init__(self):
+        self.latencies = []
+        self.seconds = 0.0
+        self.messages = 0
+        self.records = 0
+
+    def result(self):
+        ordered = sorted(self.latencies)
+        return {
+            "messages": self.messages,
+            "records": self.records,
+            "seconds": self.seconds,
+            "messages_per_second": self.messages / self.seconds if self.seconds else None,
+            "records_per_second": self.records / self.seconds if self.seconds else None,
+            "p50_seconds": percentile(ordered, 0.5) if ordered else None,
+            "p99_seconds": percentile(ordered, 0.99) if ordered else None
+        }
+
+
+def build_fleet(vm_count, seed=7):
+    names = [f"vm-{i:06d}" for i in range(vm_count)]
+    workload = SyntheticWorkload(vm_count, 60, seed)
+    return SimulatedFleet(names, "Standard_B1s", workload, time.time() - FLEET_AGE_SECONDS)
+
+
+async def start_agents(fleet, setup_seconds):
+    # The three agents on fakes without latency, set up as simulation.py does, minus the bus
+    stats = SimulationStats()
+    options = build_parser().parse_args(["--vms", str(len(fleet.names)), "--query-latency", "0",
+                                         "--ingestion-delay", "0", "--resize-seconds", "0"])
+    metrics_client = FakeMetricsClient(fleet, stats, options.query_latency, options.ingestion_delay)
+    compute_client = FakeComputeClient(fleet, stats, options.resize_seconds, scale_out_seconds=0)
+    inventory = VMInventory(None)
+    inventory.skus = {size: dict(sku) for size, sku in STATIC_CATALOG.items()}
+    configure_agents(fleet, stats, metrics_client, compute_client, inventory, options)
+    monitoring_agent.MONITORING_INTERVAL_SECONDS = 0  # run() ends with this sleep
+    decider_agent.SEND_NO_ACTION = True
+
+    Container().reset()
+    outbox = Outbox()
+    monitor = monitoring_agent.MonitoringAgent(MONITOR_JID, "benchmark")
+    decider = decider_agent.DeciderAgent(DECIDER_JID, "benchmark")
+    executor = executor_agent.ExecutorAgent(EXECUTOR_JID, "benchmark")
+    executor.vms = {name: {"current_size": size, "last_update_time": time.time(), "cost": 0.0}
+                    for name, size in fleet.sizes.items()}
+    for name, agent in (("monitor", monitor), ("decider", decider), ("executor", executor)):
+        agent.container = outbox
+        started = time.perf_counter()
+        await agent.setup()
+        await agent.behaviours[0].on_start()
+        setup_seconds[name] = time.perf_counter() - started
+    decider.inventory = inventory
+    executor.last_cost_report = time.time()  # Cost updates are timed as their own stage
+    return monitor, decider, executor, outbox
+
+
+async def run_pipeline(fleet, sweeps, memory=None):
+    # Returns (stage results, setup seconds). With memory={} also fills it with tracemalloc
+    # figures: retained and peak bytes per VM, and retained bytes per VM by source file.
+    if memory is not None:
+        tracemalloc.start()
+        baseline = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base_current = tracemalloc.get_traced_memory()[0]
+
+    setup_seconds = {}
+    monitor, decider, executor, outbox = await start_agents(fleet, setup_seconds)
+    monitor_stage, decider_stage, executor_stage = StageTimer(), StageTimer(), StageTimer()
+    monitor_behaviour, decider_behaviour, executor_behaviour = (
+        monitor.behaviours[0], decider.behaviours[0], executor.behaviours[0])
+    resize_stage = StageTimer()  # Resize latency: submission to completion
+    pipeline = executor_behaviour.pipeline
+    on_resized = pipeline.on_done
+
+    async def timed_on_resized(vm_name, direction, new_size, duration, error):
+        resize_stage.latencies.append(duration)
+        await on_resized(vm_name, direction, new_size, duration, error)
+
+    pipeline.on_done = timed_on_resized
+
+    for _ in range(sweeps):
+        # Monitor: a first sweep per VM each time (the cache is emptied), so every sweep
+        # fetches and sends the same amount
+        monitoring_agent.metric_cache = MetricWindowCache(retention_minutes=monitoring_agent.METRIC_RETENTION_MINUTES)
+        started = time.perf_counter()
+        await monitor_behaviour.run()
+        monitor_stage.seconds += time.perf_counter() - started
+        previous = started
+        for sent_at in outbox.sent_at:
+            monitor_stage.latencies.append(sent_at - previous)
+            previous = sent_at
+        metrics_messages = [msg for msg in outbox.take() if msg.get_metadata("ontology") == ONTOLOGY]
+        monitor_stage.messages += len(metrics_messages)
+        monitor_stage.records += len(fleet.names)
+
+        # Decider: one cycle per metrics message (ingest, evaluate, send every decision)
+        for msg in metrics_messages:
+            decider_behaviour.queue.put_nowait(msg)
+            started = time.perf_counter()
+            await decider_behaviour.run()
+            elapsed = time.perf_counter() - started
+            decider_stage.latencies.append(elapsed)
+            decider_stage.seconds += elapsed
+        decisions = outbox.take()
+        decider_stage.messages += len(metrics_messages)
+        decider_stage.records += len(decisions)
+
+        # Executor: one cycle per decision; resizes run in the background meanwhile
+        for index, msg in enumerate(decisions):
+            if index % RESIZE_EVERY == 0:
+                msg.body = f"{msg.body.split(':')[0]}:scale_up"
+            executor_behaviour.queue.put_nowait(msg)
+            started = time.perf_counter()
+            await executor_behaviour.run()
+            elapsed = time.perf_counter() - started
+            executor_stage.latencies.append(elapsed)
+            executor_stage.seconds += elapsed
+        executor_stage.messages += len(decisions)
+        executor_stage.records += len(decisions)
+        resize_stage.messages += len(outbox.take())  # Confirmations of resizes finished meanwhile
+
+    # Resizes still in flight, then the periodic cost accrual over every VM
+    await pipeline.drain()
+    resize_stage.messages += len(outbox.take())
+    resize_stage.records = resize_stage.messages
+
+    cost_stage = StageTimer()
+    for _ in range(sweeps):
+        started = time.perf_counter()
+        executor_behaviour.update_costs()
+        elapsed = time.perf_counter() - started
+        cost_stage.latencies.append(elapsed)
+        cost_stage.seconds += elapsed
+        cost_stage.records += len(executor.vms)
+
+    stages = {
+        "monitor_sweep": monitor_stage.result(),
+        "decider_cycle": decider_stage.result(),
+        "executor_instruction": executor_stage.result(),
+        "executor_resize": resize_stage.result(),  # No rate: resizes overlap the other stages
+        "executor_cost_update": cost_stage.result()
+    }
+
+    if memory is not None:
+        current, peak = tracemalloc.get_traced_memory()
+        by_file = {}
+        for stat in tracemalloc.take_snapshot().compare_to(baseline, "filename"):
+            name = os.path.basename(stat.traceback[0].filename)
+            by_file[name] = by_file.get(name, 0) + stat.size_diff
+        tracemalloc.stop()
+        vm_count = len(fleet.names)
+        memory["retained_bytes_per_vm"] = (current - base_current) / vm_count
+        memory["peak_bytes_per_vm"] = (peak - base_current) / vm_count
+        memory["retained_bytes_per_vm_by_file"] = {
+            name: size / vm_count for name, size in sorted(by_file.items(), key=lambda item: -item[1])
+            if abs(size) / vm_count >= 1
+        }
+
+    await stop_agents(monitor, decider, executor)
+    return stages, setup_seconds
+
+
+async def stop_agents(monitor, decider, executor):
+    for agent in (monitor, decider, executor):
+        for behaviour in agent.behaviours:
+            await behaviour.on_end()
+    pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
+def benchmark_fleet(vm_count, sweeps, measure_memory):
+    # One fleet size: a timed pass and, optionally, a tracemalloc pass on a fresh fleet
+    result = {"vms": vm_count, "sweeps": sweeps}
+    with open(os.devnull, "w") as output, contextlib.redirect_stdout(output):
+        telemetry.REGISTRY.reset()
+        stages, setup_seconds = asyncio.run(run_pipeline(build_fleet(vm_count), sweeps))
+        result["stages"] = stages
+        result["setup_seconds"] = setup_seconds
+        if measure_memory:
+            memory = {}
+            telemetry.REGISTRY.reset()
+            asyncio.run(run_pipeline(build_fleet(vm_count), 1, memory))
+            result["memory"] = memory
+    return result
+
+
+def measure_imports(modules, repeats):
+    # {module: {"import_seconds", "process_seconds"}} (medians), or {"error"} if it fails to import
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for module in modules:
+        imports, processes = [], []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            completed = subprocess.run([sys.executable, "-c", IMPORT_PROBE, module], cwd=here,
+                                       capture_output=True, text=True)
+            processes.append(time.perf_counter() - started)
+            if completed.returncode != 0:
+                error = completed.stderr.strip().splitlines()
+                results[module] = {"error": error[-1] if error else f"exit code {completed.returncode}"}
+                break
+            imports.append(float(completed.stdout.strip().splitlines()[-1]))
+        else:
+            results[module] = {"import_seconds": percentile(sorted(imports), 0.5),
+                               "process_seconds": percentile(sorted(processes), 0.5)}
+    return results
+
+
+def git_commit():
+    try:
+        completed = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return completed.stdout.strip() or None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as history_file:
+        return [json.loads(line) for line in history_file if line.strip()]
+
+
+def previous_fleet(history, vm_count):
+    # The latest earlier result for this fleet size
+    for run in reversed(history):
+        for fleet in run.get("fleets", []):
+            if fleet["vms"] == vm_count:
+                return run, fleet
+    return None, None
+
+
+def milliseconds(seconds):
+    return f"{seconds * 1000:>9.3f}" if seconds is not None else f"{'-':>9}"
+
+
+def rate(value, width):
+    return f"{value:>{width}.0f}" if value is not None else f"{'-':>{width}}"
+
+
+def print_results(results, history=None):
+    startup = results["startup"]
+    if startup:
+        print(f"{'Module':<28} {'import (ms)':>12} {'process (ms)':>13}")
+        for module, timing in startup.items():
+            if "error" in timing:
+                print(f"{module:<28} {timing['error']}")
+            else:
+                print(f"{module:<28} {timing['import_seconds'] * 1000:>12.1f} {timing['process_seconds'] * 1000:>13.1f}")
+    for fleet in results["fleets"]:
+        print()
+        setup = ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in fleet["setup_seconds"].items())
+        print(f"{fleet['vms']} VMs, {fleet['sweeps']} sweeps (setup: {setup})")
+        print(f"  {'stage':<22} {'msgs':>8} {'msgs/s':>10} {'records/s':>11} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+        _, before = previous_fleet(history or [], fleet["vms"])
+        for name, stage in fleet["stages"].items():
+            messages_per_second = stage["messages_per_second"]
+            line = (f"  {name:<22} {stage['messages']:>8} {rate(messages_per_second, 10)} "
+                    f"{rate(stage['records_per_second'], 11)} "
+                    f"{milliseconds(stage['p50_seconds'])} {milliseconds(stage['p99_seconds'])}")
+            old = before["stages"].get(name) if before else None
+            if old and old.get("messages_per_second") and messages_per_second:
+                line += f"  ({messages_per_second / old['messages_per_second'] - 1:+.0%} msgs/s"
+                if old.get("p99_seconds") and stage["p99_seconds"]:
+                    line += f", {stage['p99_seconds'] / old['p99_seconds'] - 1:+.0%} p99"
+                line += ")"
+            print(line)
+        memory = fleet.get("memory")
+        if memory:
+            print(f"  memory per VM: {memory['retained_bytes_per_vm']:.0f} B retained, "
+                  f"{memory['peak_bytes_per_vm']:.0f} B peak")
+            top = list(memory["retained_bytes_per_vm_by_file"].items())[:6]
+            print("    " + ", ".join(f"{name} {size:.0f} B" for name, size in top))
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the agents' hot paths with fake backends")
+    parser.add_argument("--vms", type=int, nargs="+", default=FLEET_SIZES, help="fleet sizes")
+    parser.add_argument("--sweeps", type=int, default=SWEEPS, help="monitor sweeps per fleet size")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--no-startup", action="store_true", help="skip the import timings")
+    parser.add_argument("--output", default="benchmark_agents.jsonl",
+                        help="JSON Lines file each run is appended to ('-' to not save)")
+    parser.add_argument("--compare", action="store_true", help="show changes against the previous run in --output")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+    results = {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "startup": {} if args.no_startup else measure_imports(STARTUP_MODULES, STARTUP_REPEATS),
+        "fleets": [benchmark_fleet(vm_count, args.sweeps, not args.no_memory) for vm_count in args.vms]
+    }
+    history = load_history(args.output) if args.compare and args.output != "-" else None
+    print_results(results, history)
+    if args.output != "-":
+        with open(args.output, "a", encoding="utf-8") as history_file:
+            history_file.write(json.dumps(results) + "\n")
+        print(f"\nResults appended to {args.output}")
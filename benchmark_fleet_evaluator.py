@@ -0,0 +1,52 @@
+import random
+import time
+from decision_engine import DecisionEngine
+from metrics_protocol import MetricsRecord
+
+# Same thresholds as decider_agent.py (not imported, to keep its logging config out of the benchmark)
+THRESHOLDS = {
+    "upper": {"cpu": 80, "memory": 80, "disk_read": 50, "network_in": 500},
+    "lower": {"cpu": 20, "memory": 20, "disk_read": 10, "network_in": 100}
+}
+FLEET_SIZES = [10_000, 100_000]
+REPEATS = 5
+
+
+def build_engine(vm_count, seed=42):
+    rng = random.Random(seed)
+    engine = DecisionEngine(THRESHOLDS)
+    now = time.time()
+    for i in range(vm_count):
+        engine.ingest(MetricsRecord(
+            f"vm-{i:06d}", now, 1,
+            rng.uniform(0, 100), rng.uniform(0, 100), rng.uniform(0, 80), rng.uniform(0, 800)
+        ))
+    return engine
+
+
+def best_of(fn):
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    # scalar: DecisionEngine.evaluate per VM; batch: evaluate_batch over the same states;
+    # fleet: one FleetEvaluator.evaluate pass over every row. The speedup is the batch path's,
+    # which is what the DeciderAgent calls.
+    print(f"{'VMs':>8} {'scalar (ms)':>12} {'batch (ms)':>11} {'fleet (ms)':>11} {'speedup':>8}")
+    for vm_count in FLEET_SIZES:
+        engine = build_engine(vm_count)
+        states = list(engine.states.values())
+
+        scalar_time, scalar = best_of(lambda: [engine.evaluate(state) for state in states])
+        batch_time, batch = best_of(lambda: engine.evaluate_batch(states))
+        fleet_time, _ = best_of(lambda: engine.fleet.evaluate())
+
+        if scalar != batch:
+            raise SystemExit("Scalar and vectorized decisions differ")
+        print(f"{vm_count:>8} {scalar_time * 1000:>12.2f} {batch_time * 1000:>11.2f} {fleet_time * 1000:>11.2f} "
+              f"{scalar_time / batch_time:>7.1f}x")
@@ -0,0 +1,49 @@
+import random
+import time
+from sku_optimizer import STATIC_CATALOG, SkuOptimizer
+
+# Offline: uses the static catalog, no Azure access needed
+FLEET_SIZES = [1_000, 10_000, 100_000]
+REPEATS = 5
+CHECKED_VMS = 2_000  # VMs cross-checked against the single-VM path
+BUDGET_FRACTION = 0.9  # Budget run: 90% of the unconstrained plan's price
+
+
+def build_fleet(optimizer, vm_count, seed=42):
+    rng = random.Random(seed)
+    sizes = [rng.choice(optimizer.sizes) for _ in range(vm_count)]
+    metrics = [[rng.uniform(0, 100), rng.uniform(0, 100), rng.uniform(0, 3000), rng.uniform(0, 20000)]
+               for _ in range(vm_count)]
+    return sizes, metrics
+
+
+def best_of(fn):
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    optimizer = SkuOptimizer(STATIC_CATALOG)
+    print(f"{len(optimizer.sizes)} SKUs in the static catalog")
+    print(f"{'VMs':>8} {'solve (ms)':>11} {'budget (ms)':>12} {'current $/h':>12} {'plan $/h':>10} "
+          f"{'budget $/h':>11} {'deferred':>9}")
+    for vm_count in FLEET_SIZES:
+        sizes, metrics = build_fleet(optimizer, vm_count)
+
+        solve_time, plan = best_of(lambda: optimizer.solve_fleet(sizes, metrics))
+        budget = plan.cost_per_hour * BUDGET_FRACTION
+        budget_time, budget_plan = best_of(lambda: optimizer.solve_fleet(sizes, metrics, budget))
+
+        checked = range(min(vm_count, CHECKED_VMS))
+        if [plan.sizes[i] for i in checked] != [optimizer.choose(sizes[i], metrics[i]) for i in checked]:
+            raise SystemExit("Fleet solve and single-VM choice differ")
+        if budget_plan.within_budget and budget_plan.cost_per_hour > budget + 1e-6:
+            raise SystemExit("Budgeted plan exceeds its budget")
+
+        current = sum(STATIC_CATALOG[size]["price_per_hour"] for size in sizes)
+        print(f"{vm_count:>8} {solve_time * 1000:>11.2f} {budget_time * 1000:>12.2f} {current:>12.2f} "
+              f"{plan.cost_per_hour:>10.2f} {budget_plan.cost_per_hour:>11.2f} {len(budget_plan.deferred):>9}")
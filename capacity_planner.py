@@ -0,0 +1,96 @@
+import math
+
+# Horizontal scaling of VM Scale Sets (Flexible ones hold ordinary VMs, so a pool of VMs is
+# a Flexible scale set). Changing a scale set's capacity starts or removes instances
+# without touching the running ones, while a vertical resize reboots them.
+#
+# CapacityPlanner turns a sustained scale_up/scale_down decision for a scale set into the
+# same vertical decision or into scale_out/scale_in with a target instance count:
+#  - scale out when load grows faster than fast_growth_per_minute (a resize would reboot
+#    the instances while demand climbs) or when the instance size is at the top of the
+#    vertical ladder; otherwise scale up, keeping fewer, larger instances
+#  - scale in while above the minimum instance count, then scale down
+# A scale set whose upgrade policy leaves running instances at their size (Manual) only
+# scales out and in: a vertical resize would not reach them.
+# Load is max(CPU %, memory %) per instance; its growth rate is a smoothed slope in
+# percentage points per minute.
+
+HORIZONTAL = ("scale_out", "scale_in")
+
+
+def load_of(cpu, memory):
+    # NaN when neither metric is known
+    values = [value for value in (cpu, memory) if not math.isnan(value)]
+    return max(values) if values else math.nan
+
+
+class GrowthState:
+    __slots__ = ["load", "timestamp", "rate"]
+
+    def __init__(self, load, timestamp):
+        self.load = load
+        self.timestamp = timestamp
+        self.rate = 0.0
+
+
+class CapacityPlanner:
+    # ladder: vertical sizes from smallest to largest (the ExecutorAgent's VM_SIZES)
+    # target_utilization: load per instance (%) a scale-out or scale-in aims for
+    # fast_growth_per_minute: growth (percentage points per minute) that calls for scaling out
+    # smoothing: weight of the newest slope in the growth rate
+
+    def __init__(self, ladder, target_utilization=60, fast_growth_per_minute=2.0, smoothing=0.5):
+        self.ladder = list(ladder)
+        self.target_utilization = target_utilization
+        self.fast_growth_per_minute = fast_growth_per_minute
+        self.smoothing = smoothing
+        self.states = {}
+
+    def observe(self, vm_id, load, timestamp):
+        # Feed one sample of a scale set; returns its growth rate
+        if math.isnan(load):
+            return self.growth(vm_id)
+        state = self.states.get(vm_id)
+        if state is None:
+            self.states[vm_id] = GrowthState(load, timestamp)
+            return 0.0
+        if timestamp <= state.timestamp:
+            return state.rate
+        slope = (load - state.load) / ((timestamp - state.timestamp) / 60)
+        state.rate = self.smoothing * slope + (1 - self.smoothing) * state.rate
+        state.load = load
+        state.timestamp = timestamp
+        return state.rate
+
+    def growth(self, vm_id):
+        state = self.states.get(vm_id)
+        return state.rate if state is not None else 0.0
+
+    def plan(self, vm_id, decision, size, capacity, min_instances, max_instances, load, lead_seconds,
+             vertical=True):
+        # Returns (decision, target instance count), the count being None for vertical decisions.
+        # lead_seconds: how long new instances take to serve, the look-ahead for the target
+        # vertical: False when a resize would not reach the running instances; the decision is
+        # then horizontal, or no_action at the instance count bounds
+        if decision == "scale_up":
+            at_top = not vertical or size not in self.ladder or size == self.ladder[-1]
+            if capacity < max_instances and (at_top or self.growth(vm_id) >= self.fast_growth_per_minute):
+                projected = load + max(0.0, self.growth(vm_id)) * lead_seconds / 60
+                return "scale_out", min(max_instances, max(capacity + 1, self.needed(capacity, projected)))
+            return ("scale_up" if vertical else "no_action"), None
+        if decision == "scale_down":
+            if capacity > min_instances:
+                # At most half the instances go at once, in case the load comes back
+                floor = max(min_instances, capacity - max(1, capacity // 2))
+                return "scale_in", max(floor, min(capacity - 1, self.needed(capacity, load)))
+            return ("scale_down" if vertical else "no_action"), None
+        return decision, None
+
+    def needed(self, capacity, load):
+        # Instances that would carry the current instances' load at target_utilization
+        if math.isnan(load):
+            return capacity
+        return max(1, math.ceil(capacity * load / self.target_utilization))
+
+    def forget(self, vm_id):
+        self.states.pop(vm_id, None)
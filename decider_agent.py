@@ -4,6 +4,17 @@ from spade.agent import Agent
 from spade.behaviour import CyclicBehaviour
 import logging
 import asyncio
+import sys
+from metrics_protocol import RESIZE_ONTOLOGY, ProtocolError, decode_records
+from decision_engine import DecisionEngine
+from capacity_planner import HORIZONTAL, CapacityPlanner, load_of
+from scaling_policy import ScalingPolicy
+from forecaster import LeadTimeEstimator, TrendForecaster
+from vm_inventory import VMInventory
+from sku_optimizer import STATIC_CATALOG, SkuOptimizer, catalog_from_inventory
+from sharding import DECIDER, MONITOR, HeartbeatBehaviour, ShardGroup, heartbeat_template
+import telemetry
+import time
 
 # Configure logging
 logging.basicConfig(
@@ -24,94 +35,459 @@ NETWORK_IN_THRESHOLD_LOWER = 100  # Scale down if network in < 100 MB
 RESOURCE_GROUP = "SMA-Cloud-Project"
 LOCATION = "West Europe"
 
-# List of VMs (consistent with MonitoringAgent)
-VMS = [
-    {"id": "vm-initiale"},
-    {"id": "vm-secondary"}
-]
+THRESHOLDS = {
+    "upper": {
+        "cpu": CPU_THRESHOLD_UPPER,
+        "memory": MEMORY_THRESHOLD_UPPER,
+        "disk_read": DISK_READ_THRESHOLD_UPPER,
+        "network_in": NETWORK_IN_THRESHOLD_UPPER
+    },
+    "lower": {
+        "cpu": CPU_THRESHOLD_LOWER,
+        "memory": MEMORY_THRESHOLD_LOWER,
+        "disk_read": DISK_READ_THRESHOLD_LOWER,
+        "network_in": NETWORK_IN_THRESHOLD_LOWER
+    }
+}
+
+# Optional threshold tiers ({tier name: thresholds shaped like THRESHOLDS}) and the tier of
+# each VM ({vm id: tier name}); VMs without a tier use THRESHOLDS
+TIER_THRESHOLDS = {}
+VM_THRESHOLD_TIERS = {}
+# Optional tier per VM size ({vm size: tier name}), applied from the shared VM inventory
+# to VMs without an entry in VM_THRESHOLD_TIERS and re-applied when a VM changes size
+SIZE_THRESHOLD_TIERS = {}
+INVENTORY_PATH = "vm_inventory.json"  # Written by the MonitoringAgent/ExecutorAgent, only read here
+
+# Anti-flapping policy: act only on sustained breaches, then leave the VM alone for a while
+SCALE_UP_WINDOW = (3, 5)  # Scale up if at least 3 of the last 5 samples are above the upper thresholds
+SCALE_DOWN_WINDOW = (8, 10)  # Scale down if at least 8 of the last 10 samples are below the lower thresholds
+SCALE_UP_COOLDOWN_SECONDS = 300  # No further resize of a VM for 5 minutes after scaling it up
+SCALE_DOWN_COOLDOWN_SECONDS = 900  # ... and for 15 minutes after scaling it down
+
+# Predictive scaling (opt-in): scale up ahead of a breach forecast within the resize lead time
+PREDICTIVE_SCALING = False
+FORECAST_SEASON_LENGTH = 0  # Samples per seasonal cycle (e.g. 1440 for daily cycles of 1-minute samples), 0 = trend only
+FORECAST_INTERVAL_SECONDS = 60  # Expected spacing of metrics samples
+FORECAST_MARGIN_SECONDS = 360  # Extra look-ahead on top of the measured resize lead time, covering the forecast's lag on a new trend
+FORECAST_CONFIDENCE = 0.5  # Forecast errors (standard deviations) a predicted breach must clear, so noise is not extrapolated
+RESIZE_LEAD_TIME_SECONDS = 300  # Initial resize duration estimate, refined from executor confirmations
+
+# Cost-aware sizing (opt-in): send the cheapest SKU that fits the VM's demand with each scale
+# decision, so the executor resizes in one step instead of walking its VM_SIZES ladder
+COST_AWARE_SIZING = False
+FLEET_BUDGET_PER_HOUR = None  # Optional cap ($/hour) on the price of the whole fleet's sizes
+
+# Horizontal scaling of VM Scale Sets (see capacity_planner.py): a scale set's decisions can
+# become scale_out/scale_in with a target instance count ("vm_name:scale_out:count"), which
+# the executor applies as a capacity change instead of a resize. VMs are not affected.
+HORIZONTAL_SCALING = True
+VERTICAL_SIZES = ["Standard_B1s", "Standard_B2s", "Standard_B4ms"]  # The ExecutorAgent's VM_SIZES ladder
+MIN_INSTANCES = 1  # Default instance count bounds of a scale set
+MAX_INSTANCES = 10
+SCALE_SET_INSTANCES = {}  # Optional bounds per scale set ({name: (min, max)})
+TARGET_INSTANCE_UTILIZATION = 60  # Scale-outs and scale-ins aim for this CPU/memory % per instance
+FAST_GROWTH_PER_MINUTE = 2.0  # Load growing faster than this (percentage points per minute) is scaled out
+SCALE_OUT_COOLDOWN_SECONDS = 120  # No further scaling of a scale set for 2 minutes after scaling it out
+SCALE_IN_COOLDOWN_SECONDS = 600  # ... and for 10 minutes after scaling it in
+SCALE_OUT_LEAD_TIME_SECONDS = 90  # Initial estimate of how long new instances take, refined from confirmations
+
+SEND_NO_ACTION = False  # Also send no_action decisions (one message per VM per cycle); the executor ignores them
+PER_VM_CONSOLE_OUTPUT = True  # Print lines per VM per cycle (turn off for large fleets; the log is unaffected)
+METRICS_PORT = 9102  # Serve counters and histograms on http://127.0.0.1:9102/metrics (None to disable)
+
+# Sharding (opt-in): several DeciderAgents split the fleet by consistent hashing; the
+# MonitoringAgents route each VM's metrics to its owner (see sharding.py)
+SHARDING = False
+MONITOR_JIDS = ["monitorilyas@jabber.fr"]  # Known monitor instances (others may join by heartbeat)
+DECIDER_JIDS = ["deciderilyas@jabber.fr"]  # Known decider instances
+HEARTBEAT_INTERVAL_SECONDS = 15  # How often each instance announces itself
+HEARTBEAT_TIMEOUT_SECONDS = 45  # An instance silent for this long leaves the ring
+
+# Telemetry
+TRANSIT_SECONDS = telemetry.histogram("decider_metrics_transit_seconds", "Metrics message delay from MonitoringAgent send to receipt")
+SAMPLE_TO_DECISION_SECONDS = telemetry.histogram("decider_sample_to_decision_seconds", "Age of a VM's latest sample when it is decided on")
+CYCLE_SECONDS = telemetry.histogram("decider_cycle_seconds", "Time to ingest a drained batch of messages and send its decisions")
+RECORDS_INGESTED = telemetry.counter("decider_records_total", "Metrics records received")
+RECORDS_MISSED = telemetry.counter("decider_records_missed_total", "Metrics records skipped in a VM's sequence")
+RECORDS_STALE = telemetry.counter("decider_records_stale_total", "Duplicate or out-of-order metrics records dropped")
+RECORDS_NOT_OWNED = telemetry.counter("decider_records_not_owned_total", "Metrics records dropped for VMs another decider owns")
+INVALID_MESSAGES = telemetry.counter("decider_invalid_messages_total", "Metrics messages or resize confirmations that could not be decoded")
+RECEIVE_TIMEOUTS = telemetry.counter("decider_receive_timeouts_total", "Cycles without any message")
+DECISIONS_SENT = telemetry.counter("decider_decisions_sent_total", "Decisions sent to the ExecutorAgent")
+
+def console(message):
+    # Per-VM console output, skipped when PER_VM_CONSOLE_OUTPUT is off
+    if PER_VM_CONSOLE_OUTPUT:
+        print(message)
+
+def policy_decision(policy, forecaster, engine, state, raw_decision, now, horizon):
+    # Turn a VM's per-sample decision into the decision to act on: the anti-flapping policy,
+    # then (when predictive) a scale-up ahead of a breach forecast within horizon seconds.
+    # The forecast only acts on samples without a breach of their own: a breaching sample
+    # held back by the breach window must stay held back until the breach is sustained.
+    # Returns (decision, metrics predicted to breach). The caller records the resize for any
+    # decision other than no_action. Shared with replay_logs.py.
+    decision = policy.apply(state.vm_id, raw_decision, now)
+    if forecaster is None:
+        return decision, []
+    forecaster.update(state.vm_id, [state.cpu, state.memory, state.disk_read, state.network_in],
+                      state.timestamp)
+    if raw_decision != "no_action" or decision != "no_action" or policy.in_cooldown(state.vm_id, now):
+        return decision, []
+    predicted = forecaster.predicts_breach(state.vm_id, engine.thresholds_for(state.vm_id)["upper"], horizon)
+    return ("scale_up" if predicted else decision), predicted
+
+def seconds_since(timestamp, now):
+    # Age of an epoch timestamp from message metadata or a record, None when absent or invalid
+    try:
+        return max(0.0, now - float(timestamp))
+    except (TypeError, ValueError):
+        return None
 
 class DeciderAgent(Agent):
     class DecideBehaviour(CyclicBehaviour):
         async def run(self):
-            for vm in VMS:
-                vm_name = vm["id"]
-                print(f"DeciderAgent: Running for {vm_name} in {RESOURCE_GROUP} ({LOCATION})...")
-                logging.info(f"DeciderAgent: Running for {vm_name} in {RESOURCE_GROUP} ({LOCATION})")
-                
-                print(f"DeciderAgent: Waiting for metrics from {vm_name}...")
-                logging.info(f"DeciderAgent: Waiting for metrics from {vm_name}")
-                
-                msg = await self.receive(timeout=60)  # Matches the 60-second cycle
-                if msg:
+            print(f"DeciderAgent: Waiting for metrics in {RESOURCE_GROUP} ({LOCATION})...")
+            logging.info(f"DeciderAgent: Waiting for metrics in {RESOURCE_GROUP} ({LOCATION})")
+
+            if self.agent.inventory.load():
+                self.apply_size_tiers()
+                self.agent.optimizer = self.agent.build_optimizer()
+
+            msg = await self.receive(timeout=60)  # Matches the 60-second cycle
+            if not msg:
+                RECEIVE_TIMEOUTS.inc()
+                print("DeciderAgent: No metrics received within timeout.")
+                logging.info("DeciderAgent: No metrics received within timeout")
+                return
+
+            cycle_started = time.time()
+
+            # Drain everything already queued instead of waiting a full cycle per message
+            records = 0
+            ready = {}  # VMs with new metrics (latest state per VM)
+            traces = {}  # Trace id of the message that carried each VM's latest record
+            engine = self.agent.engine
+            while msg:
+                if msg.get_metadata("ontology") == RESIZE_ONTOLOGY:
+                    self.handle_resize(msg)
+                    msg = await self.receive()
+                    continue
+
+                trace_id = msg.get_metadata(telemetry.TRACE_ID)
+                transit = seconds_since(msg.get_metadata(telemetry.SENT_AT), time.time())
+                if transit is not None:
+                    TRANSIT_SECONDS.observe(transit)
+                try:
+                    batch = decode_records(msg.body)
+                except ProtocolError as e:
+                    INVALID_MESSAGES.inc()
+                    print(f"DeciderAgent: Invalid message format received: {str(e)}")
+                    logging.warning(f"DeciderAgent: Invalid message format received: {str(e)}")
+                    batch = []
+
+                # Every record names its VM and is routed to that VM's state. Records for VMs
+                # this decider no longer owns (sent before a monitor saw the ring change) are
+                # left to their owner.
+                for record in batch:
+                    records += 1
+                    if not self.agent.owns(record.vm_id):
+                        RECORDS_NOT_OWNED.inc()
+                        continue
                     try:
-                        body = msg.body
-                        if "cpu:" in body and "memory:" in body and "disk_read:" in body and "network_in:" in body:
-                            metrics = body.split(",")
-                            cpu_usage = float(metrics[0].split(":")[1])
-                            memory_usage = float(metrics[1].split(":")[1])
-                            disk_read = float(metrics[2].split(":")[1])
-                            network_in = float(metrics[3].split(":")[1])
-                            
-                            print(f"DeciderAgent: Received data for {vm_name}: CPU Usage = {cpu_usage:.2f}%, "
-                                  f"Memory Usage = {memory_usage:.2f}%, Disk Read = {disk_read:.2f} MB, "
-                                  f"Network In = {network_in:.2f} MB")
-                            logging.info(f"DeciderAgent: Received data for {vm_name}: CPU Usage = {cpu_usage:.2f}%, "
-                                         f"Memory Usage = {memory_usage:.2f}%, Disk Read = {disk_read:.2f} MB, "
-                                         f"Network In = {network_in:.2f} MB")
-                            
-                            # Decision logic for scaling up or down
-                            if (cpu_usage > CPU_THRESHOLD_UPPER or 
-                                memory_usage > MEMORY_THRESHOLD_UPPER or 
-                                disk_read > DISK_READ_THRESHOLD_UPPER or 
-                                network_in > NETWORK_IN_THRESHOLD_UPPER):
-                                decision = "scale_up"
-                                print(f"DeciderAgent: {vm_name} - Scaling up required! "
-                                      f"CPU > {CPU_THRESHOLD_UPPER}% or Memory > {MEMORY_THRESHOLD_UPPER}% or "
-                                      f"Disk Read > {DISK_READ_THRESHOLD_UPPER} MB or Network In > {NETWORK_IN_THRESHOLD_UPPER} MB")
-                                logging.info(f"DeciderAgent: {vm_name} - Scaling up required! "
-                                             f"CPU > {CPU_THRESHOLD_UPPER}% or Memory > {MEMORY_THRESHOLD_UPPER}% or "
-                                             f"Disk Read > {DISK_READ_THRESHOLD_UPPER} MB or Network In > {NETWORK_IN_THRESHOLD_UPPER} MB")
-                            elif (cpu_usage < CPU_THRESHOLD_LOWER and 
-                                  memory_usage < MEMORY_THRESHOLD_LOWER and 
-                                  disk_read < DISK_READ_THRESHOLD_LOWER and 
-                                  network_in < NETWORK_IN_THRESHOLD_LOWER):
-                                decision = "scale_down"
-                                print(f"DeciderAgent: {vm_name} - Scaling down required! "
-                                      f"CPU < {CPU_THRESHOLD_LOWER}% and Memory < {MEMORY_THRESHOLD_LOWER}% and "
-                                      f"Disk Read < {DISK_READ_THRESHOLD_LOWER} MB and Network In < {NETWORK_IN_THRESHOLD_LOWER} MB")
-                                logging.info(f"DeciderAgent: {vm_name} - Scaling down required! "
-                                             f"CPU < {CPU_THRESHOLD_LOWER}% and Memory < {MEMORY_THRESHOLD_LOWER}% and "
-                                             f"Disk Read < {DISK_READ_THRESHOLD_LOWER} MB and Network In < {NETWORK_IN_THRESHOLD_LOWER} MB")
-                            else:
-                                decision = "no_action"
-                                print(f"DeciderAgent: {vm_name} - Metrics within normal range, no action necessary.")
-                                logging.info(f"DeciderAgent: {vm_name} - Metrics within normal range, no action necessary")
-                            
-                            # Send decision to ExecutorAgent via XMPP
-                            action_msg = spade.message.Message(
-                                to="executorilyas@jabber.fr",
-                                body=f"{vm_name}:{decision}"
-                            )
-                            await self.send(action_msg)
-                            print(f"DeciderAgent: Sent decision ({decision}) for {vm_name} to ExecutorAgent.")
-                            logging.info(f"DeciderAgent: Sent decision ({decision}) for {vm_name} to ExecutorAgent")
-                        else:
-                            print(f"DeciderAgent: Invalid message format received: {body}")
-                            logging.warning(f"DeciderAgent: Invalid message format received: {body}")
+                        previous = engine.state_for(record.vm_id)
+                        missed, stale = previous.missed, previous.stale
+                        state = engine.ingest(record, str(msg.sender))
+                        RECORDS_MISSED.inc(previous.missed - missed)
+                        RECORDS_STALE.inc(previous.stale - stale)
+                        if state is not None:
+                            ready[state.vm_id] = state
+                            traces[state.vm_id] = trace_id
                     except Exception as e:
-                        print(f"DeciderAgent: Error processing message: {str(e)}")
-                        logging.error(f"DeciderAgent: Error processing message: {str(e)}")
+                        console(f"DeciderAgent: Error processing metrics for {record.vm_id}: {str(e)}")
+                        logging.error(f"DeciderAgent: Error processing metrics for {record.vm_id}: {str(e)}")
+
+                msg = await self.receive()  # Non-blocking: None once the queue is empty
+            RECORDS_INGESTED.inc(records)
+
+            # Evaluate every VM that has new data in one vectorized pass, then filter the
+            # per-sample decisions through the anti-flapping policy
+            states = list(ready.values())
+            now = time.time()
+            decided = []
+            horizon = self.agent.lead_time.seconds + FORECAST_MARGIN_SECONDS
+            for state, raw_decision in zip(states, self.agent.engine.evaluate_batch(states)):
+                decision, predicted = policy_decision(self.agent.policy, self.agent.forecaster, self.agent.engine,
+                                                      state, raw_decision, now, horizon)
+                decision, instances = self.plan_capacity(state, decision)
+                if decision != "no_action":
+                    # Cooldown starts now and restarts when the executor confirms the resize
+                    self.agent.policy.record_resize(state.vm_id, decision, now)
+                decided.append((state, raw_decision, decision, predicted, instances))
+
+            targets = {}
+            if any(decision in ("scale_up", "scale_down") for _, _, decision, _, _ in decided):
+                targets = self.target_sizes()
+            for state, raw_decision, decision, predicted, instances in decided:
+                try:
+                    await self.decide(state, raw_decision, decision, predicted, targets.get(state.vm_id),
+                                      traces.get(state.vm_id), instances)
+                except Exception as e:
+                    console(f"DeciderAgent: Error sending decision for {state.vm_id}: {str(e)}")
+                    logging.error(f"DeciderAgent: Error sending decision for {state.vm_id}: {str(e)}")
+            decisions = len(states)
+            CYCLE_SECONDS.observe(time.time() - cycle_started)
+
+            print(f"DeciderAgent: Processed {records} records, {decisions} decisions "
+                  f"({len(self.agent.engine.states)} VMs tracked).")
+            logging.info(f"DeciderAgent: Processed {records} records, {decisions} decisions "
+                         f"({len(self.agent.engine.states)} VMs tracked)")
+
+        def plan_capacity(self, state, decision):
+            # Scale sets may scale horizontally instead: returns (decision, target instance
+            # count), the count being None for VMs and vertical decisions
+            planner = self.agent.planner
+            inventory = self.agent.inventory
+            capacity = inventory.capacity_of(state.vm_id)
+            if planner is None or capacity is None:
+                return decision, None
+            load = load_of(state.cpu, state.memory)
+            planner.observe(state.vm_id, load, state.timestamp)
+            if decision == "no_action":
+                return decision, None
+            low, high = SCALE_SET_INSTANCES.get(state.vm_id, (MIN_INSTANCES, MAX_INSTANCES))
+            return planner.plan(state.vm_id, decision, inventory.size_of(state.vm_id), capacity, low, high,
+                                load, self.agent.scale_out_lead.seconds, inventory.resizes_in_place(state.vm_id))
+
+        def apply_size_tiers(self):
+            # Give each VM the threshold tier of its current size (SIZE_THRESHOLD_TIERS)
+            if not SIZE_THRESHOLD_TIERS:
+                return
+            fleet = self.agent.engine.fleet
+            for vm_name, entry in self.agent.inventory.vms.items():
+                if vm_name in self.agent.pinned_tiers:
+                    continue
+                tier = SIZE_THRESHOLD_TIERS.get(entry["size"])
+                if tier == self.agent.size_tiers.get(vm_name):
+                    continue
+                if tier is None:
+                    fleet.set_vm_thresholds(vm_name, THRESHOLDS)
+                    self.agent.size_tiers.pop(vm_name, None)
                 else:
-                    print(f"DeciderAgent: No metrics received for {vm_name} within timeout.")
-                    logging.info(f"DeciderAgent: No metrics received for {vm_name} within timeout")
+                    fleet.assign_tier(vm_name, tier)
+                    self.agent.size_tiers[vm_name] = tier
+                logging.info(f"DeciderAgent: {vm_name} ({entry['size']}) uses {tier or 'default'} thresholds")
+
+        def target_sizes(self):
+            # Cheapest fitting size of every tracked VM whose size is known, from one solve over
+            # the fleet's metrics array (under FLEET_BUDGET_PER_HOUR if set)
+            optimizer = self.agent.optimizer
+            if optimizer is None:
+                return {}
+            fleet = self.agent.engine.fleet
+            sizes = [self.agent.inventory.size_of(vm_name) for vm_name in fleet.vm_ids]
+            plan = optimizer.solve_fleet(sizes, fleet.metrics[:len(fleet)], FLEET_BUDGET_PER_HOUR)
+            if plan.deferred:
+                logging.info(f"DeciderAgent: {len(plan.deferred)} upsizes deferred to stay within "
+                             f"${FLEET_BUDGET_PER_HOUR}/hour (plan: ${plan.cost_per_hour:.2f}/hour)")
+            if not plan.within_budget:
+                logging.warning(f"DeciderAgent: Fleet costs ${plan.cost_per_hour:.2f}/hour even without upsizes, "
+                                f"over the ${FLEET_BUDGET_PER_HOUR}/hour budget")
+            return {vm_name: target for vm_name, current, target in zip(fleet.vm_ids, sizes, plan.sizes)
+                    if current is not None and target != current}
+
+        def sized_for(self, vm_name, decision, target_size):
+            # The target only goes with a resize decision when it moves the price the same way
+            if target_size is None or decision not in ("scale_up", "scale_down"):
+                return None
+            catalog = self.agent.optimizer.catalog
+            current = catalog.get(self.agent.inventory.size_of(vm_name))
+            if current is None:
+                return None
+            cheaper = catalog[target_size]["price_per_hour"] < current["price_per_hour"]
+            return target_size if cheaper == (decision == "scale_down") else None
+
+        def handle_resize(self, msg):
+            # "vm_name:direction:new_size:duration_seconds"
+            try:
+                vm_name, direction, new_size, duration = msg.body.split(":")
+                duration = float(duration)
+            except ValueError:
+                INVALID_MESSAGES.inc()
+                print(f"DeciderAgent: Invalid resize confirmation received: {msg.body}")
+                logging.warning(f"DeciderAgent: Invalid resize confirmation received: {msg.body}")
+                return
+            self.agent.policy.record_resize(vm_name, direction, time.time())
+            if direction in HORIZONTAL:
+                # new_size is the instance count; only scale-outs say how fast capacity arrives
+                self.agent.inventory.set_capacity(vm_name, int(new_size))
+                if direction == "scale_out":
+                    self.agent.scale_out_lead.observe(duration)
+                console(f"DeciderAgent: {vm_name} scaled to {new_size} instances ({direction}) in {duration:.0f}s, cooldown restarted.")
+                logging.info(f"DeciderAgent: {vm_name} scaled to {new_size} instances ({direction}) in {duration:.0f}s, "
+                             f"cooldown restarted, estimated scale-out lead time {self.agent.scale_out_lead.seconds:.0f}s "
+                             f"[trace {msg.get_metadata(telemetry.TRACE_ID)}]")
+                return
+            self.agent.inventory.set_size(vm_name, new_size)  # Until the executor's snapshot is loaded
+            lead_time = self.agent.lead_time.observe(duration)
+            console(f"DeciderAgent: {vm_name} resized to {new_size} ({direction}) in {duration:.0f}s, cooldown restarted.")
+            logging.info(f"DeciderAgent: {vm_name} resized to {new_size} ({direction}) in {duration:.0f}s, "
+                         f"cooldown restarted, estimated resize lead time {lead_time:.0f}s "
+                         f"[trace {msg.get_metadata(telemetry.TRACE_ID)}]")
+
+        async def decide(self, state, raw_decision, decision, predicted=None, target_size=None, trace_id=None,
+                         instances=None):
+            vm_name = state.vm_id
+            # One trace per VM decision, derived from the metrics message's trace
+            trace_id = f"{trace_id}/{vm_name}" if trace_id else vm_name
+            target_size = self.sized_for(vm_name, decision, target_size)
+            console(f"DeciderAgent: Received data for {vm_name} (#{state.sequence}): CPU Usage = {state.cpu:.2f}%, "
+                  f"Memory Usage = {state.memory:.2f}%, Disk Read = {state.disk_read:.2f} MB, "
+                  f"Network In = {state.network_in:.2f} MB")
+            logging.info(f"DeciderAgent: Received data for {vm_name} (#{state.sequence}): CPU Usage = {state.cpu:.2f}%, "
+                         f"Memory Usage = {state.memory:.2f}%, Disk Read = {state.disk_read:.2f} MB, "
+                         f"Network In = {state.network_in:.2f} MB")
+            if state.missed:
+                logging.warning(f"DeciderAgent: {vm_name} - {state.missed} metrics messages missed so far")
+
+            # Report which thresholds (global, tier or per-VM) triggered the decision
+            thresholds = self.agent.engine.thresholds_for(vm_name)
+            upper = thresholds["upper"]
+            lower = thresholds["lower"]
+            if predicted:
+                console(f"DeciderAgent: {vm_name} - Scaling up ahead of predicted breach of {', '.join(predicted)} "
+                      f"within {self.agent.lead_time.seconds + FORECAST_MARGIN_SECONDS:.0f}s.")
+                logging.info(f"DeciderAgent: {vm_name} - Scaling up ahead of predicted breach of {', '.join(predicted)} "
+                             f"within {self.agent.lead_time.seconds + FORECAST_MARGIN_SECONDS:.0f}s")
+            elif decision in HORIZONTAL:
+                capacity = self.agent.inventory.capacity_of(vm_name)
+                growth = self.agent.planner.growth(vm_name)
+                console(f"DeciderAgent: {vm_name} - {'Scaling out' if decision == 'scale_out' else 'Scaling in'} "
+                      f"from {capacity} to {instances} instances (load changing {growth:+.1f} points/min).")
+                logging.info(f"DeciderAgent: {vm_name} - {'Scaling out' if decision == 'scale_out' else 'Scaling in'} "
+                             f"from {capacity} to {instances} instances (load changing {growth:+.1f} points/min)")
+            elif decision == "scale_up":
+                console(f"DeciderAgent: {vm_name} - Scaling up required! "
+                      f"CPU > {upper['cpu']}% or Memory > {upper['memory']}% or "
+                      f"Disk Read > {upper['disk_read']} MB or Network In > {upper['network_in']} MB")
+                logging.info(f"DeciderAgent: {vm_name} - Scaling up required! "
+                             f"CPU > {upper['cpu']}% or Memory > {upper['memory']}% or "
+                             f"Disk Read > {upper['disk_read']} MB or Network In > {upper['network_in']} MB")
+            elif decision == "scale_down":
+                console(f"DeciderAgent: {vm_name} - Scaling down required! "
+                      f"CPU < {lower['cpu']}% and Memory < {lower['memory']}% and "
+                      f"Disk Read < {lower['disk_read']} MB and Network In < {lower['network_in']} MB")
+                logging.info(f"DeciderAgent: {vm_name} - Scaling down required! "
+                             f"CPU < {lower['cpu']}% and Memory < {lower['memory']}% and "
+                             f"Disk Read < {lower['disk_read']} MB and Network In < {lower['network_in']} MB")
+            elif raw_decision != "no_action":
+                console(f"DeciderAgent: {vm_name} - {raw_decision} signal held back (not sustained or in cooldown).")
+                logging.info(f"DeciderAgent: {vm_name} - {raw_decision} signal held back (not sustained or in cooldown)")
+            else:
+                console(f"DeciderAgent: {vm_name} - Metrics within normal range, no action necessary.")
+                logging.info(f"DeciderAgent: {vm_name} - Metrics within normal range, no action necessary")
+
+            now = time.time()
+            sample_age = seconds_since(state.timestamp, now)
+            if sample_age is not None:
+                SAMPLE_TO_DECISION_SECONDS.observe(sample_age)
+            if decision == "no_action" and not SEND_NO_ACTION:
+                return  # Nothing for the executor to do
+
+            # Send decision to ExecutorAgent via XMPP ("vm_name:decision[:target_size]", or
+            # "vm_name:scale_out|scale_in:instances")
+            body = f"{vm_name}:{decision}"
+            if instances is not None:
+                body += f":{instances}"
+            elif target_size is not None:
+                body += f":{target_size}"
+                logging.info(f"DeciderAgent: {vm_name} - Cheapest size that fits: {target_size}")
+            action_msg = spade.message.Message(
+                to="executorilyas@jabber.fr",
+                body=body
+            )
+            action_msg.set_metadata(telemetry.TRACE_ID, trace_id)
+            action_msg.set_metadata(telemetry.SENT_AT, f"{now:.3f}")
+            if state.timestamp is not None:
+                action_msg.set_metadata(telemetry.SAMPLE_TIME, f"{state.timestamp:.3f}")
+            await self.send(action_msg)
+            DECISIONS_SENT.inc()
+            console(f"DeciderAgent: Sent decision ({decision}) for {vm_name} to ExecutorAgent.")
+            logging.info(f"DeciderAgent: Sent decision ({decision}) for {vm_name} to ExecutorAgent [trace {trace_id}]")
+
+        async def on_end(self):
+            if self.agent.metrics_server is not None:
+                await self.agent.metrics_server.cleanup()
 
     async def setup(self):
-        self.add_behaviour(self.DecideBehaviour())
+        # Per-VM state, created as VMs show up in the metrics stream
+        self.engine = DecisionEngine(THRESHOLDS, TIER_THRESHOLDS, VM_THRESHOLD_TIERS)
+        self.policy = ScalingPolicy(SCALE_UP_WINDOW, SCALE_DOWN_WINDOW,
+                                    SCALE_UP_COOLDOWN_SECONDS, SCALE_DOWN_COOLDOWN_SECONDS,
+                                    SCALE_OUT_COOLDOWN_SECONDS, SCALE_IN_COOLDOWN_SECONDS)
+        self.lead_time = LeadTimeEstimator(RESIZE_LEAD_TIME_SECONDS)
+        self.scale_out_lead = LeadTimeEstimator(SCALE_OUT_LEAD_TIME_SECONDS)
+        self.planner = None
+        if HORIZONTAL_SCALING:
+            self.planner = CapacityPlanner(VERTICAL_SIZES, TARGET_INSTANCE_UTILIZATION, FAST_GROWTH_PER_MINUTE)
+        self.inventory = VMInventory(INVENTORY_PATH)
+        self.pinned_tiers = set(VM_THRESHOLD_TIERS)  # Explicit per-VM tiers win over size tiers
+        self.size_tiers = {}
+        self.optimizer = self.build_optimizer()
+        self.forecaster = None
+        if PREDICTIVE_SCALING:
+            self.forecaster = TrendForecaster(season_length=FORECAST_SEASON_LENGTH,
+                                              interval_seconds=FORECAST_INTERVAL_SECONDS,
+                                              confidence=FORECAST_CONFIDENCE)
+        self.metrics_server = None
+        if METRICS_PORT:
+            try:
+                self.metrics_server = await telemetry.start_metrics_server(METRICS_PORT)
+            except OSError as e:
+                logging.error(f"DeciderAgent: Could not serve metrics on port {METRICS_PORT}: {str(e)}")
+        self.shards = None  # The deciders' ring (None when not sharding)
+        if SHARDING:
+            self.shards = ShardGroup(DECIDER, DECIDER_JIDS, str(self.jid), HEARTBEAT_TIMEOUT_SECONDS)
+            # Monitors are tracked only so heartbeats reach them (they route metrics by VM)
+            monitors = ShardGroup(MONITOR, MONITOR_JIDS, timeout_seconds=HEARTBEAT_TIMEOUT_SECONDS)
+            self.add_behaviour(HeartbeatBehaviour(DECIDER, {DECIDER: self.shards, MONITOR: monitors},
+                                                  HEARTBEAT_INTERVAL_SECONDS, self.on_shards_changed),
+                               heartbeat_template())
+        self.add_behaviour(self.DecideBehaviour(), ~heartbeat_template())
+
+    def on_shards_changed(self, role, joined, left):
+        # Forget the samples, windows and forecasts of VMs now owned by another decider, so
+        # stale history does not count if they come back; their cooldowns go with them
+        if role != DECIDER:
+            return
+        moved = [vm_name for vm_name in self.engine.states if not self.owns(vm_name)]
+        for vm_name in moved:
+            self.engine.reset(vm_name)
+            self.policy.forget(vm_name)
+            if self.planner is not None:
+                self.planner.forget(vm_name)
+            if self.forecaster is not None:
+                self.forecaster.forget(vm_name)
+        if moved:
+            print(f"DeciderAgent: {len(moved)} VMs moved to other deciders.")
+            logging.info(f"DeciderAgent: {len(moved)} VMs moved to other deciders "
+                         f"({len(self.shards.members)} deciders alive)")
+
+    def owns(self, vm_id):
+        # Whether this decider decides for the VM (always when not sharding)
+        return self.shards is None or self.shards.owns(vm_id)
+
+    def build_optimizer(self):
+        # Live catalog from the inventory when it has prices, otherwise the static one
+        if not COST_AWARE_SIZING:
+            return None
+        return SkuOptimizer(catalog_from_inventory(self.inventory.skus) or STATIC_CATALOG)
 
 if __name__ == "__main__":
-    # XMPP configuration
-    jid = "deciderilyas@jabber.fr"
-    password = "decider123"
+    # XMPP configuration (another instance's JID and password can be given on the command line)
+    jid = sys.argv[1] if len(sys.argv) > 2 else "deciderilyas@jabber.fr"
+    password = sys.argv[2] if len(sys.argv) > 2 else "decider123"
 
     # Create and run the DeciderAgent
     agent = DeciderAgent(jid, password)
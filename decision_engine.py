@@ -0,0 +1,131 @@
+import math
+from fleet_evaluator import DECISIONS, METRIC_FIELDS, FleetEvaluator
+
+# Sequence numbers are uint32 and wrap around, so "newer" uses serial number arithmetic
+SEQUENCE_MODULO = 2 ** 32
+
+
+def sequence_delta(new, old):
+    # How far `new` is ahead of `old` (negative when it is older or a replay)
+    delta = (new - old) % SEQUENCE_MODULO
+    return delta if delta < SEQUENCE_MODULO // 2 else delta - SEQUENCE_MODULO
+
+
+class VMState:
+    # Latest known metrics and bookkeeping for one VM
+    __slots__ = ["vm_id", "sequence", "timestamp", "cpu", "memory", "disk_read", "network_in",
+                 "received", "missed", "stale", "last_decision", "source"]
+
+    def __init__(self, vm_id):
+        self.vm_id = vm_id
+        self.sequence = None
+        self.timestamp = None
+        self.cpu = math.nan  # NaN until the metric has been read once
+        self.memory = math.nan
+        self.disk_read = math.nan
+        self.network_in = math.nan
+        self.received = 0
+        self.missed = 0
+        self.stale = 0
+        self.last_decision = None
+        self.source = None  # Monitor that sent the latest record
+
+    def apply(self, record):
+        # Merge a record into the state. Returns False for duplicates and out-of-order records.
+        # A sequence number that is not ahead but comes with a newer sample is a restarted
+        # monitor counting from 1 again (its sequence numbers are not persisted), so the
+        # sequence restarts instead of every record being dropped until it catches up.
+        if self.sequence is not None:
+            delta = sequence_delta(record.sequence, self.sequence)
+            if delta <= 0 and not record.timestamp > self.timestamp:
+                self.stale += 1
+                return False
+            if delta > 0:
+                self.missed += delta - 1
+        self.sequence = record.sequence
+        self.timestamp = record.timestamp
+        self.received += 1
+        # NaN marks a metric the monitor could not read; keep the previous value for it
+        for field in METRIC_FIELDS:
+            value = getattr(record, field)
+            if not math.isnan(value):
+                setattr(self, field, value)
+        return True
+
+    def is_complete(self):
+        return not any(math.isnan(getattr(self, field)) for field in METRIC_FIELDS)
+
+    def has_metrics(self):
+        return not all(math.isnan(getattr(self, field)) for field in METRIC_FIELDS)
+
+
+class DecisionEngine:
+    # Routes metrics records to per-VM states by VM id. VMs are created on first sight,
+    # so the engine needs no list of VMs up front. The latest metrics of every VM are mirrored
+    # into a FleetEvaluator for vectorized decisions; a metric that was never read (e.g. memory
+    # of a size missing from the SKU catalog) stays NaN, which can still scale the VM up on
+    # the other metrics but never scales it down.
+    # thresholds: {"upper": {metric: value}, "lower": {metric: value}}
+
+    def __init__(self, thresholds, tiers=None, vm_tiers=None):
+        self.fleet = FleetEvaluator(thresholds, tiers, vm_tiers)
+        self.states = {}
+
+    def state_for(self, vm_id):
+        state = self.states.get(vm_id)
+        if state is None:
+            state = VMState(vm_id)
+            self.states[vm_id] = state
+        return state
+
+    def ingest(self, record, source=None):
+        # Returns the VM's state when the record is new and the VM has at least one metric
+        # to decide on, otherwise None. Sequence numbers are per monitor, so a
+        # record from another monitor than the last one (the VM moved to a different
+        # shard) restarts the sequence instead of being dropped as stale.
+        state = self.state_for(record.vm_id)
+        if source is not None and source != state.source:
+            state.sequence = None
+            state.source = source
+        if not state.apply(record) or not state.has_metrics():
+            return None
+        self.fleet.update(state.vm_id, [getattr(state, field) for field in METRIC_FIELDS])
+        return state
+
+    def thresholds_for(self, vm_id):
+        return self.fleet.thresholds_for(vm_id)
+
+    def evaluate(self, state):
+        # Scalar path for a single VM; same rules as FleetEvaluator.evaluate
+        thresholds = self.thresholds_for(state.vm_id)
+        upper = thresholds["upper"]
+        lower = thresholds["lower"]
+        if any(getattr(state, field) > upper[field] for field in METRIC_FIELDS):
+            decision = "scale_up"
+        elif all(getattr(state, field) < lower[field] for field in METRIC_FIELDS):
+            decision = "scale_down"
+        else:
+            decision = "no_action"
+        state.last_decision = decision
+        return decision
+
+    def evaluate_batch(self, states):
+        # One vectorized pass over the fleet rows of the given states
+        index = self.fleet.index
+        rows = [index[state.vm_id] for state in states]
+        codes = self.fleet.evaluate(rows).tolist()
+        decisions = []
+        for state, code in zip(states, codes):
+            state.last_decision = DECISIONS[code]
+            decisions.append(state.last_decision)
+        return decisions
+
+    def forget(self, vm_id):
+        self.states.pop(vm_id, None)
+        self.fleet.remove(vm_id)
+
+    def reset(self, vm_id):
+        # Drop a VM's samples and fleet row (e.g. after it moved to another shard) but keep
+        # its thresholds
+        self.states.pop(vm_id, None)
+        self.fleet.remove(vm_id, keep_thresholds=True)
@@ -3,11 +3,19 @@
 import spade
 from spade.agent import Agent
 from spade.behaviour import CyclicBehaviour
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.compute import ComputeManagementClient
+from azure.identity.aio import DefaultAzureCredential
+from azure.mgmt.compute.aio import ComputeManagementClient
 import logging
 import asyncio
 import time
+from metrics_collector import region_name
+from capacity_planner import HORIZONTAL
+from metrics_protocol import RESIZE_ONTOLOGY
+from resize_pipeline import ResizePipeline
+from sku_optimizer import STATIC_CATALOG
+from state_store import StateStore
+from vm_inventory import VMInventory
+import telemetry
 
 # Configure logging
 logging.basicConfig(
@@ -21,20 +29,65 @@ SUBSCRIPTION_ID = "a77851f8-c146-41d3-8a76-2708eed4632a"
 RESOURCE_GROUP = "SMA-Cloud-Project"
 LOCATION = "West Europe"
 VM_SIZES = ["Standard_B1s", "Standard_B2s", "Standard_B4ms"]
-VM_COSTS = {
-    "Standard_B1s": 0.02,  # $0.02 per hour
-    "Standard_B2s": 0.04,  # $0.04 per hour
-    "Standard_B4ms": 0.08  # $0.08 per hour
-}
+# Hourly prices used for sizes the SKU catalog has no price for, taken from the offline
+# catalog the DeciderAgent's optimizer uses so both agents price a size the same way
+VM_COSTS = {size: STATIC_CATALOG[size]["price_per_hour"] for size in VM_SIZES}
+MAX_CONCURRENT_RESIZES_PER_SUBSCRIPTION = 10  # Resizes running at the same time in one subscription
+COST_REPORT_INTERVAL_SECONDS = 60  # How often accumulated costs are updated and logged
+INVENTORY_PATH = "vm_inventory.json"  # VM sizes and SKU catalog shared with the other agents
+INVENTORY_TTL_SECONDS = 300  # VMs are listed again (one call per resource group) after this long
+SKU_CATALOG_TTL_SECONDS = 86400  # SKU capacities and prices are listed again (one call per region) after this long
+FETCH_RETAIL_PRICES = True  # Fill SKU prices from the public Azure Retail Prices API
+PER_VM_CONSOLE_OUTPUT = True  # Print lines per VM per instruction (turn off for large fleets; the log is unaffected)
+METRICS_PORT = 9103  # Serve counters and histograms on http://127.0.0.1:9103/metrics (None to disable)
+DECIDER_JID = "deciderilyas@jabber.fr"  # Gets resize confirmations for decisions without a sender
+STATE_DB_PATH = "executor_state.db"  # Sizes, cost intervals and resizes survive restarts here (None to keep them in memory only)
+STATE_FLUSH_INTERVAL_SECONDS = 1  # State changes are committed in one batch this often
 
-# Azure Compute client
+# Telemetry
+TRANSIT_SECONDS = telemetry.histogram("executor_decision_transit_seconds", "Decision message delay from DeciderAgent send to receipt")
+SAMPLE_TO_RESIZE_SECONDS = telemetry.histogram("executor_sample_to_resize_seconds", "Time from the sample behind a decision to its completed resize")
+RESIZE_SECONDS = telemetry.histogram("executor_resize_seconds", "Duration of successful resizes")
+CAPACITY_CHANGE_SECONDS = telemetry.histogram("executor_capacity_change_seconds", "Duration of successful scale set scale-outs and scale-ins")
+INSTRUCTIONS = telemetry.counter("executor_instructions_total", "Decisions received from the DeciderAgent")
+RESIZES_STARTED = telemetry.counter("executor_resizes_started_total", "Resizes submitted to Azure")
+RESIZE_FAILURES = telemetry.counter("executor_resize_failures_total", "Resizes that failed")
+IGNORED_INSTRUCTIONS = telemetry.counter("executor_ignored_instructions_total", "Scale decisions ignored (VM unknown, already resizing or at the size limit)")
+INVALID_MESSAGES = telemetry.counter("executor_invalid_messages_total", "Decision messages that could not be parsed")
+RECEIVE_TIMEOUTS = telemetry.counter("executor_receive_timeouts_total", "Cycles without any instruction")
+
+def console(message):
+    # Per-VM console output, skipped when PER_VM_CONSOLE_OUTPUT is off
+    if PER_VM_CONSOLE_OUTPUT:
+        print(message)
+
+# Azure Compute clients (async, one per subscription)
 credential = DefaultAzureCredential()
-compute_client = ComputeManagementClient(credential, SUBSCRIPTION_ID)
+compute_clients = {}
+
+def get_compute_client(subscription):
+    if subscription not in compute_clients:
+        compute_clients[subscription] = ComputeManagementClient(credential, subscription)
+    return compute_clients[subscription]
+
+# VM sizes and the SKU catalog, listed in bulk and shared with the other agents
+inventory = VMInventory(INVENTORY_PATH, INVENTORY_TTL_SECONDS, SKU_CATALOG_TTL_SECONDS)
+
+def hourly_cost(vm_size):
+    # Live price, else VM_COSTS, else the offline catalog (any size the cost-aware decider
+    # may choose), else 0 for a size nobody knows a price for
+    price = inventory.price(vm_size)
+    if price is None:
+        price = VM_COSTS.get(vm_size)
+    if price is None:
+        price = STATIC_CATALOG.get(vm_size, {}).get("price_per_hour", 0.0)
+    return price
 
 class ExecutorAgent(Agent):
     def __init__(self, jid, password):
         super().__init__(jid, password)
-        # Track state for each VM
+        # Track state for each VM (a VM may set "subscription" and "resource_group"). A VM Scale
+        # Set is tracked the same way; its "capacity" (instance count) comes from the inventory.
         self.vms = {
             "vm-initiale": {
                 "current_size": "Standard_B1s",
@@ -48,117 +101,317 @@ class ExecutorAgent(Agent):
             }
         }
         self.total_cost = 0.0
+        self.last_cost_report = 0.0
 
     class ExecuteBehaviour(CyclicBehaviour):
         async def on_start(self):
-            # Fetch initial VM sizes from Azure
-            for vm_name in self.agent.vms.keys():
-                try:
-                    vm = compute_client.virtual_machines.get(RESOURCE_GROUP, vm_name)
-                    self.agent.vms[vm_name]["current_size"] = vm.hardware_profile.vm_size
-                    print(f"ExecutorAgent: Initial size for {vm_name}: {self.agent.vms[vm_name]['current_size']}")
-                    logging.info(f"ExecutorAgent: Initial size for {vm_name}: {self.agent.vms[vm_name]['current_size']}")
-                except Exception as e:
-                    print(f"ExecutorAgent: Failed to fetch initial size for {vm_name}: {str(e)}")
-                    logging.error(f"ExecutorAgent: Failed to fetch initial size for {vm_name}: {str(e)}")
+            # Resizes run in the background; completions come back through on_resized
+            self.pipeline = ResizePipeline(
+                get_compute_client, MAX_CONCURRENT_RESIZES_PER_SUBSCRIPTION, on_done=self.on_resized
+            )
+            # {vm name: (trace id, sample time, decider, state store operation id)} of the decision
+            # behind each resize in flight
+            self.traces = {}
+            store = self.agent.store
+            self.flusher = asyncio.ensure_future(store.run_flusher()) if store is not None else None
+
+            # Fetch initial VM sizes from the shared inventory (listed in bulk if it is stale)
+            await self.refresh_inventory()
+            for vm_name, vm_state in self.agent.vms.items():
+                size = inventory.size_of(vm_name)
+                if size is None:
+                    console(f"ExecutorAgent: Failed to fetch initial size for {vm_name}: not found in inventory")
+                    logging.error(f"ExecutorAgent: Failed to fetch initial size for {vm_name}: not found in inventory")
+                    continue
+                if store is not None and size != vm_state["current_size"]:
+                    store.record_size(vm_name, size, time.time(), vm_state["last_update_time"], vm_state["cost"])
+                vm_state["current_size"] = size
+                capacity = inventory.capacity_of(vm_name)
+                if capacity is not None:
+                    vm_state["capacity"] = capacity
+                console(f"ExecutorAgent: Initial size for {vm_name}: {vm_state['current_size']}")
+                logging.info(f"ExecutorAgent: Initial size for {vm_name}: {vm_state['current_size']}")
+
+        async def refresh_inventory(self):
+            try:
+                vm_states = self.agent.vms.values()
+                groups = {(state.get("subscription", SUBSCRIPTION_ID), state.get("resource_group", RESOURCE_GROUP))
+                          for state in vm_states}
+                regions = {(state.get("subscription", SUBSCRIPTION_ID), region_name(state.get("location", LOCATION)))
+                           for state in vm_states}
+                await inventory.refresh_if_stale(get_compute_client, sorted(groups), sorted(regions),
+                                                 FETCH_RETAIL_PRICES)
+            except Exception as e:
+                print(f"ExecutorAgent: Failed to refresh VM inventory: {str(e)}")
+                logging.error(f"ExecutorAgent: Failed to refresh VM inventory: {str(e)}")
 
         async def run(self):
-            print(f"ExecutorAgent: Running in {RESOURCE_GROUP} ({LOCATION})...")
-            logging.info(f"ExecutorAgent: Running in {RESOURCE_GROUP} ({LOCATION})")
-            
+            if time.time() - self.agent.last_cost_report >= COST_REPORT_INTERVAL_SECONDS:
+                print(f"ExecutorAgent: Running in {RESOURCE_GROUP} ({LOCATION}), "
+                      f"{len(self.pipeline.in_flight)} resizes in flight...")
+                logging.info(f"ExecutorAgent: Running in {RESOURCE_GROUP} ({LOCATION}), "
+                             f"{len(self.pipeline.in_flight)} resizes in flight")
+                await self.refresh_inventory()  # Keeps SKU prices current; sizes are tracked locally
+                self.update_costs()
+
+            msg = await self.receive(timeout=COST_REPORT_INTERVAL_SECONDS)
+            if not msg:
+                RECEIVE_TIMEOUTS.inc()
+                print("ExecutorAgent: No instructions received within timeout.")
+                logging.info("ExecutorAgent: No instructions received within timeout")
+                return
+
+            # Drain everything already queued; resizes are only started here, never awaited
+            while msg:
+                self.handle_instruction(msg)
+                msg = await self.receive()  # Non-blocking: None once the queue is empty
+
+        def accrue_cost(self, vm_name, vm_state, now):
+            # Never negative, even if the clock is behind a recovered accrual time
+            time_spent_hours = max(0.0, now - vm_state["last_update_time"]) / 3600
+            cost = hourly_cost(vm_state["current_size"]) * vm_state.get("capacity", 1) * time_spent_hours
+            vm_state["cost"] += cost
+            self.agent.total_cost += cost
+            if self.agent.store is not None:
+                self.agent.store.record_cost(vm_name, vm_state["current_size"], vm_state["last_update_time"], now,
+                                             cost, vm_state["cost"])
+            vm_state["last_update_time"] = now
+            return cost
+
+        def update_costs(self):
             # Update costs for all VMs
+            current_time = time.time()
             for vm_name, vm_state in self.agent.vms.items():
-                current_time = time.time()
-                time_spent_hours = (current_time - vm_state["last_update_time"]) / 3600
-                cost = VM_COSTS[vm_state["current_size"]] * time_spent_hours
-                vm_state["cost"] += cost
-                self.agent.total_cost += cost
-                vm_state["last_update_time"] = current_time
-                print(f"ExecutorAgent: {vm_name} - Cost for {vm_state['current_size']} (Last cycle): ${cost:.4f}, "
+                cost = self.accrue_cost(vm_name, vm_state, current_time)
+                console(f"ExecutorAgent: {vm_name} - Cost for {vm_state['current_size']} (Last cycle): ${cost:.4f}, "
                       f"VM Total Cost: ${vm_state['cost']:.4f}, Overall Total Cost: ${self.agent.total_cost:.4f}")
                 logging.info(f"ExecutorAgent: {vm_name} - Cost for {vm_state['current_size']} (Last cycle): ${cost:.4f}, "
                              f"VM Total Cost: ${vm_state['cost']:.4f}, Overall Total Cost: ${self.agent.total_cost:.4f}")
+            self.agent.last_cost_report = current_time
 
-            print("ExecutorAgent: Waiting for instructions...")
-            logging.info("ExecutorAgent: Waiting for instructions")
-            
-            msg = await self.receive(timeout=60)  # Matches the 60-second cycle
-            if msg:
+        def handle_instruction(self, msg):
+            INSTRUCTIONS.inc()
+            transit = msg.get_metadata(telemetry.SENT_AT)
+            if transit is not None:
                 try:
-                    # Parse message format: "vm_name:decision"
-                    vm_name, decision = msg.body.split(":")
-                    if vm_name not in self.agent.vms:
-                        print(f"ExecutorAgent: Unknown VM {vm_name}, ignoring instruction.")
-                        logging.warning(f"ExecutorAgent: Unknown VM {vm_name}, ignoring instruction")
+                    TRANSIT_SECONDS.observe(max(0.0, time.time() - float(transit)))
+                except ValueError:
+                    pass
+            try:
+                # Parse message format: "vm_name:decision" or "vm_name:decision:target_size"
+                # (the target is set by the DeciderAgent's cost-aware sizing), or for a scale set
+                # "vm_name:scale_out:instances" / "vm_name:scale_in:instances"
+                vm_name, decision, *target = msg.body.split(":")
+                if len(target) > 1:
+                    raise ValueError(msg.body)
+                if vm_name not in self.agent.vms:
+                    IGNORED_INSTRUCTIONS.inc()
+                    console(f"ExecutorAgent: Unknown VM {vm_name}, ignoring instruction.")
+                    logging.warning(f"ExecutorAgent: Unknown VM {vm_name}, ignoring instruction")
+                    return
+
+                console(f"ExecutorAgent: Action received for {vm_name}: {decision}")
+                logging.info(f"ExecutorAgent: Action received for {vm_name}: {decision}")
+
+                vm_state = self.agent.vms[vm_name]
+                if decision not in ("scale_up", "scale_down") + HORIZONTAL:
+                    console(f"ExecutorAgent: No scaling needed for {vm_name}.")
+                    logging.info(f"ExecutorAgent: No scaling needed for {vm_name}")
+                    return
+                if self.pipeline.is_resizing(vm_name):
+                    IGNORED_INSTRUCTIONS.inc()
+                    console(f"ExecutorAgent: {vm_name} is already resizing, ignoring duplicate {decision}.")
+                    logging.info(f"ExecutorAgent: {vm_name} is already resizing, ignoring duplicate {decision}")
+                    return
+                if decision in HORIZONTAL:
+                    self.change_capacity(vm_name, vm_state, decision, target, msg)
+                    return
+                if not inventory.resizes_in_place(vm_name):
+                    # The scale set's running instances would keep their size (Manual upgrade policy)
+                    IGNORED_INSTRUCTIONS.inc()
+                    console(f"ExecutorAgent: {vm_name} does not upgrade its instances automatically, cannot {decision.replace('_', ' ')}.")
+                    logging.warning(f"ExecutorAgent: {vm_name} does not upgrade its instances automatically, cannot {decision.replace('_', ' ')}")
+                    return
+
+                if target:
+                    new_vm_size = target[0]
+                    if new_vm_size == vm_state["current_size"]:
+                        console(f"ExecutorAgent: {vm_name} is already {new_vm_size}.")
+                        logging.info(f"ExecutorAgent: {vm_name} is already {new_vm_size}")
                         return
+                    console(f"ExecutorAgent: Resizing {vm_name} from {vm_state['current_size']} to {new_vm_size} ({decision})...")
+                    logging.info(f"ExecutorAgent: Resizing {vm_name} from {vm_state['current_size']} to {new_vm_size} ({decision})")
+                    self.start_resize(vm_name, vm_state, decision, new_vm_size, msg)
+                    return
+                if vm_state["current_size"] not in VM_SIZES:
+                    IGNORED_INSTRUCTIONS.inc()
+                    console(f"ExecutorAgent: {vm_name} size {vm_state['current_size']} is not on the VM_SIZES ladder, cannot {decision.replace('_', ' ')}.")
+                    logging.warning(f"ExecutorAgent: {vm_name} size {vm_state['current_size']} is not on the VM_SIZES ladder, cannot {decision.replace('_', ' ')}")
+                    return
 
-                    print(f"ExecutorAgent: Action received for {vm_name}: {decision}")
-                    logging.info(f"ExecutorAgent: Action received for {vm_name}: {decision}")
-                    
-                    if decision == "scale_up":
-                        current_index = VM_SIZES.index(self.agent.vms[vm_name]["current_size"])
-                        if current_index < len(VM_SIZES) - 1:
-                            new_vm_size = VM_SIZES[current_index + 1]
-                            print(f"ExecutorAgent: Scaling up {vm_name} from {self.agent.vms[vm_name]['current_size']} to {new_vm_size}...")
-                            logging.info(f"ExecutorAgent: Scaling up {vm_name} from {self.agent.vms[vm_name]['current_size']} to {new_vm_size}")
-                            
-                            # Update VM size in Azure
-                            try:
-                                vm = compute_client.virtual_machines.get(RESOURCE_GROUP, vm_name)
-                                vm.hardware_profile.vm_size = new_vm_size
-                                async_update = compute_client.virtual_machines.begin_update(
-                                    RESOURCE_GROUP, vm_name, vm
-                                )
-                                async_update.wait()
-                                print(f"ExecutorAgent: {vm_name} scaled up to {new_vm_size} successfully.")
-                                logging.info(f"ExecutorAgent: {vm_name} scaled up to {new_vm_size} successfully")
-                                self.agent.vms[vm_name]["current_size"] = new_vm_size
-                            except Exception as e:
-                                print(f"ExecutorAgent: Failed to scale up {vm_name}: {str(e)}")
-                                logging.error(f"ExecutorAgent: Failed to scale up {vm_name}: {str(e)}")
-                        else:
-                            print(f"ExecutorAgent: {vm_name} already at maximum VM size ({self.agent.vms[vm_name]['current_size']}), cannot scale up further.")
-                            logging.info(f"ExecutorAgent: {vm_name} already at maximum VM size ({self.agent.vms[vm_name]['current_size']}), cannot scale up further")
-                    elif decision == "scale_down":
-                        current_index = VM_SIZES.index(self.agent.vms[vm_name]["current_size"])
-                        if current_index > 0:
-                            new_vm_size = VM_SIZES[current_index - 1]
-                            print(f"ExecutorAgent: Scaling down {vm_name} from {self.agent.vms[vm_name]['current_size']} to {new_vm_size}...")
-                            logging.info(f"ExecutorAgent: Scaling down {vm_name} from {self.agent.vms[vm_name]['current_size']} to {new_vm_size}")
-                            
-                            # Update VM size in Azure
-                            try:
-                                vm = compute_client.virtual_machines.get(RESOURCE_GROUP, vm_name)
-                                vm.hardware_profile.vm_size = new_vm_size
-                                async_update = compute_client.virtual_machines.begin_update(
-                                    RESOURCE_GROUP, vm_name, vm
-                                )
-                                async_update.wait()
-                                print(f"ExecutorAgent: {vm_name} scaled down to {new_vm_size} successfully.")
-                                logging.info(f"ExecutorAgent: {vm_name} scaled down to {new_vm_size} successfully")
-                                self.agent.vms[vm_name]["current_size"] = new_vm_size
-                            except Exception as e:
-                                print(f"ExecutorAgent: Failed to scale down {vm_name}: {str(e)}")
-                                logging.error(f"ExecutorAgent: Failed to scale down {vm_name}: {str(e)}")
-                        else:
-                            print(f"ExecutorAgent: {vm_name} already at minimum VM size ({self.agent.vms[vm_name]['current_size']}), cannot scale down further.")
-                            logging.info(f"ExecutorAgent: {vm_name} already at minimum VM size ({self.agent.vms[vm_name]['current_size']}), cannot scale down further")
-                    else:
-                        print(f"ExecutorAgent: No scaling needed for {vm_name}.")
-                        logging.info(f"ExecutorAgent: No scaling needed for {vm_name}")
-                except ValueError:
-                    print(f"ExecutorAgent: Invalid message format: {msg.body}")
-                    logging.warning(f"ExecutorAgent: Invalid message format: {msg.body}")
-                except Exception as e:
-                    print(f"ExecutorAgent: Error processing instruction: {str(e)}")
-                    logging.error(f"ExecutorAgent: Error processing instruction: {str(e)}")
-            else:
-                print("ExecutorAgent: No instructions received within timeout.")
-                logging.info("ExecutorAgent: No instructions received within timeout")
+                current_index = VM_SIZES.index(vm_state["current_size"])
+                if decision == "scale_up":
+                    if current_index == len(VM_SIZES) - 1:
+                        IGNORED_INSTRUCTIONS.inc()
+                        console(f"ExecutorAgent: {vm_name} already at maximum VM size ({vm_state['current_size']}), cannot scale up further.")
+                        logging.info(f"ExecutorAgent: {vm_name} already at maximum VM size ({vm_state['current_size']}), cannot scale up further")
+                        return
+                    new_vm_size = VM_SIZES[current_index + 1]
+                    console(f"ExecutorAgent: Scaling up {vm_name} from {vm_state['current_size']} to {new_vm_size}...")
+                    logging.info(f"ExecutorAgent: Scaling up {vm_name} from {vm_state['current_size']} to {new_vm_size}")
+                else:
+                    if current_index == 0:
+                        IGNORED_INSTRUCTIONS.inc()
+                        console(f"ExecutorAgent: {vm_name} already at minimum VM size ({vm_state['current_size']}), cannot scale down further.")
+                        logging.info(f"ExecutorAgent: {vm_name} already at minimum VM size ({vm_state['current_size']}), cannot scale down further")
+                        return
+                    new_vm_size = VM_SIZES[current_index - 1]
+                    console(f"ExecutorAgent: Scaling down {vm_name} from {vm_state['current_size']} to {new_vm_size}...")
+                    logging.info(f"ExecutorAgent: Scaling down {vm_name} from {vm_state['current_size']} to {new_vm_size}")
+
+                self.start_resize(vm_name, vm_state, decision, new_vm_size, msg)
+            except ValueError:
+                INVALID_MESSAGES.inc()
+                print(f"ExecutorAgent: Invalid message format: {msg.body}")
+                logging.warning(f"ExecutorAgent: Invalid message format: {msg.body}")
+            except Exception as e:
+                print(f"ExecutorAgent: Error processing instruction: {str(e)}")
+                logging.error(f"ExecutorAgent: Error processing instruction: {str(e)}")
+
+        def change_capacity(self, vm_name, vm_state, decision, target, msg):
+            # Scale a scale set out or in to the instance count in the decision
+            capacity = vm_state.get("capacity")
+            if capacity is None:
+                IGNORED_INSTRUCTIONS.inc()
+                console(f"ExecutorAgent: {vm_name} is not a scale set, cannot {decision.replace('_', ' ')}.")
+                logging.warning(f"ExecutorAgent: {vm_name} is not a scale set, cannot {decision.replace('_', ' ')}")
+                return
+            if len(target) != 1:
+                raise ValueError(msg.body)
+            instances = int(target[0])
+            if instances < 0 or (instances > capacity) != (decision == "scale_out") or instances == capacity:
+                IGNORED_INSTRUCTIONS.inc()
+                console(f"ExecutorAgent: {vm_name} has {capacity} instances, ignoring {decision} to {instances}.")
+                logging.info(f"ExecutorAgent: {vm_name} has {capacity} instances, ignoring {decision} to {instances}")
+                return
+            console(f"ExecutorAgent: Scaling {vm_name} from {capacity} to {instances} instances ({decision})...")
+            logging.info(f"ExecutorAgent: Scaling {vm_name} from {capacity} to {instances} instances ({decision})")
+            self.start_resize(vm_name, vm_state, decision, instances, msg)
+
+        def start_resize(self, vm_name, vm_state, decision, new_vm_size, msg):
+            # Update VM size (or a scale set's instance count) in Azure in the background,
+            # remembering the decision's trace
+            trace_id = msg.get_metadata(telemetry.TRACE_ID) or vm_name
+            current = vm_state["capacity"] if decision in HORIZONTAL else vm_state["current_size"]
+            operation_id = None
+            if self.agent.store is not None:
+                operation_id = self.agent.store.begin_resize(vm_name, decision, current, new_vm_size, trace_id)
+            self.traces[vm_name] = (trace_id, msg.get_metadata(telemetry.SAMPLE_TIME), str(msg.sender or DECIDER_JID),
+                                    operation_id)
+            RESIZES_STARTED.inc()
+            logging.info(f"ExecutorAgent: Submitted resize of {vm_name} to {new_vm_size} [trace {trace_id}]")
+            scale_set = (vm_state["current_size"], vm_state["capacity"]) if "capacity" in vm_state else None
+            self.pipeline.submit(
+                vm_name, decision, new_vm_size,
+                vm_state.get("resource_group", RESOURCE_GROUP),
+                vm_state.get("subscription", SUBSCRIPTION_ID),
+                scale_set
+            )
+
+        async def on_resized(self, vm_name, direction, new_size, duration, error):
+            action = direction.replace("scale_", "scaled ")
+            trace_id, sample_time, decider, operation_id = self.traces.pop(vm_name, (vm_name, None, DECIDER_JID, None))
+            store = self.agent.store
+            if store is not None and operation_id is not None:
+                store.finish_resize(operation_id, error)
+            if error is not None:
+                RESIZE_FAILURES.inc()
+                console(f"ExecutorAgent: Failed to {direction.replace('_', ' ')} {vm_name}: {error}")
+                logging.error(f"ExecutorAgent: Failed to {direction.replace('_', ' ')} {vm_name}: {error} [trace {trace_id}]")
+                return
+
+            if sample_time is not None:
+                SAMPLE_TO_RESIZE_SECONDS.observe(max(0.0, time.time() - float(sample_time)))
+
+            vm_state = self.agent.vms[vm_name]
+            # Charge the time spent at the old size (or instance count) before switching
+            now = time.time()
+            self.accrue_cost(vm_name, vm_state, now)
+            if direction in HORIZONTAL:
+                CAPACITY_CHANGE_SECONDS.observe(duration)
+                vm_state["capacity"] = new_size
+                inventory.set_capacity(vm_name, new_size, persist=True)
+                console(f"ExecutorAgent: {vm_name} {action} to {new_size} instances successfully in {duration:.0f}s.")
+                logging.info(f"ExecutorAgent: {vm_name} {action} to {new_size} instances successfully in {duration:.0f}s "
+                             f"[trace {trace_id}]")
+                await self.notify_resized(vm_name, direction, new_size, duration, trace_id, decider)
+                return
+
+            RESIZE_SECONDS.observe(duration)
+            vm_state["current_size"] = new_size
+            if store is not None:
+                store.record_size(vm_name, new_size, now, now, vm_state["cost"])
+            inventory.set_size(vm_name, new_size, persist=True)  # The monitor's memory % uses the new SKU right away
+            console(f"ExecutorAgent: {vm_name} {action} to {new_size} successfully in {duration:.0f}s.")
+            logging.info(f"ExecutorAgent: {vm_name} {action} to {new_size} successfully in {duration:.0f}s [trace {trace_id}]")
+            await self.notify_resized(vm_name, direction, new_size, duration, trace_id, decider)
+
+        async def notify_resized(self, vm_name, direction, new_size, duration, trace_id=None, decider=DECIDER_JID):
+            # Tell the DeciderAgent that asked for the resize (one of several when sharding)
+            # that it went through and how long it took, so it restarts the VM's cooldown and
+            # refines its resize lead time estimate
+            msg = spade.message.Message(
+                to=decider,
+                body=f"{vm_name}:{direction}:{new_size}:{duration:.1f}"
+            )
+            msg.set_metadata("ontology", RESIZE_ONTOLOGY)
+            if trace_id is not None:
+                msg.set_metadata(telemetry.TRACE_ID, trace_id)
+            await self.send(msg)
+
+        async def on_end(self):
+            # Abandon resizes still in flight (Azure finishes them regardless) and close clients
+            self.pipeline.cancel_all()
+            for client in compute_clients.values():
+                await client.close()
+            await credential.close()
+            if self.agent.metrics_server is not None:
+                await self.agent.metrics_server.cleanup()
+            if self.flusher is not None:
+                self.flusher.cancel()
+            if self.agent.store is not None:
+                self.agent.store.close()
 
     async def setup(self):
+        self.store = None
+        if STATE_DB_PATH:
+            self.store = StateStore(STATE_DB_PATH, STATE_FLUSH_INTERVAL_SECONDS)
+            self.recover_state()
+        self.metrics_server = None
+        if METRICS_PORT:
+            try:
+                self.metrics_server = await telemetry.start_metrics_server(METRICS_PORT)
+            except OSError as e:
+                logging.error(f"ExecutorAgent: Could not serve metrics on port {METRICS_PORT}: {str(e)}")
         self.add_behaviour(self.ExecuteBehaviour())
 
+    def recover_state(self):
+        # Resume sizes and accumulated costs saved by the previous run. Time since its last
+        # accrual is charged at the saved size on the next cost update.
+        saved = self.store.load_vms()
+        recovered = 0
+        for vm_name, vm_state in self.vms.items():
+            if vm_name in saved:
+                vm_state.update(saved[vm_name])
+                recovered += 1
+        self.total_cost = sum(vm_state["cost"] for vm_state in self.vms.values())
+        print(f"ExecutorAgent: Recovered state for {recovered} VMs (total cost ${self.total_cost:.4f}).")
+        logging.info(f"ExecutorAgent: Recovered state for {recovered} VMs from {STATE_DB_PATH} "
+                     f"(total cost ${self.total_cost:.4f})")
+        for operation in self.store.interrupted_resizes():
+            logging.warning(f"ExecutorAgent: Resize of {operation['vm']} to {operation['to_size']} was in flight "
+                            f"at the last shutdown, actual size comes from the inventory [trace {operation['trace_id']}]")
+
 if __name__ == "__main__":
     # XMPP configuration
     jid = "executorilyas@jabber.fr"
@@ -0,0 +1,119 @@
+import numpy as np
+
+# Column order of the metrics and threshold matrices
+METRIC_FIELDS = ["cpu", "memory", "disk_read", "network_in"]
+
+NO_ACTION = 0
+SCALE_UP = 1
+SCALE_DOWN = 2
+DECISIONS = ["no_action", "scale_up", "scale_down"]
+
+
+def threshold_row(thresholds, bound):
+    return [thresholds[bound][field] for field in METRIC_FIELDS]
+
+
+class FleetEvaluator:
+    # Latest metrics of the whole fleet in one (VMs x metrics) array, with matching
+    # upper/lower threshold arrays, so every decision is computed in one vectorized pass.
+    # thresholds: default {"upper": {metric: value}, "lower": {metric: value}}
+    # tiers: {tier name: thresholds}, vm_tiers: {vm id: tier name}
+
+    def __init__(self, thresholds, tiers=None, vm_tiers=None, capacity=1024):
+        self.thresholds = thresholds
+        self.tiers = tiers or {}
+        self.vm_tiers = dict(vm_tiers or {})  # Copied: assign_tier() and remove() change it
+        self.vm_thresholds = {}  # Per-VM overrides
+        self.index = {}
+        self.vm_ids = []
+        self.metrics = np.full((capacity, len(METRIC_FIELDS)), np.nan)
+        self.upper = np.empty((capacity, len(METRIC_FIELDS)))
+        self.lower = np.empty((capacity, len(METRIC_FIELDS)))
+
+    def __len__(self):
+        return len(self.vm_ids)
+
+    def _grow(self):
+        # Double the arrays so appends stay amortized O(1)
+        capacity = self.metrics.shape[0] * 2
+        for name, fill in (("metrics", np.nan), ("upper", 0.0), ("lower", 0.0)):
+            old = getattr(self, name)
+            new = np.full((capacity, old.shape[1]), fill)
+            new[:old.shape[0]] = old
+            setattr(self, name, new)
+
+    def row_for(self, vm_id):
+        row = self.index.get(vm_id)
+        if row is None:
+            row = len(self.vm_ids)
+            if row == self.metrics.shape[0]:
+                self._grow()
+            self.index[vm_id] = row
+            self.vm_ids.append(vm_id)
+            self._set_row_thresholds(row, self.thresholds_for(vm_id))
+        return row
+
+    def thresholds_for(self, vm_id):
+        if vm_id in self.vm_thresholds:
+            return self.vm_thresholds[vm_id]
+        return self.tiers.get(self.vm_tiers.get(vm_id), self.thresholds)
+
+    def _set_row_thresholds(self, row, thresholds):
+        self.upper[row] = threshold_row(thresholds, "upper")
+        self.lower[row] = threshold_row(thresholds, "lower")
+
+    def assign_tier(self, vm_id, tier):
+        if tier not in self.tiers:
+            raise KeyError(f"Unknown threshold tier: {tier}")
+        self.vm_tiers[vm_id] = tier
+        self.vm_thresholds.pop(vm_id, None)
+        self._set_row_thresholds(self.row_for(vm_id), self.tiers[tier])
+
+    def set_vm_thresholds(self, vm_id, thresholds):
+        # Per-VM override; takes precedence until the VM is assigned a tier again
+        self.vm_thresholds[vm_id] = thresholds
+        self._set_row_thresholds(self.row_for(vm_id), thresholds)
+
+    def remove(self, vm_id, keep_thresholds=False):
+        # Swap the last row into the freed slot so rows stay contiguous. keep_thresholds keeps
+        # the VM's tier or override for when it comes back.
+        row = self.index.pop(vm_id, None)
+        if row is None:
+            return
+        last = len(self.vm_ids) - 1
+        if row != last:
+            moved = self.vm_ids[last]
+            self.vm_ids[row] = moved
+            self.index[moved] = row
+            for array in (self.metrics, self.upper, self.lower):
+                array[row] = array[last]
+        self.vm_ids.pop()
+        self.metrics[last] = np.nan
+        if not keep_thresholds:
+            self.vm_tiers.pop(vm_id, None)
+            self.vm_thresholds.pop(vm_id, None)
+
+    def update(self, vm_id, values):
+        row = self.row_for(vm_id)  # May reallocate the arrays
+        self.metrics[row] = values
+
+    def update_many(self, vm_ids, values):
+        rows = np.fromiter((self.row_for(vm_id) for vm_id in vm_ids), dtype=np.intp, count=len(vm_ids))
+        self.metrics[rows] = values
+        return rows
+
+    def evaluate(self, rows=None):
+        # Decision codes for the given rows (default: the whole fleet). Scale up if any metric
+        # is above its upper threshold, scale down if all are below their lower threshold.
+        # Rows with a missing (NaN) metric never scale down.
+        if rows is None:
+            rows = slice(0, len(self.vm_ids))
+        metrics = self.metrics[rows]
+        scale_up = (metrics > self.upper[rows]).any(axis=1)
+        scale_down = (metrics < self.lower[rows]).all(axis=1)
+        return np.where(scale_up, SCALE_UP, np.where(scale_down, SCALE_DOWN, NO_ACTION))
+
+    def decisions(self, rows=None):
+        codes = self.evaluate(rows)
+        vm_ids = self.vm_ids if rows is None else [self.vm_ids[row] for row in rows]
+        return dict(zip(vm_ids, (DECISIONS[code] for code in codes.tolist())))
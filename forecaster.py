@@ -0,0 +1,116 @@
+import math
+from fleet_evaluator import METRIC_FIELDS
+
+
+class ForecastState:
+    # Holt-Winters state of one VM, one entry per metric in METRIC_FIELDS.
+    # Constant size: level, trend and mean squared one-step error per metric plus
+    # season_length seasonal terms per metric.
+    __slots__ = ["level", "trend", "error", "seasonal", "samples", "last_timestamp"]
+
+    def __init__(self, values, season_length, timestamp):
+        self.level = list(values)
+        self.trend = [0.0] * len(values)
+        self.error = [0.0] * len(values)
+        self.seasonal = [[0.0] * len(values) for _ in range(season_length)]
+        self.samples = 1
+        self.last_timestamp = timestamp
+
+
+class TrendForecaster:
+    # Incremental additive Holt-Winters (level + trend, plus seasonality when season_length > 0).
+    # Every sample updates the state in O(metrics); nothing is refitted over history.
+    #   alpha: level smoothing, beta: trend smoothing, gamma: seasonal smoothing
+    #   interval_seconds: expected spacing of samples, used to turn a lead time into steps
+    #   confidence: a breach is only predicted when the forecast minus confidence times its
+    #     error (the one-step error's standard deviation, growing with the square root of
+    #     the steps ahead) is above the threshold, so noisy metrics need a clearer trend
+    #   error_smoothing: weight of the newest squared one-step error in its moving average
+
+    def __init__(self, alpha=0.5, beta=0.3, gamma=0.1, season_length=0,
+                 interval_seconds=60, warmup_samples=4, confidence=0.5, error_smoothing=0.1):
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.confidence = confidence
+        self.error_smoothing = error_smoothing
+        self.season_length = season_length
+        self.interval_seconds = interval_seconds
+        self.warmup_samples = warmup_samples
+        self.states = {}
+
+    def update(self, vm_id, values, timestamp):
+        # values: metric values in METRIC_FIELDS order
+        state = self.states.get(vm_id)
+        if state is None:
+            self.states[vm_id] = ForecastState(values, self.season_length, timestamp)
+            return
+        if timestamp <= state.last_timestamp:
+            return
+
+        # A gap of several intervals advances the trend by that many steps
+        steps = max(1, round((timestamp - state.last_timestamp) / self.interval_seconds))
+        season = state.seasonal[state.samples % self.season_length] if self.season_length else None
+        for i, value in enumerate(values):
+            # A metric that is not read (NaN) keeps its state; one read for the first time starts from it
+            if math.isnan(value):
+                continue
+            previous_level = state.level[i]
+            if math.isnan(previous_level):
+                state.level[i] = value
+                continue
+            seasonal = season[i] if season else 0.0
+            error = value - (previous_level + steps * state.trend[i] + seasonal)
+            state.error[i] = self.error_smoothing * error * error + (1 - self.error_smoothing) * state.error[i]
+            level = self.alpha * (value - seasonal) + (1 - self.alpha) * (previous_level + steps * state.trend[i])
+            state.trend[i] = self.beta * (level - previous_level) / steps + (1 - self.beta) * state.trend[i]
+            state.level[i] = level
+            if season:
+                season[i] = self.gamma * (value - level) + (1 - self.gamma) * seasonal
+        state.samples += 1
+        state.last_timestamp = timestamp
+
+    def forecast(self, vm_id, horizon_seconds):
+        # Predicted metric values horizon_seconds after the last sample, or None during warm-up
+        state = self.states.get(vm_id)
+        if state is None or state.samples < self.warmup_samples:
+            return None
+        steps = max(1, math.ceil(horizon_seconds / self.interval_seconds))
+        season = None
+        if self.season_length:
+            season = state.seasonal[(state.samples + steps - 1) % self.season_length]
+        return [
+            state.level[i] + steps * state.trend[i] + (season[i] if season else 0.0)
+            for i in range(len(METRIC_FIELDS))
+        ]
+
+    def predicts_breach(self, vm_id, upper, horizon_seconds):
+        # Names of the metrics forecast to exceed their upper threshold within the horizon,
+        # by more than the forecast's error (see confidence)
+        predicted = self.forecast(vm_id, horizon_seconds)
+        if predicted is None:
+            return []
+        steps = max(1, math.ceil(horizon_seconds / self.interval_seconds))
+        errors = self.states[vm_id].error
+        return [field for field, value, error in zip(METRIC_FIELDS, predicted, errors)
+                if value - self.confidence * math.sqrt(error * steps) > upper[field]]
+
+    def forget(self, vm_id):
+        self.states.pop(vm_id, None)
+
+
+class LeadTimeEstimator:
+    # Exponential moving average of how long a resize takes, fed by executor confirmations
+
+    def __init__(self, initial_seconds=300, smoothing=0.3):
+        self.seconds = initial_seconds
+        self.smoothing = smoothing
+        self.observations = 0
+
+    def observe(self, duration_seconds):
+        if self.observations == 0:
+            self.seconds = duration_seconds
+        else:
+            self.seconds = self.smoothing * duration_seconds + (1 - self.smoothing) * self.seconds
+        self.observations += 1
+        return self.seconds
@@ -0,0 +1,116 @@
+import math
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+# Order of the values stored for every datapoint
+METRIC_FIELDS = ["cpu", "memory_available", "disk_read_bytes", "network_in_bytes"]
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class MetricWindowCache:
+    # Per-VM ring buffer of recent one-minute datapoints. Each VM keeps at most
+    # retention_minutes points; anything older than the retention window (relative to
+    # the VM's newest point) is evicted on insert.
+
+    def __init__(self, retention_minutes=60, granularity_seconds=60):
+        self.retention_seconds = retention_minutes * 60
+        self.granularity_seconds = granularity_seconds
+        self.max_points = max(1, int(self.retention_seconds // granularity_seconds))
+        self.windows = {}
+
+    def last_timestamp(self, vm_id):
+        window = self.windows.get(vm_id)
+        return window[-1][0] if window else None
+
+    def query_timespan(self, vm_id, now=None):
+        # Interval to request from Azure: from the newest stored point (re-fetched, because the
+        # latest bucket may still have been filling) up to now, or the full retention window
+        # for a VM that has nothing cached yet
+        now = now or datetime.now(timezone.utc)
+        last = self.last_timestamp(vm_id)
+        if last is None:
+            start = now - timedelta(seconds=self.retention_seconds)
+        else:
+            start = max(datetime.fromtimestamp(last, timezone.utc),
+                        now - timedelta(seconds=self.retention_seconds))
+        return start, now
+
+    def add(self, vm_id, datapoints):
+        # datapoints: (epoch seconds, {metric: value}) pairs in ascending time order.
+        # Returns how many points were new (a re-fetched last point is replaced in place).
+        window = self.windows.get(vm_id)
+        if window is None:
+            window = deque(maxlen=self.max_points)
+            self.windows[vm_id] = window
+
+        added = 0
+        for timestamp, metrics in datapoints:
+            # A metric missing from a bucket keeps its previous value, and is NaN (unknown) until
+            # it has one: 0 available bytes would read as a full VM
+            previous = window[-1][1] if window else (math.nan,) * len(METRIC_FIELDS)
+            values = tuple(metrics.get(field, previous[index]) for index, field in enumerate(METRIC_FIELDS))
+            if window and timestamp < window[-1][0]:
+                continue
+            if window and timestamp == window[-1][0]:
+                window[-1] = (timestamp, values)
+                continue
+            window.append((timestamp, values))
+            added += 1
+
+        if window:
+            cutoff = window[-1][0] - self.retention_seconds
+            while window and window[0][0] <= cutoff:
+                window.popleft()
+        return added
+
+    def latest(self, vm_id):
+        window = self.windows.get(vm_id)
+        if not window:
+            return None
+        timestamp, values = window[-1]
+        return timestamp, dict(zip(METRIC_FIELDS, values))
+
+    def window(self, vm_id, minutes):
+        # Datapoints of the last `minutes` minutes, measured back from the VM's newest point
+        window = self.windows.get(vm_id)
+        if not window:
+            return []
+        cutoff = window[-1][0] - minutes * 60
+        points = []
+        for point in reversed(window):
+            if point[0] <= cutoff:
+                break
+            points.append(point)
+        points.reverse()
+        return points
+
+    def window_stats(self, vm_id, minutes):
+        # {metric: {"min", "avg", "max", "p95"}} over the last `minutes` minutes, NaN for a
+        # metric without any known value
+        points = self.window(vm_id, minutes)
+        if not points:
+            return None
+        stats = {}
+        for index, field in enumerate(METRIC_FIELDS):
+            values = sorted(point[1][index] for point in points if not math.isnan(point[1][index]))
+            if not values:
+                stats[field] = dict.fromkeys(("min", "avg", "max", "p95"), math.nan)
+                continue
+            stats[field] = {
+                "min": values[0],
+                "avg": sum(values) / len(values),
+                "max": values[-1],
+                "p95": percentile(values, 0.95)
+            }
+        stats["samples"] = len(points)
+        return stats
+
+    def forget(self, vm_id):
+        self.windows.pop(vm_id, None)
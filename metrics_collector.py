@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+import telemetry
+
+# Metrics requested for every VM (Azure Monitor platform metric names)
+METRIC_NAMES = ["Percentage CPU", "Available Memory Bytes", "Disk Read Bytes", "Network In Total"]
+METRIC_NAMESPACE = "Microsoft.Compute/virtualMachines"
+SCALE_SET_NAMESPACE = "Microsoft.Compute/virtualMachineScaleSets"  # Same metrics, averaged or summed over the instances
+MAX_BATCH_SIZE = 50  # Azure Monitor metrics:getBatch accepts at most 50 resource IDs per request
+MAX_TIMESPAN_SPREAD = timedelta(minutes=5)  # VMs whose requested intervals start further apart go in separate batches
+
+QUERY_SECONDS = telemetry.histogram("azure_monitor_query_seconds", "Azure Monitor metrics request latency")
+QUERY_TIMEOUTS = telemetry.counter("azure_monitor_query_timeouts_total", "Azure Monitor requests that timed out")
+QUERY_ERRORS = telemetry.counter("azure_monitor_query_errors_total", "Azure Monitor requests that failed")
+
+
+def metric_namespace(vm):
+    # Monitored entries marked "scale_set" are VM Scale Sets, queried as one resource
+    return SCALE_SET_NAMESPACE if vm.get("scale_set") else METRIC_NAMESPACE
+
+
+def build_resource_uri(subscription_id, resource_group, vm_name, namespace=METRIC_NAMESPACE):
+    return (f"/subscriptions/{subscription_id}/resourceGroups/{resource_group}"
+            f"/providers/{namespace}/{vm_name}")
+
+
+def region_name(location):
+    # "West Europe" -> "westeurope"
+    return location.replace(" ", "").lower()
+
+
+def batch_endpoint(location):
+    return f"https://{region_name(location)}.metrics.monitor.azure.com"
+
+
+def extract_datapoints(response):
+    # Merge the four metric series into (epoch seconds, {metric: value}) pairs in time order,
+    # using averages for gauges and totals for counters
+    fields = {
+        "Percentage CPU": ("cpu", "average"),
+        "Available Memory Bytes": ("memory_available", "average"),
+        "Disk Read Bytes": ("disk_read_bytes", "total"),
+        "Network In Total": ("network_in_bytes", "total")
+    }
+    points = {}
+    for metric in response.metrics:
+        if metric.name not in fields or not metric.timeseries:
+            continue
+        field, aggregation = fields[metric.name]
+        for value in metric.timeseries[0].data:
+            reading = getattr(value, aggregation)
+            if reading is None:
+                continue  # Bucket not populated yet
+            points.setdefault(value.timestamp.timestamp(), {})[field] = reading
+    return sorted(points.items())
+
+
+async def query_vm_metrics(metrics_client, semaphore, resource_uri, timeout, timespan=timedelta(minutes=1)):
+    # The semaphore bounds in-flight Azure requests; the timeout only covers the request itself
+    async with semaphore:
+        return await timed_query(metrics_client.query_resource(
+            resource_uri,
+            metric_names=METRIC_NAMES,
+            timespan=timespan,
+            granularity=timedelta(minutes=1)
+        ), timeout)
+
+
+async def timed_query(request, timeout):
+    # Await one Azure Monitor request, recording its latency and outcome
+    started = time.time()
+    try:
+        return await asyncio.wait_for(request, timeout=timeout)
+    except asyncio.TimeoutError:
+        QUERY_TIMEOUTS.inc()
+        raise
+    except Exception:
+        QUERY_ERRORS.inc()
+        raise
+    finally:
+        QUERY_SECONDS.observe(time.time() - started)
+
+
+async def iter_fleet_metrics(metrics_client, vms, subscription_id, resource_group,
+                             max_concurrency, timeout, timespan_for=None):
+    # Query every VM concurrently and yield (vm, datapoints, error) as each query finishes,
+    # so a slow or unreachable VM never holds back the results of the others.
+    # timespan_for(vm) picks the interval to fetch (default: the last minute).
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def collect(vm):
+        resource_uri = build_resource_uri(subscription_id, vm.get("resource_group", resource_group), vm["id"],
+                                          metric_namespace(vm))
+        timespan = timespan_for(vm) if timespan_for else timedelta(minutes=1)
+        try:
+            response = await query_vm_metrics(metrics_client, semaphore, resource_uri, timeout, timespan)
+            return vm, extract_datapoints(response), None
+        except asyncio.TimeoutError:
+            logging.warning(f"MetricsCollector: Query for {vm['id']} timed out after {timeout} seconds")
+            return vm, None, f"timed out after {timeout} seconds"
+        except Exception as e:
+            return vm, None, str(e)
+
+    tasks = [asyncio.ensure_future(collect(vm)) for vm in vms]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def group_vms_for_batch(vms, subscription_id, location):
+    # The batch API is regional and scoped to one subscription and one resource type, so VMs
+    # are grouped by all three
+    groups = {}
+    for vm in vms:
+        key = (vm.get("subscription", subscription_id), region_name(vm.get("location", location)), metric_namespace(vm))
+        groups.setdefault(key, []).append(vm)
+    return groups
+
+
+def split_batches(items, batch_size):
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    return [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+
+def match_batch_results(resource_uris, results):
+    # Batch results do not carry their resource ID directly; each metric ID is
+    # "<resource ID>/providers/Microsoft.Insights/metrics/<name>", so match on that prefix
+    # and fall back to request order when the service omits the IDs
+    by_uri = {}
+    for position, result in enumerate(results):
+        resource_uri = None
+        for metric in result.metrics:
+            if metric.id and "/providers/microsoft.insights/" in metric.id.lower():
+                resource_uri = metric.id[:metric.id.lower().index("/providers/microsoft.insights/")].lower()
+                break
+        if resource_uri is None and position < len(resource_uris):
+            resource_uri = resource_uris[position].lower()
+        if resource_uri is not None:
+            by_uri[resource_uri] = result
+    return [by_uri.get(resource_uri.lower()) for resource_uri in resource_uris]
+
+
+async def query_batch_metrics(batch_client, semaphore, resource_uris, timeout, timespan=timedelta(minutes=1),
+                              namespace=METRIC_NAMESPACE):
+    async with semaphore:
+        return await timed_query(batch_client.query_resources(
+            resource_ids=resource_uris,
+            metric_namespace=namespace,
+            metric_names=METRIC_NAMES,
+            timespan=timespan,
+            granularity=timedelta(minutes=1),
+            aggregations=["Average", "Total"]
+        ), timeout)
+
+
+def merge_timespans(timespans):
+    # One batch request covers every VM in it, so ask for the union of their intervals
+    return min(start for start, _ in timespans), max(end for _, end in timespans)
+
+
+def split_batches_by_start(vms, timespan_for, batch_size, max_spread=MAX_TIMESPAN_SPREAD):
+    # (batch, timespan) pairs. VMs are batched newest start first and a batch is closed when
+    # the next start is more than max_spread older, so a VM with nothing cached (full
+    # retention window) only widens the request of other such VMs.
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    timed = sorted(((timespan_for(vm), vm) for vm in vms), key=lambda item: item[0][0], reverse=True)
+    batches = []
+    for timespan, vm in timed:
+        if not batches or len(batches[-1]) == batch_size or batches[-1][0][0][0] - timespan[0] > max_spread:
+            batches.append([])
+        batches[-1].append((timespan, vm))
+    return [([vm for _, vm in batch], merge_timespans([timespan for timespan, _ in batch])) for batch in batches]
+
+
+async def iter_batched_fleet_metrics(get_batch_client, vms, subscription_id, resource_group, location,
+                                     batch_size, max_concurrency, timeout, timespan_for=None):
+    # Same contract as iter_fleet_metrics, but VMs sharing a subscription and region are
+    # fetched together: N VMs cost about N / batch_size requests instead of N.
+    # get_batch_client(region) returns a MetricsClient bound to that region's endpoint.
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def collect(subscription, region, namespace, batch, timespan):
+        resource_uris = [
+            build_resource_uri(subscription, vm.get("resource_group", resource_group), vm["id"], namespace)
+            for vm in batch
+        ]
+        try:
+            results = await query_batch_metrics(get_batch_client(region), semaphore, resource_uris, timeout, timespan,
+                                                namespace)
+        except asyncio.TimeoutError:
+            logging.warning(f"MetricsCollector: Batch query for {len(batch)} VMs in {region} timed out after {timeout} seconds")
+            return [(vm, None, f"timed out after {timeout} seconds") for vm in batch]
+        except Exception as e:
+            return [(vm, None, str(e)) for vm in batch]
+
+        collected = []
+        for vm, result in zip(batch, match_batch_results(resource_uris, results)):
+            if result is None:
+                collected.append((vm, None, "missing from batch response"))
+            else:
+                collected.append((vm, extract_datapoints(result), None))
+        return collected
+
+    def batches(group):
+        if timespan_for is None:
+            return [(batch, timedelta(minutes=1)) for batch in split_batches(group, batch_size)]
+        return split_batches_by_start(group, timespan_for, batch_size)
+
+    tasks = [
+        asyncio.ensure_future(collect(subscription, region, namespace, batch, timespan))
+        for (subscription, region, namespace), group in group_vms_for_batch(vms, subscription_id, location).items()
+        for batch, timespan in batches(group)
+    ]
+    try:
+        for task in asyncio.as_completed(tasks):
+            for item in await task:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,93 @@
+import base64
+import struct
+from collections import namedtuple
+
+# MonitoringAgent -> DeciderAgent metrics messages.
+#
+# A message body is the base64 text of:
+#   header  : magic "VMMT", version (uint8), record count (uint16)
+#   records : vm id length (uint8), vm id (UTF-8), sample timestamp (float64, epoch seconds),
+#             sequence number (uint32, per VM), cpu %, memory %, disk read MB, network in MB (float32)
+# All integers and floats are big-endian. Several VMs can share one message.
+# In-VM collectors stream the same bytes, without base64, in length-prefixed frames (stream_ingest.py).
+PROTOCOL_VERSION = 1
+ENCODING = f"vm-metrics/v{PROTOCOL_VERSION}"  # Value of the "encoding" message metadata
+ONTOLOGY = "vm-metrics"  # Value of the "ontology" message metadata
+RESIZE_ONTOLOGY = "vm-resize"  # ExecutorAgent -> DeciderAgent "vm_name:direction:new_size:duration_seconds" confirmations
+HEARTBEAT_ONTOLOGY = "vm-heartbeat"  # "role:jid" liveness beacons between sharded monitors and deciders (see sharding.py)
+MAX_RECORDS_PER_MESSAGE = 65535
+
+MAGIC = b"VMMT"
+HEADER = struct.Struct("!4sBH")
+RECORD = struct.Struct("!dI4f")
+
+MetricsRecord = namedtuple(
+    "MetricsRecord",
+    ["vm_id", "timestamp", "sequence", "cpu", "memory", "disk_read", "network_in"]
+)
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def encode_records(records):
+    # Message body: base64 text of pack_records (XMPP bodies are text)
+    return base64.b64encode(pack_records(records)).decode("ascii")
+
+
+def decode_records(body):
+    try:
+        data = base64.b64decode(body, validate=True)
+    except (TypeError, ValueError):
+        raise ProtocolError("Body is not base64")
+    return unpack_records(data)
+
+
+def pack_records(records):
+    if len(records) > MAX_RECORDS_PER_MESSAGE:
+        raise ProtocolError(f"Too many records for one message: {len(records)}")
+    parts = [HEADER.pack(MAGIC, PROTOCOL_VERSION, len(records))]
+    for record in records:
+        vm_id = record.vm_id.encode("utf-8")
+        if len(vm_id) > 255:
+            raise ProtocolError(f"VM id too long: {record.vm_id}")
+        parts.append(bytes([len(vm_id)]))
+        parts.append(vm_id)
+        parts.append(RECORD.pack(record.timestamp, record.sequence & 0xFFFFFFFF,
+                                 record.cpu, record.memory, record.disk_read, record.network_in))
+    return b"".join(parts)
+
+
+def unpack_records(data):
+    if len(data) < HEADER.size:
+        raise ProtocolError("Message too short")
+
+    magic, version, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ProtocolError("Not a metrics message")
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Unsupported protocol version {version}")
+
+    records = []
+    offset = HEADER.size
+    try:
+        for _ in range(count):
+            length = data[offset]
+            offset += 1
+            vm_id = data[offset:offset + length].decode("utf-8")
+            offset += length
+            values = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            records.append(MetricsRecord(vm_id, *values))
+    except (IndexError, struct.error, UnicodeDecodeError):
+        raise ProtocolError("Truncated or corrupt record")
+    if offset != len(data):
+        raise ProtocolError("Trailing bytes after last record")
+    return records
+
+
+def split_records(records, per_message):
+    # Group records into chunks that each fit in one message
+    per_message = max(1, min(per_message, MAX_RECORDS_PER_MESSAGE))
+    return [records[i:i + per_message] for i in range(0, len(records), per_message)]
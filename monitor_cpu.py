@@ -1,12 +1,66 @@
+import argparse
+import asyncio
+import socket
 import psutil
 import time
 
+MB = 1024 * 1024
+
 def get_cpu_usage():
     return psutil.cpu_percent(interval=1)
 
+class LocalSampler:
+    # CPU %, memory %, and disk read / network in as MB per minute since the previous sample,
+    # in the units the MonitoringAgent sends to the DeciderAgent
+    def __init__(self, vm_id):
+        self.vm_id = vm_id
+        psutil.cpu_percent(interval=None)  # Start the CPU measurement interval
+        self.last_time = time.monotonic()
+        self.last_disk = self.disk_read_bytes()
+        self.last_network = psutil.net_io_counters().bytes_recv
+
+    @staticmethod
+    def disk_read_bytes():
+        counters = psutil.disk_io_counters()
+        return counters.read_bytes if counters else 0
+
+    def __call__(self):
+        now = time.monotonic()
+        disk = self.disk_read_bytes()
+        network = psutil.net_io_counters().bytes_recv
+        per_minute = 60 / max(now - self.last_time, 1e-6) / MB
+        values = (
+            psutil.cpu_percent(interval=None),
+            psutil.virtual_memory().percent,
+            max(0, disk - self.last_disk) * per_minute,
+            max(0, network - self.last_network) * per_minute
+        )
+        self.last_time, self.last_disk, self.last_network = now, disk, network
+        return [(self.vm_id, values)]
+
 if __name__ == "__main__":
-    for _ in range(5):
-        cpu_usage = get_cpu_usage()
-        print(f"Utilisation CPU: {cpu_usage}%")
-        time.sleep(1)
-    print("monitor_cpu.py terminé après 5 cycles")
\ No newline at end of file
+    # Without --stream: print the CPU usage 5 times. With --stream HOST:PORT: run as the in-VM
+    # collector, streaming samples to the MonitoringAgent (STREAM_INGEST_PORT) until stopped.
+    parser = argparse.ArgumentParser(description="Local CPU monitoring / in-VM metrics collector")
+    parser.add_argument("--stream", metavar="HOST:PORT", help="MonitoringAgent stream ingestion address")
+    parser.add_argument("--vm-id", default=socket.gethostname(), help="Azure VM name (default: host name)")
+    parser.add_argument("--sample-seconds", type=float, default=1.0)
+    parser.add_argument("--send-seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    if args.stream:
+        from stream_ingest import StreamingCollector
+
+        host, port = args.stream.rsplit(":", 1)
+        collector = StreamingCollector(host, int(port), LocalSampler(args.vm_id), args.sample_seconds, args.send_seconds)
+        print(f"Streaming metrics for {args.vm_id} to {args.stream} every {args.send_seconds}s")
+        try:
+            asyncio.run(collector.run())
+        except KeyboardInterrupt:
+            pass
+    else:
+        for _ in range(5):
+            cpu_usage = get_cpu_usage()
+            print(f"Utilisation CPU: {cpu_usage}%")
+            time.sleep(1)
+        print("monitor_cpu.py terminé après 5 cycles")
\ No newline at end of file
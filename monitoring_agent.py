@@ -2,11 +2,21 @@
 import spade
 from spade.agent import Agent
 from spade.behaviour import CyclicBehaviour
-from azure.identity import DefaultAzureCredential
-from azure.monitor.query import MetricsQueryClient
-from azure.mgmt.compute import ComputeManagementClient
+from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
+from azure.monitor.query.aio import MetricsClient, MetricsQueryClient
+from azure.mgmt.compute.aio import ComputeManagementClient
 import logging
 import asyncio
+import sys
+import time
+import uuid
+import telemetry
+from metrics_collector import batch_endpoint, iter_batched_fleet_metrics, iter_fleet_metrics, region_name
+from metric_cache import MetricWindowCache
+from metrics_protocol import ENCODING, ONTOLOGY, MetricsRecord, encode_records, split_records
+from sharding import DECIDER, MONITOR, HeartbeatBehaviour, ShardGroup, heartbeat_template
+from stream_ingest import StreamIngestServer
+from vm_inventory import VMInventory
 
 # Configure logging
 logging.basicConfig(
@@ -20,113 +30,348 @@ MONITORING_INTERVAL_SECONDS = 60  # Interval for monitoring (already set as requ
 SUBSCRIPTION_ID = "a77851f8-c146-41d3-8a76-2708eed4632a"  # From your Azure account
 RESOURCE_GROUP = "SMA-Cloud-Project"
 LOCATION = "West Europe"
+MAX_CONCURRENT_QUERIES = 50  # Upper bound on in-flight Azure Monitor requests per sweep
+QUERY_TIMEOUT_SECONDS = 30  # A VM whose query takes longer is reported as failed for this cycle
+BATCH_METRICS_QUERIES = True  # Use the metrics:getBatch API (one request per METRICS_BATCH_SIZE VMs)
+METRICS_BATCH_SIZE = 50  # VMs per batch request (Azure Monitor allows at most 50)
+METRIC_RETENTION_MINUTES = 60  # Datapoints kept per VM; each cycle only fetches what is newer
+METRIC_WINDOW_MINUTES = 5  # Lookback used for the min/avg/max/p95 window summary
+METRICS_PER_MESSAGE = 200  # VMs packed into one XMPP message to the DeciderAgent
+INVENTORY_PATH = "vm_inventory.json"  # VM sizes and SKU catalog shared with the other agents
+INVENTORY_TTL_SECONDS = 300  # VMs are listed again (one call per resource group) after this long
+SKU_CATALOG_TTL_SECONDS = 86400  # SKU capacities and prices are listed again (one call per region) after this long
+FETCH_RETAIL_PRICES = True  # Fill SKU prices from the public Azure Retail Prices API
+PER_VM_CONSOLE_OUTPUT = True  # Print a line per VM per cycle (turn off for large fleets; the log is unaffected)
+METRICS_PORT = 9101  # Serve counters and histograms on http://127.0.0.1:9101/metrics (None to disable)
 
-# List of VMs to monitor (consistent with your other scripts)
+# Sharding (opt-in): split VMS between several MonitoringAgents, and route each VM's metrics
+# to one of several DeciderAgents, by consistent hashing over the instances that are alive
+SHARDING = False
+DECIDER_JID = "deciderilyas@jabber.fr"  # The only decider when not sharding
+MONITOR_JIDS = ["monitorilyas@jabber.fr"]  # Known monitor instances (others may join by heartbeat)
+DECIDER_JIDS = ["deciderilyas@jabber.fr"]  # Known decider instances
+HEARTBEAT_INTERVAL_SECONDS = 15  # How often each instance announces itself
+HEARTBEAT_TIMEOUT_SECONDS = 45  # An instance silent for this long leaves the ring
+
+# Streaming ingestion (opt-in): in-VM collectors (monitor_cpu.py --stream) push samples every
+# few seconds; Azure Monitor is still polled for VMs without a recent stream
+STREAM_INGEST_PORT = None  # TCP port for collector connections (e.g. 9200), None to disable
+STREAM_INGEST_HOST = "127.0.0.1"  # Collectors are not authenticated: use the monitor's private (VNet) address, never a public one
+# Streamed samples are averaged and sent to the DeciderAgent this often. The decider's windows
+# count samples and its forecaster steps are FORECAST_INTERVAL_SECONDS long, so keep the two equal.
+STREAM_FORWARD_INTERVAL_SECONDS = 60
+STREAM_STALE_SECONDS = 30  # A VM not streamed for this long is polled from Azure Monitor again
+
+# List of VMs to monitor (consistent with your other scripts). A VM Scale Set is monitored
+# as one entry with "scale_set": True (also set from the inventory once it is listed); its
+# metrics are reported per instance.
 VMS = [
     {"id": "vm-initiale", "size": None},  # Size will be fetched dynamically
     {"id": "vm-secondary", "size": None}
 ]
 
-# VM size to memory mapping (in GB)
+# VM size to memory mapping (in GB), used only for sizes missing from the SKU catalog
 VM_MEMORY_MAP = {
     "Standard_B1s": 1,    # 1 GB
     "Standard_B2s": 4,    # 4 GB
     "Standard_B4ms": 16   # 16 GB
 }
 
+# Telemetry
+SWEEP_SECONDS = telemetry.histogram("monitor_sweep_seconds", "Time to collect and send metrics for every VM")
+COLLECTION_FAILURES = telemetry.counter("monitor_collection_failures_total", "VMs whose metrics could not be collected")
+MESSAGES_SENT = telemetry.counter("monitor_messages_sent_total", "Metrics messages sent to the DeciderAgent")
+SEND_FAILURES = telemetry.counter("monitor_send_failures_total", "Metrics messages that could not be sent")
+STREAMED_RECORDS = telemetry.counter("monitor_streamed_records_total", "Records from in-VM collectors forwarded to the DeciderAgent")
+STREAM_SAMPLE_AGE = telemetry.histogram("monitor_stream_sample_age_seconds", "Age of a streamed sample when it is forwarded")
+
+def console(message):
+    # Per-VM console output, skipped when PER_VM_CONSOLE_OUTPUT is off
+    if PER_VM_CONSOLE_OUTPUT:
+        print(message)
+
 # Azure clients
-credential = DefaultAzureCredential()
-metrics_client = MetricsQueryClient(credential)
-compute_client = ComputeManagementClient(credential, SUBSCRIPTION_ID)
+metrics_credential = AsyncDefaultAzureCredential()
+metrics_client = MetricsQueryClient(metrics_credential)
+metrics_batch_clients = {}  # One regional batch client per region, created on first use
+compute_clients = {}  # One async compute client per subscription, used for inventory listings
+
+def get_metrics_batch_client(region):
+    if region not in metrics_batch_clients:
+        metrics_batch_clients[region] = MetricsClient(batch_endpoint(region), metrics_credential)
+    return metrics_batch_clients[region]
+
+def get_compute_client(subscription):
+    if subscription not in compute_clients:
+        compute_clients[subscription] = ComputeManagementClient(metrics_credential, subscription)
+    return compute_clients[subscription]
+
+# VM sizes and the SKU catalog, listed in bulk and shared with the other agents
+inventory = VMInventory(INVENTORY_PATH, INVENTORY_TTL_SECONDS, SKU_CATALOG_TTL_SECONDS)
+
+def inventory_scope():
+    # (subscription, resource group) pairs and (subscription, region) pairs of the monitored VMs
+    groups = {(vm.get("subscription", SUBSCRIPTION_ID), vm.get("resource_group", RESOURCE_GROUP)) for vm in VMS}
+    regions = {(vm.get("subscription", SUBSCRIPTION_ID), region_name(vm.get("location", LOCATION))) for vm in VMS}
+    return sorted(groups), sorted(regions)
+
+def total_memory_bytes(vm_size):
+    # Memory of the SKU from the catalog, else from VM_MEMORY_MAP, else None (unknown)
+    memory = inventory.memory_bytes(vm_size)
+    if memory is None and vm_size in VM_MEMORY_MAP:
+        memory = VM_MEMORY_MAP[vm_size] * 1024 * 1024 * 1024  # Convert GB to bytes
+    return memory
+
+# Recent datapoints per VM, shared with later stages through MonitoringAgent.metric_cache
+metric_cache = MetricWindowCache(retention_minutes=METRIC_RETENTION_MINUTES)
+
+def query_timespan(vm):
+    return metric_cache.query_timespan(vm["id"])
+
+# Per-VM message sequence numbers, so the DeciderAgent can spot gaps and stale data
+sequence_numbers = {}
+
+def next_sequence(vm_name):
+    sequence_numbers[vm_name] = (sequence_numbers.get(vm_name, 0) + 1) & 0xFFFFFFFF
+    return sequence_numbers[vm_name]
 
 class MonitoringAgent(Agent):
     class MonitorBehaviour(CyclicBehaviour):
         async def on_start(self):
-            # Fetch VM sizes dynamically at startup
+            # Fetch VM sizes dynamically at startup (one list call per resource group)
+            await self.refresh_inventory()
             for vm in VMS:
-                try:
-                    vm_info = compute_client.virtual_machines.get(RESOURCE_GROUP, vm["id"])
-                    vm["size"] = vm_info.hardware_profile.vm_size
-                    print(f"MonitoringAgent: Detected size for {vm['id']}: {vm['size']}")
-                    logging.info(f"MonitoringAgent: Detected size for {vm['id']}: {vm['size']}")
-                except Exception as e:
-                    print(f"MonitoringAgent: Failed to fetch size for {vm['id']}: {str(e)}")
-                    logging.error(f"MonitoringAgent: Failed to fetch size for {vm['id']}: {str(e)}")
+                if vm["size"] is None:
+                    console(f"MonitoringAgent: Failed to fetch size for {vm['id']}: not found in inventory")
+                    logging.error(f"MonitoringAgent: Failed to fetch size for {vm['id']}: not found in inventory")
                     vm["size"] = "Standard_B1s"  # Fallback to default
+                else:
+                    console(f"MonitoringAgent: Detected size for {vm['id']}: {vm['size']}")
+                    logging.info(f"MonitoringAgent: Detected size for {vm['id']}: {vm['size']}")
 
-        async def run(self):
+        async def refresh_inventory(self):
+            # Re-list VMs and SKUs once their TTL has expired (or pick up the snapshot another
+            # agent wrote) and copy the current sizes, which change when the executor resizes
+            try:
+                groups, regions = inventory_scope()
+                await inventory.refresh_if_stale(get_compute_client, groups, regions, FETCH_RETAIL_PRICES)
+            except Exception as e:
+                print(f"MonitoringAgent: Failed to refresh VM inventory: {str(e)}")
+                logging.error(f"MonitoringAgent: Failed to refresh VM inventory: {str(e)}")
             for vm in VMS:
+                vm["size"] = inventory.size_of(vm["id"]) or vm["size"]
+                if inventory.capacity_of(vm["id"]) is not None:
+                    vm["scale_set"] = True
+
+        async def run(self):
+            await self.refresh_inventory()
+            vms = self.agent.polled_vms()
+            print(f"MonitoringAgent: Collecting metrics for {len(vms)} VMs in {RESOURCE_GROUP} ({LOCATION}) "
+                  f"(up to {MAX_CONCURRENT_QUERIES} concurrent queries)...")
+            logging.info(f"MonitoringAgent: Collecting metrics for {len(vms)} VMs in {RESOURCE_GROUP} ({LOCATION}) "
+                         f"(up to {MAX_CONCURRENT_QUERIES} concurrent queries)")
+
+            # Fan out the queries (batched per subscription and region, or one per VM)
+            # and handle each VM's result as soon as it arrives
+            sweep_started = time.time()
+            if BATCH_METRICS_QUERIES:
+                results = iter_batched_fleet_metrics(
+                    get_metrics_batch_client, vms, SUBSCRIPTION_ID, RESOURCE_GROUP, LOCATION,
+                    METRICS_BATCH_SIZE, MAX_CONCURRENT_QUERIES, QUERY_TIMEOUT_SECONDS,
+                    timespan_for=query_timespan)
+            else:
+                results = iter_fleet_metrics(
+                    metrics_client, vms, SUBSCRIPTION_ID, RESOURCE_GROUP,
+                    MAX_CONCURRENT_QUERIES, QUERY_TIMEOUT_SECONDS,
+                    timespan_for=query_timespan)
+
+            pending = []  # Records waiting to be packed into the next message
+            async for vm, datapoints, error in results:
                 vm_name = vm["id"]
                 vm_size = vm["size"]
-                print(f"MonitoringAgent: Running on Azure {vm_name} (Size: {vm_size}) in {RESOURCE_GROUP} ({LOCATION})...")
-                logging.info(f"MonitoringAgent: Running on Azure {vm_name} (Size: {vm_size}) in {RESOURCE_GROUP} ({LOCATION})")
-                
-                print(f"MonitoringAgent: Collecting metrics for {vm_name} (CPU, memory, disk, and network)...")
-                logging.info(f"MonitoringAgent: Collecting metrics for {vm_name} (CPU, memory, disk, and network)")
-                
+                if error is not None:
+                    COLLECTION_FAILURES.inc()
+                    console(f"MonitoringAgent: Failed to collect metrics for {vm_name}: {error}")
+                    logging.error(f"MonitoringAgent: Failed to collect metrics for {vm_name}: {error}")
+                    continue
+
+                # Only the interval since the last stored datapoint was fetched
+                if metric_cache.add(vm_name, datapoints) == 0:
+                    console(f"MonitoringAgent: No new datapoints for {vm_name} yet.")
+                    logging.info(f"MonitoringAgent: No new datapoints for {vm_name} yet")
+                    continue
+
                 try:
-                    # Construct resource URI
-                    resource_uri = f"/subscriptions/{SUBSCRIPTION_ID}/resourceGroups/{RESOURCE_GROUP}/providers/Microsoft.Compute/virtualMachines/{vm_name}"
-
-                    # Query multiple metrics at once
-                    response = metrics_client.query_resource(
-                        resource_uri=resource_uri,
-                        metric_names=["Percentage CPU", "Available Memory Bytes", "Disk Read Bytes", "Network In Total"],
-                        timespan="PT1M"  # Last 1 minute
-                    )
-
-                    # Extract metrics
-                    cpu_usage = 0.0
-                    memory_available = 0.0
-                    disk_read_bytes = 0.0
-                    network_in_bytes = 0.0
-
-                    for metric in response.metrics:
-                        if metric.name.value == "Percentage CPU":
-                            cpu_usage = metric.timeseries[0].data[-1].average if metric.timeseries else 0.0
-                        elif metric.name.value == "Available Memory Bytes":
-                            memory_available = metric.timeseries[0].data[-1].average if metric.timeseries else 0.0
-                        elif metric.name.value == "Disk Read Bytes":
-                            disk_read_bytes = metric.timeseries[0].data[-1].total if metric.timeseries else 0.0
-                        elif metric.name.value == "Network In Total":
-                            network_in_bytes = metric.timeseries[0].data[-1].total if metric.timeseries else 0.0
-
-                    # Calculate memory usage percentage
-                    total_memory = VM_MEMORY_MAP.get(vm_size, 1) * 1024 * 1024 * 1024  # Convert GB to bytes
-                    memory_usage = ((total_memory - memory_available) / total_memory) * 100 if total_memory > 0 else 0.0
-
-                    # Convert disk and network bytes to MB for readability
-                    disk_read_mb = disk_read_bytes / (1024 * 1024) if disk_read_bytes else 0.0
-                    network_in_mb = network_in_bytes / (1024 * 1024) if network_in_bytes else 0.0
-
-                    print(f"MonitoringAgent: {vm_name} - CPU Usage = {cpu_usage:.2f}%")
-                    print(f"MonitoringAgent: {vm_name} - Memory Usage = {memory_usage:.2f}% (Available: {memory_available / (1024*1024):.2f} MB)")
-                    print(f"MonitoringAgent: {vm_name} - Disk Read = {disk_read_mb:.2f} MB")
-                    print(f"MonitoringAgent: {vm_name} - Network In = {network_in_mb:.2f} MB")
+                    sample_time, metrics = metric_cache.latest(vm_name)
+                    cpu_usage = metrics["cpu"]
+                    memory_available = metrics["memory_available"]
+                    disk_read_bytes = metrics["disk_read_bytes"]
+                    network_in_bytes = metrics["network_in_bytes"]
+
+                    # Calculate memory usage percentage against the SKU's memory; NaN when the size
+                    # is in neither the catalog nor VM_MEMORY_MAP (the DeciderAgent then decides on
+                    # the other metrics and never scales the VM down)
+                    total_memory = total_memory_bytes(vm_size)
+                    if total_memory:
+                        memory_usage = ((total_memory - memory_available) / total_memory) * 100
+                    else:
+                        memory_usage = float("nan")
+                        logging.warning(f"MonitoringAgent: {vm_name} - Unknown memory size for {vm_size}")
+
+                    # Convert disk and network bytes to MB for readability; a scale set's totals
+                    # cover all its instances, so they are divided by its instance count
+                    instances = inventory.capacity_of(vm_name) or 1
+                    disk_read_mb = disk_read_bytes / (1024 * 1024) / instances if disk_read_bytes else 0.0
+                    network_in_mb = network_in_bytes / (1024 * 1024) / instances if network_in_bytes else 0.0
+
+                    console(f"MonitoringAgent: {vm_name} (Size: {vm_size}) - CPU Usage = {cpu_usage:.2f}%")
+                    console(f"MonitoringAgent: {vm_name} - Memory Usage = {memory_usage:.2f}% (Available: {memory_available / (1024*1024):.2f} MB)")
+                    console(f"MonitoringAgent: {vm_name} - Disk Read = {disk_read_mb:.2f} MB")
+                    console(f"MonitoringAgent: {vm_name} - Network In = {network_in_mb:.2f} MB")
                     logging.info(f"MonitoringAgent: {vm_name} - CPU Usage = {cpu_usage:.2f}%, Memory Usage = {memory_usage:.2f}%, Disk Read = {disk_read_mb:.2f} MB, Network In = {network_in_mb:.2f} MB")
 
-                    # Send metrics to DeciderAgent via XMPP
-                    msg = spade.message.Message(
-                        to="deciderilyas@jabber.fr",
-                        body=f"cpu:{cpu_usage},memory:{memory_usage},disk_read:{disk_read_mb},network_in:{network_in_mb}"
-                    )
-                    await self.send(msg)
-                    print(f"MonitoringAgent: Sent metrics for {vm_name} to DeciderAgent.")
-                    logging.info(f"MonitoringAgent: Sent metrics for {vm_name} to DeciderAgent")
+                    window = metric_cache.window_stats(vm_name, METRIC_WINDOW_MINUTES)
+                    logging.info(f"MonitoringAgent: {vm_name} - Last {METRIC_WINDOW_MINUTES} min ({window['samples']} samples): "
+                                 f"CPU min/avg/max/p95 = {window['cpu']['min']:.2f}/{window['cpu']['avg']:.2f}/"
+                                 f"{window['cpu']['max']:.2f}/{window['cpu']['p95']:.2f}%")
+
+                    pending.append(MetricsRecord(
+                        vm_name, sample_time, next_sequence(vm_name),
+                        cpu_usage, memory_usage, disk_read_mb, network_in_mb
+                    ))
+                    if len(pending) >= METRICS_PER_MESSAGE:
+                        await self.send_metrics(pending)
+                        pending = []
 
                 except Exception as e:
-                    print(f"MonitoringAgent: Failed to collect metrics for {vm_name}: {str(e)}")
-                    logging.error(f"MonitoringAgent: Failed to collect metrics for {vm_name}: {str(e)}")
+                    console(f"MonitoringAgent: Failed to process metrics for {vm_name}: {str(e)}")
+                    logging.error(f"MonitoringAgent: Failed to process metrics for {vm_name}: {str(e)}")
+
+            if pending:
+                await self.send_metrics(pending)
+            SWEEP_SECONDS.observe(time.time() - sweep_started)
 
             await asyncio.sleep(MONITORING_INTERVAL_SECONDS)
 
+        async def send_metrics(self, records):
+            # Send a batch of VM metrics to the DeciderAgent owning each VM
+            if self.agent.deciders is None:
+                await self.send_to_decider(DECIDER_JID, records)
+                return
+            routed = {}
+            for record in records:
+                routed.setdefault(self.agent.deciders.owner(record.vm_id), []).append(record)
+            for decider, decider_records in routed.items():
+                if decider is None:
+                    SEND_FAILURES.inc()
+                    logging.error(f"MonitoringAgent: No live DeciderAgent for {len(decider_records)} VMs, dropping their metrics")
+                    continue
+                await self.send_to_decider(decider, decider_records)
+
+        async def send_to_decider(self, decider, records):
+            # Send one batch of VM metrics to a DeciderAgent via XMPP, tagged with a trace id
+            # that the DeciderAgent and ExecutorAgent carry forward
+            trace_id = uuid.uuid4().hex[:16]
+            try:
+                msg = spade.message.Message(
+                    to=decider,
+                    body=encode_records(records)
+                )
+                msg.set_metadata("ontology", ONTOLOGY)
+                msg.set_metadata("encoding", ENCODING)
+                msg.set_metadata(telemetry.TRACE_ID, trace_id)
+                msg.set_metadata(telemetry.SENT_AT, f"{time.time():.3f}")
+                await self.send(msg)
+                MESSAGES_SENT.inc()
+                print(f"MonitoringAgent: Sent metrics for {len(records)} VMs to DeciderAgent.")
+                logging.info(f"MonitoringAgent: Sent metrics for {len(records)} VMs to {decider} [trace {trace_id}] "
+                             f"({', '.join(record.vm_id for record in records[:5])}{', ...' if len(records) > 5 else ''})")
+            except Exception as e:
+                SEND_FAILURES.inc()
+                print(f"MonitoringAgent: Failed to send metrics for {len(records)} VMs: {str(e)}")
+                logging.error(f"MonitoringAgent: Failed to send metrics for {len(records)} VMs: {str(e)}")
+
+        async def on_end(self):
+            # Release the async Azure clients and their credential
+            await metrics_client.close()
+            for batch_client in metrics_batch_clients.values():
+                await batch_client.close()
+            for client in compute_clients.values():
+                await client.close()
+            await metrics_credential.close()
+            if self.agent.metrics_server is not None:
+                await self.agent.metrics_server.cleanup()
+
+    class StreamBehaviour(MonitorBehaviour):
+        # Forwards the samples pushed by in-VM collectors every STREAM_FORWARD_INTERVAL_SECONDS,
+        # averaged per VM since the previous forward (sending as MonitorBehaviour does). Forwards
+        # fall on interval boundaries, so each record covers one whole interval.
+        async def on_start(self):
+            pass
+
+        async def run(self):
+            await asyncio.sleep(STREAM_FORWARD_INTERVAL_SECONDS - time.time() % STREAM_FORWARD_INTERVAL_SECONDS)
+            now = time.time()
+            records = []
+            for record in self.agent.stream_server.drain():
+                # With sharding, only the VM's owner forwards it (others leave it to Azure polling there)
+                if self.agent.shards is not None and not self.agent.shards.owns(record.vm_id):
+                    continue
+                STREAM_SAMPLE_AGE.observe(max(0.0, now - record.timestamp))
+                records.append(record._replace(sequence=next_sequence(record.vm_id)))
+            STREAMED_RECORDS.inc(len(records))
+            for chunk in split_records(records, METRICS_PER_MESSAGE):
+                await self.send_metrics(chunk)
+
+        async def on_end(self):
+            await self.agent.stream_server.close()
+
     async def setup(self):
-        self.add_behaviour(self.MonitorBehaviour())
+        self.metric_cache = metric_cache
+        self.inventory = inventory
+        self.metrics_server = None
+        if METRICS_PORT:
+            try:
+                self.metrics_server = await telemetry.start_metrics_server(METRICS_PORT)
+            except OSError as e:
+                logging.error(f"MonitoringAgent: Could not serve metrics on port {METRICS_PORT}: {str(e)}")
+        self.shards = None  # This monitor's ring (None when not sharding)
+        self.deciders = None  # The deciders' ring, to route metrics by VM
+        if SHARDING:
+            self.shards = ShardGroup(MONITOR, MONITOR_JIDS, str(self.jid), HEARTBEAT_TIMEOUT_SECONDS)
+            self.deciders = ShardGroup(DECIDER, DECIDER_JIDS, timeout_seconds=HEARTBEAT_TIMEOUT_SECONDS)
+            self.add_behaviour(HeartbeatBehaviour(MONITOR, {MONITOR: self.shards, DECIDER: self.deciders},
+                                                  HEARTBEAT_INTERVAL_SECONDS), heartbeat_template())
+        self.add_behaviour(self.MonitorBehaviour(), ~heartbeat_template())
+        self.stream_server = None
+        if STREAM_INGEST_PORT is not None:
+            monitored = {vm["id"] for vm in VMS}
+            server = StreamIngestServer(STREAM_INGEST_HOST, STREAM_INGEST_PORT, accepts=monitored.__contains__)
+            try:
+                await server.start()
+                self.stream_server = server
+                self.add_behaviour(self.StreamBehaviour(), ~heartbeat_template())
+            except OSError as e:
+                print(f"MonitoringAgent: Could not accept collectors on port {STREAM_INGEST_PORT}: {str(e)}")
+                logging.error(f"MonitoringAgent: Could not accept collectors on port {STREAM_INGEST_PORT}: {str(e)}")
+
+    def polled_vms(self):
+        # Owned VMs without a recent stream from an in-VM collector, polled from Azure Monitor
+        vms = self.owned_vms()
+        if self.stream_server is None:
+            return vms
+        return [vm for vm in vms if not self.stream_server.is_fresh(vm["id"], STREAM_STALE_SECONDS)]
+
+    def owned_vms(self):
+        # This instance's share of VMS (all of them when not sharding)
+        if self.shards is None:
+            return VMS
+        return [vm for vm in VMS if self.shards.owns(vm["id"])]
 
 if __name__ == "__main__":
-    # XMPP configuration
-    jid = "monitorilyas@jabber.fr"
-    password = "monitor123"
+    # XMPP configuration (another instance's JID and password can be given on the command line)
+    jid = sys.argv[1] if len(sys.argv) > 2 else "monitorilyas@jabber.fr"
+    password = sys.argv[2] if len(sys.argv) > 2 else "monitor123"
 
     # Create and run the MonitoringAgent
     agent = MonitoringAgent(jid, password)
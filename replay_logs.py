@@ -0,0 +1,194 @@
+import argparse
+import random
+import re
+from datetime import datetime
+from decision_engine import DecisionEngine
+from decider_agent import (FORECAST_CONFIDENCE, FORECAST_MARGIN_SECONDS, RESIZE_LEAD_TIME_SECONDS,
+                           SCALE_DOWN_COOLDOWN_SECONDS, SCALE_DOWN_WINDOW, SCALE_UP_COOLDOWN_SECONDS,
+                           SCALE_UP_WINDOW, THRESHOLDS, VERTICAL_SIZES, policy_decision)
+from forecaster import TrendForecaster
+from metrics_protocol import MetricsRecord
+from scaling_policy import ScalingPolicy
+
+# Replays recorded agent logs through the decision logic offline and counts the resizes
+# the executor would have performed, with and without the anti-flapping policy. Thresholds,
+# policy defaults and the size ladder are the agents' own; nothing is sent or resized.
+#
+#   python replay_logs.py                       # monitoring_agent.log
+#   python replay_logs.py decider_agent.log --up-window 2 5 --up-cooldown 120
+#   python replay_logs.py --synthetic-ramp 20 --predictive   # forecast-driven scale-up on a ramp
+
+# The older logs report available memory in MB rather than a usage percentage; usage is
+# derived against this total (the largest value seen in the recorded runs is ~5.9 GB)
+REPLAY_MEMORY_TOTAL_MB = 6144
+
+# "vm-x - CPU Usage = 6.30%, Memory Available = 5875.88 MB, Disk Usage = 68.15%, Network Sent = 5.00 MB, Received = 42.49 MB"
+# (MonitoringAgent) or "Received data for vm-x: CPU Usage = ..." (DeciderAgent), as in the recorded logs
+LEGACY_PATTERN = re.compile(
+    r"^(?P<time>\S+ \S+) - \w+ - \w+Agent: (?:Received data for )?(?P<vm>[\w.-]+?):? (?:- )?"
+    r"CPU Usage = (?P<cpu>-?[\d.]+)%, Memory Available = (?P<memory_available>[\d.]+) MB, "
+    r"Disk Usage = [\d.]+%, Network Sent = [\d.]+ MB, Received = (?P<network_in>[\d.]+) MB"
+)
+# "vm-x - CPU Usage = 6.30%, Memory Usage = 40.00%, Disk Read = 1.00 MB, Network In = 42.49 MB"
+# (current MonitoringAgent format)
+CURRENT_PATTERN = re.compile(
+    r"^(?P<time>\S+ \S+) - \w+ - MonitoringAgent: (?P<vm>[\w.-]+) - "
+    r"CPU Usage = (?P<cpu>-?[\d.]+)%, Memory Usage = (?P<memory>-?[\d.]+)%, "
+    r"Disk Read = (?P<disk_read>[\d.]+) MB, Network In = (?P<network_in>[\d.]+) MB"
+)
+
+
+def parse_line(line):
+    match = CURRENT_PATTERN.match(line)
+    if match:
+        memory = float(match["memory"])
+        disk_read = float(match["disk_read"])
+    else:
+        match = LEGACY_PATTERN.match(line)
+        if not match:
+            return None
+        memory = max(0.0, 100 * (1 - float(match["memory_available"]) / REPLAY_MEMORY_TOTAL_MB))
+        disk_read = 0.0  # Only disk capacity usage was recorded, not read volume
+    timestamp = datetime.strptime(match["time"], "%Y-%m-%d %H:%M:%S,%f").timestamp()
+    return timestamp, match["vm"], {
+        "cpu": float(match["cpu"]),
+        "memory": memory,
+        "disk_read": disk_read,
+        "network_in": float(match["network_in"])
+    }
+
+
+def load_samples(paths):
+    samples = []
+    for path in paths:
+        with open(path, encoding="utf-8") as log_file:
+            for line in log_file:
+                sample = parse_line(line)
+                if sample:
+                    samples.append(sample)
+    samples.sort(key=lambda sample: sample[0])
+    return samples
+
+
+def synthetic_ramp(vm_count, minutes=60, seed=7):
+    # Flat load around 30% CPU, then for each VM a linear ramp starting at a random minute
+    # with a random slope, with noise on top; one sample per VM per minute
+    rng = random.Random(seed)
+    start = datetime(2025, 5, 21, 16, 0).timestamp()
+    samples = []
+    for i in range(vm_count):
+        ramp_start = rng.randint(10, minutes // 2)
+        slope = rng.uniform(1.5, 5.0)  # CPU percentage points per minute
+        for minute in range(minutes):
+            cpu = 30 + max(0, minute - ramp_start) * slope + rng.gauss(0, 2)
+            samples.append((start + minute * 60, f"vm-{i:03d}", {
+                "cpu": min(100.0, max(0.0, cpu)),
+                "memory": 45 + rng.gauss(0, 2),
+                "disk_read": 15 + rng.gauss(0, 1),
+                "network_in": 150 + rng.gauss(0, 10)
+            }))
+    samples.sort(key=lambda sample: sample[0])
+    return samples
+
+
+def replay(samples, policy=None, forecaster=None, lead_time_seconds=RESIZE_LEAD_TIME_SECONDS):
+    # Returns (number of resizes, {vm: [(timestamp, action, new size)]}, {vm: first breach time}).
+    # Without a policy every per-sample decision is acted on; with one, decisions go through
+    # policy_decision and restart the cooldown as in the DeciderAgent (forecaster needs a policy).
+    engine = DecisionEngine(THRESHOLDS)
+    sequences = {}
+    sizes = {}
+    actions = {}
+    breaches = {}
+    resizes = 0
+    horizon = lead_time_seconds + FORECAST_MARGIN_SECONDS
+    for timestamp, vm_id, metrics in samples:
+        sequences[vm_id] = sequences.get(vm_id, 0) + 1
+        state = engine.ingest(MetricsRecord(
+            vm_id, timestamp, sequences[vm_id],
+            metrics["cpu"], metrics["memory"], metrics["disk_read"], metrics["network_in"]
+        ))
+        if state is None:
+            continue
+        decision = engine.evaluate_batch([state])[0]
+        if decision == "scale_up":
+            breaches.setdefault(vm_id, timestamp)
+        if policy is not None:
+            decision, _ = policy_decision(policy, forecaster, engine, state, decision, timestamp, horizon)
+            if decision != "no_action":
+                policy.record_resize(vm_id, decision, timestamp)
+
+        # The executor walks its VM_SIZES ladder (VERTICAL_SIZES) and ignores decisions past either end
+        index = sizes.get(vm_id, 0)
+        if decision == "scale_up" and index < len(VERTICAL_SIZES) - 1:
+            index += 1
+        elif decision == "scale_down" and index > 0:
+            index -= 1
+        else:
+            continue
+        sizes[vm_id] = index
+        resizes += 1
+        actions.setdefault(vm_id, []).append((timestamp, decision, VERTICAL_SIZES[index]))
+    return resizes, actions, breaches
+
+
+def print_actions(title, resizes, actions):
+    print(f"{title}: {resizes} resizes")
+    for vm_id, vm_actions in sorted(actions.items()):
+        steps = ", ".join(f"{datetime.fromtimestamp(t):%H:%M} {a} -> {size}" for t, a, size in vm_actions)
+        print(f"  {vm_id}: {steps}")
+
+
+def print_lead(title, actions, breaches):
+    # How long before (positive) or after (negative) the first threshold breach each VM got
+    # its first scale-up; a resize started `lead` seconds early is done in time if lead >= lead time
+    leads = []
+    for vm_id, breach_time in breaches.items():
+        first_up = next((t for t, action, _ in actions.get(vm_id, []) if action == "scale_up"), None)
+        if first_up is not None:
+            leads.append(breach_time - first_up)
+    if not leads:
+        print(f"{title}: no scale-up before or after a breach")
+        return
+    leads.sort()
+    print(f"{title}: first scale-up {sum(leads) / len(leads):+.0f}s relative to breach on average "
+          f"(min {leads[0]:+.0f}s, max {leads[-1]:+.0f}s, {len(leads)}/{len(breaches)} VMs)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded agent logs through the DeciderAgent logic")
+    parser.add_argument("logs", nargs="*", default=["monitoring_agent.log"])
+    parser.add_argument("--up-window", nargs=2, type=int, default=SCALE_UP_WINDOW, metavar=("K", "N"))
+    parser.add_argument("--down-window", nargs=2, type=int, default=SCALE_DOWN_WINDOW, metavar=("K", "N"))
+    parser.add_argument("--up-cooldown", type=float, default=SCALE_UP_COOLDOWN_SECONDS)
+    parser.add_argument("--down-cooldown", type=float, default=SCALE_DOWN_COOLDOWN_SECONDS)
+    parser.add_argument("--predictive", action="store_true", help="also replay with forecast-driven scale-up")
+    parser.add_argument("--lead-time", type=float, default=RESIZE_LEAD_TIME_SECONDS, help="resize lead time (seconds)")
+    parser.add_argument("--season-length", type=int, default=0, help="forecast season length (samples)")
+    parser.add_argument("--synthetic-ramp", type=int, metavar="VMS", help="replay a synthetic ramp instead of logs")
+    args = parser.parse_args()
+
+    if args.synthetic_ramp:
+        samples = synthetic_ramp(args.synthetic_ramp)
+        source = "a synthetic ramp"
+    else:
+        samples = load_samples(args.logs)
+        source = ", ".join(args.logs)
+    print(f"Replaying {len(samples)} samples for {len({vm for _, vm, _ in samples})} VMs from {source}")
+
+    def new_policy():
+        return ScalingPolicy(tuple(args.up_window), tuple(args.down_window), args.up_cooldown, args.down_cooldown)
+
+    baseline, baseline_actions, breaches = replay(samples)
+    damped, damped_actions, _ = replay(samples, new_policy())
+
+    print_actions("Single-sample thresholds", baseline, baseline_actions)
+    print_actions("Sustained breaches + cooldown", damped, damped_actions)
+    print(f"Resizes avoided: {baseline - damped}")
+
+    if args.predictive:
+        forecaster = TrendForecaster(season_length=args.season_length, confidence=FORECAST_CONFIDENCE)
+        predictive, predictive_actions, _ = replay(samples, new_policy(), forecaster, args.lead_time)
+        print_actions("Sustained breaches + cooldown + forecast", predictive, predictive_actions)
+        print_lead("Reactive", damped_actions, breaches)
+        print_lead("Predictive", predictive_actions, breaches)
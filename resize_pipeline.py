@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import time
+from azure.mgmt.compute.models import HardwareProfile, Sku, VirtualMachineScaleSetUpdate, VirtualMachineUpdate
+from capacity_planner import HORIZONTAL
+import telemetry
+
+QUEUE_SECONDS = telemetry.histogram("executor_resize_queue_seconds", "Time a resize waited for a free slot in its subscription")
+
+
+class ResizePipeline:
+    # Runs VM resizes as background tasks so the ExecutorAgent keeps draining its mailbox
+    # while Azure works. At most max_concurrent_per_subscription resizes run at once per
+    # subscription; an instruction for a VM that is already resizing is coalesced (dropped).
+    # Scale sets go through the same queue: scale_out/scale_in set their capacity (running
+    # instances are left alone), scale_up/scale_down their instances' size.
+    #
+    # get_client(subscription) returns an async ComputeManagementClient for that subscription.
+    # on_done(vm_name, direction, new_size, duration_seconds, error) is awaited after each resize
+    # (new_size is the instance count for scale_out/scale_in). duration_seconds only covers the
+    # Azure operation; the wait for a free slot is recorded in QUEUE_SECONDS.
+
+    def __init__(self, get_client, max_concurrent_per_subscription, on_done=None, clock=None):
+        self.get_client = get_client
+        self.max_concurrent = max_concurrent_per_subscription
+        self.on_done = on_done
+        self.clock = clock or time.time  # Looked up now, so a patched time.time is honoured
+        self.semaphores = {}
+        self.in_flight = {}
+
+    def is_resizing(self, vm_name):
+        return vm_name in self.in_flight
+
+    def submit(self, vm_name, direction, new_size, resource_group, subscription, scale_set=None):
+        # new_size: the new size, or the new instance count for scale_out/scale_in
+        # scale_set: (size, capacity) when vm_name is a scale set, None for a VM
+        # Returns False when the VM already has a resize in flight
+        if vm_name in self.in_flight:
+            return False
+        semaphore = self.semaphores.get(subscription)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrent)
+            self.semaphores[subscription] = semaphore
+        self.in_flight[vm_name] = asyncio.ensure_future(
+            self._resize(vm_name, direction, new_size, resource_group, subscription, semaphore, scale_set)
+        )
+        return True
+
+    async def _resize(self, vm_name, direction, new_size, resource_group, subscription, semaphore, scale_set=None):
+        error = None
+        queued = started = self.clock()
+        try:
+            async with semaphore:
+                started = self.clock()
+                QUEUE_SECONDS.observe(started - queued)
+                # PATCH only the size (or SKU); no GET of the full model beforehand
+                client = self.get_client(subscription)
+                if scale_set is None:
+                    update = VirtualMachineUpdate(hardware_profile=HardwareProfile(vm_size=new_size))
+                    poller = await client.virtual_machines.begin_update(resource_group, vm_name, update)
+                else:
+                    size, capacity = scale_set
+                    if direction in HORIZONTAL:
+                        sku = Sku(name=size, capacity=new_size)
+                    else:
+                        sku = Sku(name=new_size, capacity=capacity)  # Applied per the scale set's upgrade policy
+                    update = VirtualMachineScaleSetUpdate(sku=sku)
+                    poller = await client.virtual_machine_scale_sets.begin_update(resource_group, vm_name, update)
+                await poller.result()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = str(e)
+        finally:
+            self.in_flight.pop(vm_name, None)
+
+        if self.on_done is not None:
+            try:
+                await self.on_done(vm_name, direction, new_size, self.clock() - started, error)
+            except Exception as e:
+                logging.error(f"ResizePipeline: Completion handler failed for {vm_name}: {str(e)}")
+
+    async def drain(self):
+        # Wait for every resize in flight (used on shutdown and in tests)
+        while self.in_flight:
+            await asyncio.gather(*list(self.in_flight.values()), return_exceptions=True)
+
+    def cancel_all(self):
+        for task in self.in_flight.values():
+            task.cancel()
@@ -0,0 +1,80 @@
+class PolicyState:
+    # Constant-size anti-flapping state of one VM: the last n breach flags of each direction
+    # packed into an int bitmask, plus the cooldown deadline
+    __slots__ = ["up_history", "down_history", "cooldown_until", "cooldown_direction"]
+
+    def __init__(self):
+        self.up_history = 0
+        self.down_history = 0
+        self.cooldown_until = 0.0
+        self.cooldown_direction = None
+
+
+def count_bits(value):
+    return bin(value).count("1")
+
+
+class ScalingPolicy:
+    # Turns per-sample threshold decisions into resize decisions:
+    #  - scale_up only when at least k of the last n samples breached the upper thresholds,
+    #    scale_down only when k of the last n samples were under the lower thresholds
+    #    (the gap between the two threshold sets is the hysteresis band; each direction
+    #    has its own window, so scaling down can be made more conservative than scaling up)
+    #  - after a resize, the VM is left alone for the cooldown of that direction
+    # up_window / down_window: (k, n) with n <= 64
+    # out_cooldown_seconds / in_cooldown_seconds: cooldowns after a scale set's scale_out /
+    #   scale_in (default: the scale_up / scale_down ones)
+
+    def __init__(self, up_window=(3, 5), down_window=(8, 10),
+                 up_cooldown_seconds=300, down_cooldown_seconds=900,
+                 out_cooldown_seconds=None, in_cooldown_seconds=None):
+        for k, n in (up_window, down_window):
+            if not 1 <= k <= n <= 64:
+                raise ValueError(f"Invalid breach window ({k}, {n})")
+        self.up_k, up_n = up_window
+        self.down_k, down_n = down_window
+        self.up_mask = (1 << up_n) - 1
+        self.down_mask = (1 << down_n) - 1
+        self.cooldowns = {
+            "scale_up": up_cooldown_seconds,
+            "scale_down": down_cooldown_seconds,
+            "scale_out": up_cooldown_seconds if out_cooldown_seconds is None else out_cooldown_seconds,
+            "scale_in": down_cooldown_seconds if in_cooldown_seconds is None else in_cooldown_seconds
+        }
+        self.states = {}
+
+    def state_for(self, vm_id):
+        state = self.states.get(vm_id)
+        if state is None:
+            state = PolicyState()
+            self.states[vm_id] = state
+        return state
+
+    def apply(self, vm_id, decision, now):
+        # decision: raw per-sample decision ("scale_up", "scale_down" or "no_action")
+        state = self.state_for(vm_id)
+        state.up_history = ((state.up_history << 1) | (decision == "scale_up")) & self.up_mask
+        state.down_history = ((state.down_history << 1) | (decision == "scale_down")) & self.down_mask
+
+        if now < state.cooldown_until:
+            return "no_action"
+        if decision == "scale_up" and count_bits(state.up_history) >= self.up_k:
+            return "scale_up"
+        if decision == "scale_down" and count_bits(state.down_history) >= self.down_k:
+            return "scale_down"
+        return "no_action"
+
+    def record_resize(self, vm_id, direction, now):
+        # Start the cooldown and forget breaches seen at the old size
+        state = self.state_for(vm_id)
+        state.up_history = 0
+        state.down_history = 0
+        state.cooldown_until = now + self.cooldowns.get(direction, 0)
+        state.cooldown_direction = direction
+
+    def in_cooldown(self, vm_id, now):
+        state = self.states.get(vm_id)
+        return state is not None and now < state.cooldown_until
+
+    def forget(self, vm_id):
+        self.states.pop(vm_id, None)
@@ -0,0 +1,169 @@
+import bisect
+import hashlib
+import logging
+import time
+import spade
+from spade.behaviour import CyclicBehaviour
+from spade.template import Template
+from metrics_protocol import HEARTBEAT_ONTOLOGY
+
+# Sharded deployment: several MonitoringAgent and DeciderAgent instances split the fleet.
+# Each VM belongs to one monitor and one decider, chosen by consistent hashing of its id
+# over the live instances of that role, so adding or losing an instance only moves the
+# VMs of the ring segments it covered (about 1/N of the fleet).
+#
+# Liveness comes from heartbeats: every instance sends "role:jid" to every monitor and
+# decider it knows of each HEARTBEAT_INTERVAL_SECONDS; one not heard from for
+# HEARTBEAT_TIMEOUT_SECONDS leaves the ring. An instance that heartbeats but was not in
+# the configured lists joins it, so a new instance only needs to know the existing ones.
+
+MONITOR = "monitor"
+DECIDER = "decider"
+DEFAULT_REPLICAS = 100  # Points per instance on the ring; more points, more even shares
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def heartbeat_template():
+    return Template(metadata={"ontology": HEARTBEAT_ONTOLOGY})
+
+
+class HashRing:
+    # Consistent hash ring: owner(key) is the first instance point clockwise from the key
+
+    def __init__(self, nodes=(), replicas=DEFAULT_REPLICAS):
+        self.replicas = replicas
+        self.points = []  # Sorted (hash, node) pairs
+        self.nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for replica in range(self.replicas):
+            bisect.insort(self.points, (ring_hash(f"{node}#{replica}"), node))
+
+    def remove(self, node):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        self.points = [point for point in self.points if point[1] != node]
+
+    def owner(self, key):
+        # None when the ring is empty
+        if not self.points:
+            return None
+        index = bisect.bisect(self.points, (ring_hash(key), ""))
+        return self.points[index % len(self.points)][1]
+
+
+class ShardGroup:
+    # Live instances of one role and the ring over them.
+    # members: configured JIDs; they count as live from the start and leave the ring if no
+    #   heartbeat arrives within timeout_seconds (so a fresh instance does not briefly claim
+    #   the whole fleet before it has heard from its peers)
+    # self_jid: this agent's JID when it belongs to the role (never expires)
+
+    def __init__(self, role, members, self_jid=None, timeout_seconds=45, replicas=DEFAULT_REPLICAS,
+                 clock=time.time):
+        self.role = role
+        self.self_jid = self_jid
+        self.timeout_seconds = timeout_seconds
+        self.clock = clock
+        now = clock()
+        self.last_seen = {jid: now for jid in members}
+        if self_jid is not None:
+            self.last_seen[self_jid] = now
+        self.ring = HashRing(self.last_seen, replicas)
+
+    @property
+    def members(self):
+        return sorted(self.ring.nodes)
+
+    def seen(self, jid, now=None):
+        # Record a heartbeat; returns True when the instance (re)joined the ring
+        self.last_seen[jid] = self.clock() if now is None else now
+        if jid in self.ring.nodes:
+            return False
+        self.ring.add(jid)
+        return True
+
+    def expire(self, now=None):
+        # Drop instances whose heartbeats stopped; returns their JIDs
+        now = self.clock() if now is None else now
+        expired = [jid for jid in self.ring.nodes
+                   if jid != self.self_jid and now - self.last_seen.get(jid, 0) >= self.timeout_seconds]
+        for jid in expired:
+            self.ring.remove(jid)
+        return sorted(expired)
+
+    def owner(self, vm_id):
+        return self.ring.owner(vm_id)
+
+    def owns(self, vm_id):
+        return self.ring.owner(vm_id) == self.self_jid
+
+    def known(self):
+        # Every instance to send heartbeats to, including ones currently considered down
+        return sorted(jid for jid in self.last_seen if jid != self.self_jid)
+
+
+class HeartbeatBehaviour(CyclicBehaviour):
+    # Sends this agent's heartbeat to every known monitor and decider and feeds theirs into
+    # the agent's ShardGroups. Add it with heartbeat_template() so it only gets heartbeats.
+    # groups: {role: ShardGroup}; role: this agent's role; on_change(role, joined, left)
+    # is called after the membership of a role changed
+
+    def __init__(self, role, groups, interval_seconds=15, on_change=None):
+        super().__init__()
+        self.role = role
+        self.groups = groups
+        self.interval_seconds = interval_seconds
+        self.on_change = on_change
+        self.next_beat = 0.0
+
+    async def run(self):
+        now = time.time()
+        if now >= self.next_beat:
+            await self.beat()
+            self.next_beat = now + self.interval_seconds
+            for role, group in self.groups.items():
+                expired = group.expire(now)
+                if expired:
+                    self.changed(role, [], expired)
+
+        msg = await self.receive(timeout=max(0.0, self.next_beat - time.time()))
+        while msg:
+            try:
+                role, jid = msg.body.split(":", 1)
+            except ValueError:
+                logging.warning(f"Sharding: Invalid heartbeat received: {msg.body}")
+            else:
+                group = self.groups.get(role)
+                if group is not None and group.seen(jid):
+                    self.changed(role, [jid], [])
+            msg = await self.receive()  # Non-blocking: None once the queue is empty
+
+    async def beat(self):
+        me = str(self.agent.jid)
+        targets = set()
+        for group in self.groups.values():
+            targets.update(group.known())
+        for jid in sorted(targets):
+            msg = spade.message.Message(to=jid, body=f"{self.role}:{me}")
+            msg.set_metadata("ontology", HEARTBEAT_ONTOLOGY)
+            try:
+                await self.send(msg)
+            except Exception as e:
+                logging.warning(f"Sharding: Failed to send heartbeat to {jid}: {str(e)}")
+
+    def changed(self, role, joined, left):
+        members = self.groups[role].members
+        logging.info(f"Sharding: {self.agent.jid} - {role} ring now has {len(members)} instances "
+                     f"(joined: {', '.join(joined) or '-'}, left: {', '.join(left) or '-'})")
+        if self.on_change is not None:
+            self.on_change(role, joined, left)
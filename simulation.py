@@ -0,0 +1,769 @@
+import argparse
+import asyncio
+import contextlib
+import logging
+import math
+import os
+import random
+import selectors
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+# Runs the three agents in one process against fake Azure clients and an in-memory message
+# bus, at accelerated virtual time, and reports decision latency and resize counts.
+#
+#   python simulation.py --vms 1000 --minutes 30
+#   python simulation.py --vms 10000 --minutes 20 --drop-rate 0.01
+#   python simulation.py --replay monitoring_agent.log decider_agent.log --minutes 60
+#   python simulation.py --vms 200 --scale-sets 50 --minutes 60
+#
+# Configure logging before the agent modules do (their basicConfig calls then have no
+# effect), so a simulation never writes to the agents' own log files
+logging.basicConfig(
+    filename="simulation.log",
+    level=logging.WARNING,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+import decider_agent  # noqa: E402
+import executor_agent  # noqa: E402
+import monitoring_agent  # noqa: E402
+import telemetry  # noqa: E402
+from metric_cache import MetricWindowCache, percentile  # noqa: E402
+from metrics_protocol import HEARTBEAT_ONTOLOGY, ONTOLOGY, RESIZE_ONTOLOGY, decode_records  # noqa: E402
+from replay_logs import load_samples  # noqa: E402
+from sku_optimizer import STATIC_CATALOG  # noqa: E402
+from spade.container import Container  # noqa: E402
+from stream_ingest import StreamingCollector  # noqa: E402
+from vm_inventory import VMInventory, size_name  # noqa: E402
+
+MONITOR_JID = "monitorilyas@jabber.fr"
+DECIDER_JID = "deciderilyas@jabber.fr"
+EXECUTOR_JID = "executorilyas@jabber.fr"
+SHUTDOWN_GRACE_SECONDS = 120  # Virtual time given to the behaviours to finish after the run
+RECENT_DECISION_SECONDS = 300  # A VM counts as covered if it got a decision this close to the end
+MB = 1024 * 1024
+GB = 1024 * MB
+
+
+# --- Virtual time ---------------------------------------------------------------------------
+
+class VirtualSelector:
+    # Wraps the event loop's selector: when nothing is ready, jump the virtual clock to the
+    # next timer instead of blocking until it is due. Nothing in a simulation does real I/O.
+
+    def __init__(self, selector):
+        self.selector = selector
+        self.loop = None
+
+    def select(self, timeout=None):
+        events = self.selector.select(0)
+        if not events and timeout is None:
+            raise RuntimeError("Simulation deadlocked: no timers and nothing ready to run")
+        if not events and timeout > 0:
+            self.loop.advance(timeout)
+        return events
+
+    def __getattr__(self, name):
+        return getattr(self.selector, name)
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    # asyncio event loop whose clock only moves when every task is waiting on a timer,
+    # so sleeps and receive timeouts cost no wall-clock time
+
+    def __init__(self):
+        selector = VirtualSelector(selectors.DefaultSelector())
+        super().__init__(selector)
+        selector.loop = self
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@contextlib.contextmanager
+def virtual_wall_clock(loop, epoch):
+    # The agents timestamp with time.time(); make it follow the loop's virtual clock
+    real_time = time.time
+    time.time = lambda: epoch + loop.time()
+    try:
+        yield
+    finally:
+        time.time = real_time
+
+
+# --- Workloads ------------------------------------------------------------------------------
+
+class SyntheticWorkload:
+    # Per VM: a steady base load, then a CPU ramp starting at a random minute and levelling
+    # off after a while, plus deterministic noise. Demand is absolute (vCPUs, GB, bytes per
+    # minute), so the same demand shows as a lower percentage on a larger size.
+
+    def __init__(self, vm_count, minutes, seed=7):
+        rng = random.Random(seed)
+        self.params = []
+        for _ in range(vm_count):
+            self.params.append((
+                rng.uniform(0.15, 0.5),                 # base vCPUs in use
+                rng.uniform(5, max(6, minutes * 0.6)),  # ramp start (minute)
+                rng.uniform(10, 40),                    # ramp length (minutes)
+                rng.uniform(0.01, 0.08),                # vCPUs added per minute while ramping
+                rng.uniform(0.3, 0.6),                  # memory in use (GB)
+                rng.uniform(5, 25) * MB,                # disk read per minute
+                rng.uniform(60, 250) * MB               # network in per minute
+            ))
+
+    def demand(self, index, minute):
+        base, start, length, slope, memory, disk, network = self.params[index]
+        ramp = min(max(0.0, minute - start), length) * slope
+        noise = math.sin(index * 12.9898 + minute * 78.233) * 0.05
+        cores = max(0.0, base + ramp + noise)
+        return cores, memory + 0.1 * cores, disk, network
+
+
+class ReplayWorkload:
+    # Replays recorded per-minute samples (replay_logs.load_samples) in a loop. The recorded
+    # percentages are taken as demand at recorded_size; VM i replays recorded VM i % k,
+    # shifted by i minutes so copies do not move in lockstep.
+
+    def __init__(self, samples, recorded_size="Standard_B1s"):
+        sku = STATIC_CATALOG[recorded_size]
+        start = samples[0][0]
+        series = {}
+        for timestamp, vm_id, metrics in samples:
+            series.setdefault(vm_id, {})[int((timestamp - start) // 60)] = (
+                metrics["cpu"] / 100 * sku["vcpus"],
+                max(0.0, metrics["memory"]) / 100 * sku["memory_gb"],
+                metrics["disk_read"] * MB,
+                metrics["network_in"] * MB
+            )
+        self.series = []
+        for minutes in series.values():
+            filled, last = [], None
+            for minute in range(max(minutes) + 1):
+                last = minutes.get(minute, last)
+                filled.append(last)
+            first = next(value for value in filled if value is not None)
+            self.series.append([value or first for value in filled])
+
+    def demand(self, index, minute):
+        series = self.series[index % len(self.series)]
+        return series[(minute + index) % len(series)]
+
+
+# --- Fake Azure -----------------------------------------------------------------------------
+
+class SimulatedFleet:
+    # Ground truth shared by the fake clients: each VM's real size and its workload. Scale
+    # sets also have an instance count; their demand is their workload times the initial
+    # count, spread evenly over the instances.
+
+    def __init__(self, vm_names, initial_size, workload, epoch, catalog=STATIC_CATALOG):
+        self.names = vm_names
+        self.index = {name: i for i, name in enumerate(vm_names)}
+        self.sizes = {name: initial_size for name in vm_names}
+        self.etags = {name: 1 for name in vm_names}
+        self.capacities = {}  # Scale set -> instance count
+        self.weights = {}  # Scale set -> demand multiplier
+        self.upgrade_policies = {}  # Scale set -> upgrade policy when not "Automatic"
+        self.workload = workload
+        self.epoch = epoch
+        self.catalog = catalog
+
+    def add_scale_set(self, name, instances):
+        self.capacities[name] = instances
+        self.weights[name] = instances
+
+    def sample(self, vm_name, minute):
+        # Azure Monitor values for one minute: CPU %, available memory, disk and network bytes
+        # (a scale set's CPU and memory are per instance, disk and network its totals)
+        cores, memory_gb, disk, network = self.workload.demand(self.index[vm_name], minute)
+        weight = self.weights.get(vm_name, 1)
+        sku = self.catalog[self.sizes[vm_name]]
+        cpu = min(100.0, cores * weight / self.capacities.get(vm_name, 1) / sku["vcpus"] * 100)
+        available = max(0.0, (sku["memory_gb"] - memory_gb) * GB)
+        return cpu, available, disk * weight, network * weight
+
+    def collector_sample(self, vm_name):
+        # What an in-VM collector would read now: CPU %, memory %, disk and network MB per minute
+        cpu, available, disk, network = self.sample(vm_name, (time.time() - self.epoch) / 60)
+        total = self.catalog[self.sizes[vm_name]]["memory_gb"] * GB
+        instances = self.capacities.get(vm_name, 1)
+        return cpu, (total - available) / total * 100, disk / instances / MB, network / instances / MB
+
+
+def metric_value(timestamp, average=None, total=None):
+    return SimpleNamespace(timestamp=timestamp, average=average, total=total)
+
+
+class FakeMetricsClient:
+    # Stands in for both MetricsQueryClient.query_resource and MetricsClient.query_resources.
+    # A one-minute bucket becomes queryable ingestion_delay seconds after it closes; the end
+    # of the requested timespan is ignored in favour of the simulation clock.
+
+    def __init__(self, fleet, stats, latency=0.2, ingestion_delay=120, failure_rate=0.0, seed=7):
+        self.fleet = fleet
+        self.stats = stats
+        self.latency = latency
+        self.ingestion_delay = ingestion_delay
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+
+    def available_minutes(self, timespan):
+        now = time.time()
+        if isinstance(timespan, timedelta):
+            start = now - timespan.total_seconds()
+        else:
+            start = timespan[0].timestamp()
+        first = max(0, math.ceil((start - self.fleet.epoch) / 60))
+        last = math.floor((now - self.ingestion_delay - self.fleet.epoch) / 60) - 1
+        return range(first, last + 1)
+
+    def result_for(self, resource_uri, minutes):
+        vm_name = resource_uri.rsplit("/", 1)[-1]
+        series = {name: [] for name in ("Percentage CPU", "Available Memory Bytes", "Disk Read Bytes", "Network In Total")}
+        for minute in minutes:
+            timestamp = datetime.fromtimestamp(self.fleet.epoch + minute * 60, timezone.utc)
+            cpu, available, disk, network = self.fleet.sample(vm_name, minute)
+            series["Percentage CPU"].append(metric_value(timestamp, average=cpu))
+            series["Available Memory Bytes"].append(metric_value(timestamp, average=available))
+            series["Disk Read Bytes"].append(metric_value(timestamp, total=disk))
+            series["Network In Total"].append(metric_value(timestamp, total=network))
+        return SimpleNamespace(metrics=[
+            SimpleNamespace(name=name, id=f"{resource_uri}/providers/Microsoft.Insights/metrics/{name}",
+                            timeseries=[SimpleNamespace(data=data)])
+            for name, data in series.items()
+        ])
+
+    async def respond(self):
+        started = time.time()
+        await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.latency)
+        self.stats.observe("azure_query_seconds", time.time() - started)
+        if self.rng.random() < self.failure_rate:
+            self.stats.count("azure_query_failures")
+            raise RuntimeError("Simulated Azure Monitor failure")
+
+    async def query_resource(self, resource_uri, metric_names, timespan=None, granularity=None):
+        await self.respond()
+        return self.result_for(resource_uri, self.available_minutes(timespan))
+
+    async def query_resources(self, resource_ids, metric_namespace=None, metric_names=None, timespan=None,
+                              granularity=None, aggregations=None):
+        await self.respond()
+        minutes = self.available_minutes(timespan)
+        return [self.result_for(resource_uri, minutes) for resource_uri in resource_ids]
+
+    async def close(self):
+        pass
+
+
+class AsyncList:
+    # Minimal stand-in for AsyncItemPaged
+    def __init__(self, items):
+        self.items = items
+
+    async def __aiter__(self):
+        for item in self.items:
+            yield item
+
+
+class FakeVirtualMachines:
+    def __init__(self, compute):
+        self.compute = compute
+
+    def vm(self, resource_group, name):
+        fleet = self.compute.fleet
+        return SimpleNamespace(
+            name=name, etag=f'"{fleet.etags[name]}"', location=self.compute.location,
+            id=f"/subscriptions/sim/resourceGroups/{resource_group}/providers/Microsoft.Compute/virtualMachines/{name}",
+            hardware_profile=SimpleNamespace(vm_size=fleet.sizes[name])
+        )
+
+    def list(self, resource_group):
+        fleet = self.compute.fleet
+        return AsyncList([self.vm(resource_group, name) for name in fleet.names if name not in fleet.capacities])
+
+    async def get(self, resource_group, name):
+        return self.vm(resource_group, name)
+
+    async def begin_update(self, resource_group, name, parameters):
+        self.compute.stats.resize_started(name)
+        return FakePoller(self.compute, name, size_name(parameters.hardware_profile.vm_size))
+
+
+class FakeVirtualMachineScaleSets:
+    def __init__(self, compute):
+        self.compute = compute
+
+    def scale_set(self, resource_group, name):
+        fleet = self.compute.fleet
+        return SimpleNamespace(
+            name=name, etag=f'"{fleet.etags[name]}"', location=self.compute.location,
+            id=f"/subscriptions/sim/resourceGroups/{resource_group}/providers/Microsoft.Compute/virtualMachineScaleSets/{name}",
+            sku=SimpleNamespace(name=fleet.sizes[name], capacity=fleet.capacities[name]),
+            upgrade_policy=SimpleNamespace(mode=fleet.upgrade_policies.get(name, "Automatic"))
+        )
+
+    def list(self, resource_group):
+        return AsyncList([self.scale_set(resource_group, name) for name in self.compute.fleet.capacities])
+
+    async def begin_update(self, resource_group, name, parameters):
+        # A capacity change starts or removes instances; a new SKU resizes (reboots) them
+        fleet = self.compute.fleet
+        new_size = size_name(parameters.sku.name)
+        capacity = parameters.sku.capacity
+        horizontal = new_size == fleet.sizes[name] and capacity != fleet.capacities[name]
+        self.compute.stats.resize_started(name, "capacity_changes_started" if horizontal else "resizes_started")
+        return FakePoller(self.compute, name, new_size, capacity)
+
+
+class FakePoller:
+    def __init__(self, compute, name, new_size, capacity=None):
+        self.compute = compute
+        self.name = name
+        self.new_size = new_size
+        self.capacity = capacity  # Scale sets only
+
+    async def result(self):
+        compute = self.compute
+        fleet = compute.fleet
+        horizontal = self.capacity is not None and self.new_size == fleet.sizes[self.name]
+        started = time.time()
+        duration = compute.scale_out_seconds if horizontal else compute.resize_seconds
+        await asyncio.sleep(compute.rng.lognormvariate(0, 0.3) * duration)
+        if compute.rng.random() < compute.failure_rate:
+            compute.stats.count("resize_failures")
+            raise RuntimeError("Simulated resize failure")
+        fleet.sizes[self.name] = self.new_size
+        if self.capacity is not None:
+            fleet.capacities[self.name] = self.capacity
+        fleet.etags[self.name] += 1
+        compute.stats.observe("capacity_change_seconds" if horizontal else "resize_seconds", time.time() - started)
+
+
+class FakeResourceSkus:
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def list(self, filter=None):
+        capability = lambda name, value: SimpleNamespace(name=name, value=str(value))  # noqa: E731
+        return AsyncList([
+            SimpleNamespace(name=size, resource_type="virtualMachines", restrictions=[],
+                            capabilities=[capability("vCPUs", sku["vcpus"]), capability("MemoryGB", sku["memory_gb"])])
+            for size, sku in self.catalog.items()
+        ])
+
+
+class FakeComputeClient:
+    # Stands in for the async ComputeManagementClient; resizes take resize_seconds and scale
+    # set capacity changes scale_out_seconds (log-normally distributed) of virtual time
+
+    def __init__(self, fleet, stats, resize_seconds=90, failure_rate=0.0, location="westeurope", seed=7,
+                 scale_out_seconds=40):
+        self.fleet = fleet
+        self.stats = stats
+        self.resize_seconds = resize_seconds
+        self.scale_out_seconds = scale_out_seconds
+        self.failure_rate = failure_rate
+        self.location = location
+        self.rng = random.Random(seed)
+        self.virtual_machines = FakeVirtualMachines(self)
+        self.virtual_machine_scale_sets = FakeVirtualMachineScaleSets(self)
+        self.resource_skus = FakeResourceSkus(fleet.catalog)
+
+    async def close(self):
+        pass
+
+
+# --- In-memory XMPP -------------------------------------------------------------------------
+
+class MessageBus:
+    # Replaces the XMPP server. SPADE behaviours send through agent.container, so registering
+    # an agent here routes its messages to the recipient's behaviour mailboxes after a
+    # simulated transit latency, dropping a fraction of them.
+
+    def __init__(self, stats, latency=0.5, drop_rate=0.0, seed=7):
+        self.stats = stats
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.rng = random.Random(seed)
+        self.agents = {}
+
+    def register(self, agent):
+        self.agents[str(agent.jid)] = agent
+        agent.container = self
+
+    def unregister(self, agent):
+        # Messages to the agent are lost from now on, as if its process had died
+        self.agents.pop(str(agent.jid), None)
+
+    async def send(self, msg, behaviour):
+        self.stats.message_sent(msg)
+        if self.rng.random() < self.drop_rate:
+            self.stats.count("messages_dropped")
+            return
+        delay = self.rng.uniform(0.5, 1.5) * self.latency
+        asyncio.get_running_loop().call_later(delay, self.deliver, msg, time.time())
+
+    def deliver(self, msg, sent_at):
+        agent = self.agents.get(str(msg.to))
+        if agent is None:
+            self.stats.count("messages_undeliverable")
+            return
+        self.stats.observe("message_transit_seconds", time.time() - sent_at)
+        self.stats.message_delivered(msg)
+        for behaviour in agent.behaviours:
+            if behaviour.match(msg):
+                behaviour.queue.put_nowait(msg)
+
+
+# --- Measurements ---------------------------------------------------------------------------
+
+class SimulationStats:
+    # Counters and latency samples, fed by the bus and the fake clients
+
+    def __init__(self):
+        self.counters = {}
+        self.samples = {}
+        self.metrics_delivered = {}  # vm -> (delivery time, sample timestamp) of its latest metrics
+        self.decided = {}  # vm -> time of its latest scale decision
+        self.last_decision = {}  # vm -> time of its latest decision of any kind
+        self.shard_records = {}  # decider jid -> metrics records delivered to it
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, value):
+        self.samples.setdefault(name, []).append(value)
+
+    def message_sent(self, msg):
+        ontology = msg.get_metadata("ontology")
+        if ontology == ONTOLOGY:
+            self.count("metrics_messages")
+        elif ontology == RESIZE_ONTOLOGY:
+            self.count("resize_confirmations")
+        elif ontology == HEARTBEAT_ONTOLOGY:
+            self.count("heartbeats")
+        elif str(msg.to) == EXECUTOR_JID:
+            self.count("decision_messages")
+
+    def message_delivered(self, msg):
+        if msg.get_metadata("ontology") != ONTOLOGY:
+            return
+        now = time.time()
+        records = decode_records(msg.body)
+        for record in records:
+            self.metrics_delivered[record.vm_id] = (now, record.timestamp)
+        recipient = str(msg.to)
+        self.shard_records[recipient] = self.shard_records.get(recipient, 0) + len(records)
+
+    def decision_made(self, vm_name, decision):
+        # Every decision, sent or not (no_action is not sent to the executor by default)
+        now = time.time()
+        self.count(f"decisions_{decision}")
+        self.last_decision[vm_name] = now
+        delivered = self.metrics_delivered.get(vm_name)
+        if delivered is not None:
+            self.observe("metrics_to_decision_seconds", now - delivered[0])
+            self.observe("sample_to_decision_seconds", now - delivered[1])
+        if decision != "no_action":
+            self.decided[vm_name] = now
+
+    def resize_started(self, vm_name, counter="resizes_started"):
+        self.count(counter)
+        decided = self.decided.pop(vm_name, None)
+        if decided is not None:
+            self.observe("decision_to_resize_seconds", time.time() - decided)
+
+    def summary(self):
+        latencies = {}
+        for name, values in self.samples.items():
+            ordered = sorted(values)
+            latencies[name] = {
+                "count": len(ordered),
+                "p50": percentile(ordered, 0.5),
+                "p99": percentile(ordered, 0.99),
+                "max": ordered[-1]
+            }
+        return {"counters": dict(sorted(self.counters.items())), "latencies": latencies}
+
+
+# --- Harness --------------------------------------------------------------------------------
+
+def configure_agents(fleet, stats, metrics_client, compute_client, inventory, options):
+    # Point the agents' module-level clients and settings at the fakes
+    monitoring_agent.VMS = [{"id": name, "size": None, "scale_set": name in fleet.capacities} for name in fleet.names]
+    monitoring_agent.BATCH_METRICS_QUERIES = not options.per_vm_queries
+    monitoring_agent.metrics_client = metrics_client
+    monitoring_agent.get_metrics_batch_client = lambda region: metrics_client
+    monitoring_agent.get_compute_client = lambda subscription: compute_client
+    monitoring_agent.inventory = inventory
+    monitoring_agent.metric_cache = MetricWindowCache(retention_minutes=monitoring_agent.METRIC_RETENTION_MINUTES)
+    monitoring_agent.sequence_numbers = {}
+    monitoring_agent.FETCH_RETAIL_PRICES = False
+    # No per-VM console lines or metrics endpoints; telemetry is read from the registry instead
+    for agent_module in (monitoring_agent, decider_agent, executor_agent):
+        agent_module.PER_VM_CONSOLE_OUTPUT = False
+        agent_module.METRICS_PORT = None
+
+    executor_agent.get_compute_client = lambda subscription: compute_client
+    executor_agent.inventory = inventory
+    executor_agent.FETCH_RETAIL_PRICES = False
+    executor_agent.STATE_DB_PATH = options.state_db
+
+    decider_agent.PREDICTIVE_SCALING = options.predictive
+    decider_agent.COST_AWARE_SIZING = options.cost_aware
+    decider_agent.HORIZONTAL_SCALING = not options.vertical_only
+    decider_agent.MAX_INSTANCES = options.max_instances
+
+    # Several monitors and deciders share the fleet through the sharding rings
+    sharded = options.monitors > 1 or options.deciders > 1
+    monitor_jids = shard_jids(MONITOR_JID, options.monitors)
+    decider_jids = shard_jids(DECIDER_JID, options.deciders)
+    for agent_module in (monitoring_agent, decider_agent):
+        agent_module.SHARDING = sharded
+        agent_module.MONITOR_JIDS = monitor_jids
+        agent_module.DECIDER_JIDS = decider_jids
+
+    # Streaming: every monitor listens on a free loopback port for the simulated collectors
+    monitoring_agent.STREAM_INGEST_PORT = 0 if options.streaming else None
+    monitoring_agent.STREAM_INGEST_HOST = "127.0.0.1"
+    return monitor_jids, decider_jids
+
+
+def start_collectors(fleet, monitors, options):
+    # Simulated in-VM collectors, each relaying a slice of one monitor's VMs over real TCP;
+    # a VM streams to the monitor that owns it at startup
+    tasks = []
+    for monitor in monitors:
+        owned = [vm["id"] for vm in monitor.owned_vms()]
+        per_collector = max(1, math.ceil(len(owned) / options.collectors))
+        for start in range(0, len(owned), per_collector):
+            names = owned[start:start + per_collector]
+            collector = StreamingCollector(
+                "127.0.0.1", monitor.stream_server.port,
+                lambda names=names: [(name, fleet.collector_sample(name)) for name in names],
+                options.stream_seconds, options.stream_seconds * 2)
+            tasks.append(asyncio.ensure_future(collector.run()))
+    return tasks
+
+
+def shard_jids(first_jid, count):
+    # "name@host", "name-2@host", "name-3@host", ...
+    name, host = first_jid.split("@")
+    return [first_jid] + [f"{name}-{index}@{host}" for index in range(2, count + 1)]
+
+
+async def stop_agent(agent, bus):
+    # Simulated crash: no more messages in or out, behaviours stopped
+    bus.unregister(agent)
+    for behaviour in list(agent.behaviours):
+        behaviour.kill()
+
+
+def watch_decisions(decider, stats):
+    # Count every decision of the decider where it is made, since no_action is not sent
+    behaviour = next(b for b in decider.behaviours if isinstance(b, decider_agent.DeciderAgent.DecideBehaviour))
+    decide = behaviour.decide
+
+    async def counted(state, raw_decision, decision, *args, **kwargs):
+        stats.decision_made(state.vm_id, decision)
+        await decide(state, raw_decision, decision, *args, **kwargs)
+    behaviour.decide = counted
+
+
+async def start_agent(agent, bus):
+    # What Agent.start does, minus the XMPP connection
+    bus.register(agent)
+    await agent.setup()
+    agent._alive.set()
+    for behaviour in agent.behaviours:
+        behaviour.start()
+
+
+async def simulate(fleet, options):
+    stats = SimulationStats()
+    telemetry.REGISTRY.reset()  # The agents' counters and histograms are module-level
+    metrics_client = FakeMetricsClient(fleet, stats, options.query_latency, options.ingestion_delay,
+                                       options.query_failure_rate, options.seed)
+    compute_client = FakeComputeClient(fleet, stats, options.resize_seconds, options.resize_failure_rate,
+                                       seed=options.seed, scale_out_seconds=options.scale_out_seconds)
+    bus = MessageBus(stats, options.bus_latency, options.drop_rate, options.seed)
+
+    # One in-memory inventory for all three agents, seeded with the static catalog prices
+    inventory = VMInventory(None)
+    inventory.skus = {size: dict(sku) for size, sku in STATIC_CATALOG.items()}
+    monitor_jids, decider_jids = configure_agents(fleet, stats, metrics_client, compute_client, inventory, options)
+
+    Container().reset()
+    monitors = [monitoring_agent.MonitoringAgent(jid, "simulation") for jid in monitor_jids]
+    deciders = [decider_agent.DeciderAgent(jid, "simulation") for jid in decider_jids]
+    executor = executor_agent.ExecutorAgent(EXECUTOR_JID, "simulation")
+    executor.vms = {name: {"current_size": size, "last_update_time": time.time(), "cost": 0.0}
+                    for name, size in fleet.sizes.items()}
+
+    for agent in deciders + [executor] + monitors:
+        await start_agent(agent, bus)
+    for decider in deciders:
+        watch_decisions(decider, stats)
+        decider.inventory = inventory
+        decider.optimizer = decider.build_optimizer()
+    if options.streaming:
+        start_collectors(fleet, monitors, options)
+
+    # Optionally crash the last monitor and decider part-way through; the others take over
+    # their VMs once the heartbeat timeout expires
+    stop_at = options.stop_shard_at * 60 if options.stop_shard_at is not None else None
+    if stop_at is not None and stop_at < options.minutes * 60 and (len(monitors) > 1 or len(deciders) > 1):
+        await asyncio.sleep(stop_at)
+        for group in (monitors, deciders):
+            if len(group) > 1:
+                await stop_agent(group.pop(), bus)
+        stats.count("shard_instances_stopped")
+        await asyncio.sleep(options.minutes * 60 - stop_at)
+    else:
+        await asyncio.sleep(options.minutes * 60)
+    end = time.time()
+    # Resizes the executor accepted but Azure has not finished (or started: they queue on
+    # MAX_CONCURRENT_RESIZES_PER_SUBSCRIPTION)
+    pipeline = getattr(executor.behaviours[0], "pipeline", None) if executor.behaviours else None
+    stats.count("resizes_pending_at_end", len(pipeline.in_flight) if pipeline else 0)
+
+    for agent in monitors + deciders + [executor]:
+        for behaviour in list(agent.behaviours):
+            behaviour.kill()
+    await asyncio.sleep(SHUTDOWN_GRACE_SECONDS)
+    pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    summary = stats.summary()
+    summary["telemetry"] = telemetry.REGISTRY.snapshot()
+    summary["shards"] = {"monitors": len(monitor_jids), "deciders": len(decider_jids),
+                         "records_per_decider": dict(sorted(stats.shard_records.items()))}
+    summary["vms_decided_recently"] = sum(1 for decided in stats.last_decision.values()
+                                          if end - decided <= RECENT_DECISION_SECONDS)
+    summary["vms"] = len(fleet.names)
+    summary["virtual_minutes"] = options.minutes
+    summary["executor_total_cost"] = executor.total_cost
+    summary["final_sizes"] = {}
+    for size in fleet.sizes.values():
+        summary["final_sizes"][size] = summary["final_sizes"].get(size, 0) + 1
+    summary["scale_sets"] = {"count": len(fleet.capacities), "initial_instances": sum(fleet.weights.values()),
+                             "final_instances": sum(fleet.capacities.values())}
+    return summary
+
+
+def run_simulation(options, workload=None):
+    # Returns the summary dict; options as parsed by build_parser()
+    vm_names = [f"vm-{i:05d}" for i in range(options.vms)]
+    epoch = float(int(time.time() // 60 * 60))
+    if workload is None:
+        workload = SyntheticWorkload(options.vms, options.minutes, options.seed)
+    fleet = SimulatedFleet(vm_names, options.initial_size, workload, epoch)
+    for name in vm_names[:options.scale_sets]:
+        fleet.add_scale_set(name, options.initial_instances)
+
+    loop = VirtualTimeLoop()
+    started = time.perf_counter()
+    output = open(os.devnull, "w") if not options.verbose else None
+    try:
+        with virtual_wall_clock(loop, epoch), contextlib.redirect_stdout(output) if output else contextlib.nullcontext():
+            summary = loop.run_until_complete(simulate(fleet, options))
+    finally:
+        loop.close()
+        if output:
+            output.close()
+    summary["wall_seconds"] = time.perf_counter() - started
+    return summary
+
+
+def print_summary(summary):
+    counters = summary["counters"]
+    wall = summary["wall_seconds"]
+    virtual = summary["virtual_minutes"] * 60
+    print(f"Simulated {summary['vms']} VMs for {summary['virtual_minutes']} virtual minutes "
+          f"in {wall:.1f}s ({virtual / wall:.0f}x real time)")
+    print(f"Messages: {counters.get('metrics_messages', 0)} metrics, "
+          f"{counters.get('decision_messages', 0)} decisions, "
+          f"{counters.get('resize_confirmations', 0)} resize confirmations, "
+          f"{counters.get('messages_dropped', 0)} dropped")
+    print(f"Azure queries: {summary['latencies'].get('azure_query_seconds', {}).get('count', 0)}, "
+          f"{counters.get('azure_query_failures', 0)} failed")
+    print("Decisions: " + ", ".join(f"{name[len('decisions_'):]} {value}"
+                                      for name, value in counters.items() if name.startswith("decisions_")))
+    print(f"Resizes: {counters.get('resizes_started', 0)} started, "
+          f"{summary['latencies'].get('resize_seconds', {}).get('count', 0)} completed, "
+          f"{counters.get('resize_failures', 0)} failed, {counters.get('resizes_pending_at_end', 0)} pending at the end")
+    print("Final sizes: " + ", ".join(f"{size} {count}" for size, count in sorted(summary["final_sizes"].items())))
+    scale_sets = summary["scale_sets"]
+    if scale_sets["count"]:
+        print(f"Scale sets: {scale_sets['count']}, {scale_sets['initial_instances']} instances at the start, "
+              f"{scale_sets['final_instances']} at the end; {counters.get('capacity_changes_started', 0)} capacity "
+              f"changes started, {summary['latencies'].get('capacity_change_seconds', {}).get('count', 0)} completed")
+    print(f"Executor cost: ${summary['executor_total_cost']:.2f}")
+    shards = summary["shards"]
+    print(f"Shards: {shards['monitors']} monitors, {shards['deciders']} deciders"
+          f"{', 1 of each stopped' if counters.get('shard_instances_stopped') else ''}; "
+          f"{summary['vms_decided_recently']} of {summary['vms']} VMs decided on in the last "
+          f"{RECENT_DECISION_SECONDS // 60} minutes")
+    if shards["deciders"] > 1:
+        print("Records per decider: " + ", ".join(f"{jid} {count}" for jid, count in shards["records_per_decider"].items()))
+    for name, latency in summary["latencies"].items():
+        print(f"  {name:<30} p50 {latency['p50']:>8.2f}  p99 {latency['p99']:>8.2f}  "
+              f"max {latency['max']:>8.2f}  (n={latency['count']})")
+    print("Agent telemetry:")
+    for name, value in summary["telemetry"].items():
+        if isinstance(value, dict):
+            if value["count"]:
+                print(f"  {name:<40} p50 {value['p50']:>8.3f}  p99 {value['p99']:>8.3f}  (n={value['count']})")
+        elif value:
+            print(f"  {name:<40} {value}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run the agents offline against fake Azure and XMPP backends")
+    parser.add_argument("--vms", type=int, default=100)
+    parser.add_argument("--minutes", type=float, default=30, help="virtual minutes to simulate")
+    parser.add_argument("--replay", nargs="+", metavar="LOG", help="replay recorded logs instead of a synthetic ramp")
+    parser.add_argument("--initial-size", default="Standard_B1s")
+    parser.add_argument("--per-vm-queries", action="store_true", help="one Azure Monitor query per VM instead of batches")
+    parser.add_argument("--query-latency", type=float, default=0.2, help="Azure Monitor response time (seconds)")
+    parser.add_argument("--query-failure-rate", type=float, default=0.0)
+    parser.add_argument("--ingestion-delay", type=float, default=120, help="Azure Monitor ingestion lag (seconds)")
+    parser.add_argument("--resize-seconds", type=float, default=90, help="median resize duration")
+    parser.add_argument("--resize-failure-rate", type=float, default=0.0)
+    parser.add_argument("--bus-latency", type=float, default=0.5, help="message transit time (seconds)")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of messages lost in transit")
+    parser.add_argument("--predictive", action="store_true")
+    parser.add_argument("--cost-aware", action="store_true")
+    parser.add_argument("--monitors", type=int, default=1, help="MonitoringAgent instances (sharded when more than one)")
+    parser.add_argument("--deciders", type=int, default=1, help="DeciderAgent instances (sharded when more than one)")
+    parser.add_argument("--stop-shard-at", type=float, metavar="MINUTE",
+                        help="crash the last monitor and decider at this virtual minute")
+    parser.add_argument("--streaming", action="store_true", help="push metrics from simulated in-VM collectors")
+    parser.add_argument("--collectors", type=int, default=10, help="collector connections per monitor when streaming")
+    parser.add_argument("--stream-seconds", type=float, default=5, help="collector sampling interval (frames every 2 samples)")
+    parser.add_argument("--state-db", default=":memory:", help="executor state database (default: in memory)")
+    parser.add_argument("--scale-sets", type=int, default=0, help="how many of the VMs are VM Scale Sets")
+    parser.add_argument("--initial-instances", type=int, default=2, help="instances per scale set at the start")
+    parser.add_argument("--max-instances", type=int, default=10, help="instance limit per scale set")
+    parser.add_argument("--scale-out-seconds", type=float, default=40, help="median scale set capacity change duration")
+    parser.add_argument("--vertical-only", action="store_true", help="resize scale sets instead of scaling them out")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--verbose", action="store_true", help="keep the agents' console output")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    workload = None
+    if args.replay:
+        workload = ReplayWorkload(load_samples(args.replay), args.initial_size)
+    print_summary(run_simulation(args, workload))
@@ -0,0 +1,169 @@
+from collections import namedtuple
+import numpy as np
+from fleet_evaluator import METRIC_FIELDS
+
+# Picks VM sizes by cost instead of stepping along a fixed ladder: the cheapest SKU whose
+# capacity covers a VM's observed demand with headroom, for one VM or the whole fleet.
+#
+# Demand is derived from the metrics the agents already exchange (METRIC_FIELDS order):
+#   cpu, memory: usage percentage at the current size -> vCPUs and GB in use
+#   disk_read, network_in: MB per minute -> MB/s and Mbit/s
+# and compared with the catalog capacities in the same units.
+
+# Offline catalog: indicative West Europe Linux pay-as-you-go prices. The live catalog
+# from VMInventory replaces it when available (see catalog_from_inventory).
+STATIC_CATALOG = {
+    "Standard_B1s": {"vcpus": 1, "memory_gb": 1, "disk_mb_per_second": 22.5, "network_mbps": 320, "price_per_hour": 0.0114},
+    "Standard_B1ms": {"vcpus": 1, "memory_gb": 2, "disk_mb_per_second": 22.5, "network_mbps": 320, "price_per_hour": 0.0228},
+    "Standard_B2s": {"vcpus": 2, "memory_gb": 4, "disk_mb_per_second": 22.5, "network_mbps": 640, "price_per_hour": 0.0456},
+    "Standard_B2ms": {"vcpus": 2, "memory_gb": 8, "disk_mb_per_second": 30, "network_mbps": 640, "price_per_hour": 0.0912},
+    "Standard_B4ms": {"vcpus": 4, "memory_gb": 16, "disk_mb_per_second": 35, "network_mbps": 1280, "price_per_hour": 0.182},
+    "Standard_B8ms": {"vcpus": 8, "memory_gb": 32, "disk_mb_per_second": 50, "network_mbps": 2560, "price_per_hour": 0.365},
+    "Standard_F2s_v2": {"vcpus": 2, "memory_gb": 4, "disk_mb_per_second": 47, "network_mbps": 5000, "price_per_hour": 0.096},
+    "Standard_F4s_v2": {"vcpus": 4, "memory_gb": 8, "disk_mb_per_second": 95, "network_mbps": 10000, "price_per_hour": 0.192},
+    "Standard_F8s_v2": {"vcpus": 8, "memory_gb": 16, "disk_mb_per_second": 190, "network_mbps": 12500, "price_per_hour": 0.384},
+    "Standard_D2s_v5": {"vcpus": 2, "memory_gb": 8, "disk_mb_per_second": 85, "network_mbps": 12500, "price_per_hour": 0.108},
+    "Standard_D4s_v5": {"vcpus": 4, "memory_gb": 16, "disk_mb_per_second": 145, "network_mbps": 12500, "price_per_hour": 0.216},
+    "Standard_D8s_v5": {"vcpus": 8, "memory_gb": 32, "disk_mb_per_second": 290, "network_mbps": 12500, "price_per_hour": 0.432},
+    "Standard_D16s_v5": {"vcpus": 16, "memory_gb": 64, "disk_mb_per_second": 600, "network_mbps": 12500, "price_per_hour": 0.864},
+    "Standard_E2s_v5": {"vcpus": 2, "memory_gb": 16, "disk_mb_per_second": 85, "network_mbps": 12500, "price_per_hour": 0.142},
+    "Standard_E4s_v5": {"vcpus": 4, "memory_gb": 32, "disk_mb_per_second": 145, "network_mbps": 12500, "price_per_hour": 0.284}
+}
+
+# Highest utilization of each capacity a chosen SKU may run at (kept below the DeciderAgent's
+# upper thresholds so a right-sized VM does not immediately trigger another scale-up)
+DEFAULT_TARGET_UTILIZATION = {"cpu": 0.7, "memory": 0.7, "disk_read": 0.8, "network_in": 0.8}
+
+CAPACITY_KEYS = ["vcpus", "memory_gb", "disk_mb_per_second", "network_mbps"]  # METRIC_FIELDS order
+MB_TO_MBIT = 8 * 1024 * 1024 / 1e6
+
+# sizes: chosen size per VM; cost_per_hour: total price of the plan; deferred: indices of VMs
+# whose upsize did not fit in the budget (left at their current size); within_budget: False
+# when even the plan without those upsizes costs more than the budget
+FleetPlan = namedtuple("FleetPlan", ["sizes", "cost_per_hour", "deferred", "within_budget"])
+
+
+def catalog_from_inventory(skus, fallback=STATIC_CATALOG):
+    # Convert VMInventory.skus into the optimizer's catalog. Capacities missing from Azure's
+    # SKU list (network bandwidth) come from the fallback; SKUs without a price are left out.
+    catalog = {}
+    for size, sku in skus.items():
+        known = fallback.get(size, {})
+        price = sku.get("price_per_hour", known.get("price_per_hour"))
+        if price is None:
+            continue
+        disk = sku.get("disk_bytes_per_second")
+        catalog[size] = {
+            "vcpus": sku.get("vcpus", known.get("vcpus")),
+            "memory_gb": sku.get("memory_gb", known.get("memory_gb")),
+            "disk_mb_per_second": disk / (1024 * 1024) if disk else known.get("disk_mb_per_second"),
+            "network_mbps": known.get("network_mbps"),
+            "price_per_hour": price
+        }
+    return catalog
+
+
+class SkuOptimizer:
+    # catalog: {size: {"vcpus", "memory_gb", "disk_mb_per_second", "network_mbps", "price_per_hour"}}
+    #   (a missing or None capacity is treated as unlimited)
+    # target_utilization: {metric: fraction of the capacity the chosen SKU may use}
+    # allowed_sizes: optional subset of the catalog to choose from (e.g. one VM family);
+    #   every catalog size is still understood as a current size
+
+    def __init__(self, catalog=STATIC_CATALOG, target_utilization=None, allowed_sizes=None):
+        target_utilization = target_utilization or DEFAULT_TARGET_UTILIZATION
+        self.catalog = catalog
+        self.target = np.array([target_utilization[field] for field in METRIC_FIELDS], dtype=float)
+
+        # Every catalog size, to turn usage percentages at the current size into demand
+        self.known_sizes = list(catalog)
+        self.known_index = {size: i for i, size in enumerate(self.known_sizes)}
+        self.known_capacity = np.array([[catalog[size].get(key) or np.inf for key in CAPACITY_KEYS]
+                                        for size in self.known_sizes], dtype=float).reshape(-1, len(CAPACITY_KEYS))
+        self.known_prices = np.array([catalog[size]["price_per_hour"] for size in self.known_sizes], dtype=float)
+
+        # Sizes to choose from, cheapest first, so the first SKU that fits is the cheapest one
+        sizes = [size for size in self.known_sizes if allowed_sizes is None or size in allowed_sizes]
+        if not sizes:
+            raise ValueError("Empty SKU catalog")
+        sizes.sort(key=lambda size: (catalog[size]["price_per_hour"], size))
+        self.sizes = sizes
+        rows = [self.known_index[size] for size in sizes]
+        self.prices = self.known_prices[rows]
+        self.usable = self.known_capacity[rows] * self.target  # What a VM may use before it counts as overloaded
+
+    def rows_for(self, sizes):
+        # Row of each size in the known catalog, -1 for sizes the catalog does not have
+        index = self.known_index
+        return np.fromiter((index.get(size, -1) for size in sizes), dtype=np.intp, count=len(sizes))
+
+    def demand(self, current_sizes, metrics, rows=None):
+        # (VMs x 4) absolute demand from (VMs x 4) metrics observed at current_sizes;
+        # NaN for VMs whose current size is not in the catalog
+        metrics = np.asarray(metrics, dtype=float).reshape(-1, len(METRIC_FIELDS))
+        rows = self.rows_for(current_sizes) if rows is None else rows
+        current = self.known_capacity[rows]
+        current[rows < 0] = np.nan
+        demand = np.empty_like(metrics)
+        demand[:, 0] = metrics[:, 0] / 100 * current[:, 0]
+        demand[:, 1] = metrics[:, 1] / 100 * current[:, 1]
+        demand[:, 2] = metrics[:, 2] / 60
+        demand[:, 3] = metrics[:, 3] * MB_TO_MBIT / 60
+        return demand
+
+    def cheapest_fit(self, demand):
+        # Index into self.sizes of the cheapest SKU that fits each demand row, and whether one
+        # fits. When nothing fits, the SKU that is least overloaded in its tightest dimension.
+        demand = np.maximum(np.nan_to_num(demand, nan=0.0), 0.0)
+        fits = (demand[:, None, :] <= self.usable[None, :, :]).all(axis=2)  # VMs x SKUs
+        fitted = fits.any(axis=1)
+        choice = fits.argmax(axis=1)
+        if not fitted.all():
+            load = (demand[~fitted, None, :] / self.usable[None, :, :]).max(axis=2)
+            choice[~fitted] = load.argmin(axis=1)
+        return choice, fitted
+
+    def choose(self, current_size, metrics):
+        # Cheapest size for one VM in a single step (metrics in METRIC_FIELDS order),
+        # or None when the current size is unknown
+        demand = self.demand([current_size], [metrics])
+        if np.isnan(demand).any():
+            return None
+        choice, _ = self.cheapest_fit(demand)
+        return self.sizes[choice[0]]
+
+    def solve_fleet(self, current_sizes, metrics, budget_per_hour=None):
+        # Cheapest fitting size for every VM. With a budget, downsizes are always taken and
+        # upsizes are funded in order of overload relieved per extra dollar until the budget
+        # runs out; the rest stay at their current size. VMs with an unknown size or missing
+        # metrics keep their current size.
+        current_sizes = list(current_sizes)
+        rows = self.rows_for(current_sizes)
+        demand = self.demand(current_sizes, metrics, rows)
+        valid = ~np.isnan(demand).any(axis=1)
+        choice, _ = self.cheapest_fit(demand)
+
+        current_price = np.where(rows >= 0, self.known_prices[rows], 0.0)
+        target_price = np.where(valid, self.prices[choice], current_price)
+        keep = ~valid
+        deferred = np.empty(0, dtype=np.intp)
+
+        if budget_per_hour is not None and target_price.sum() > budget_per_hour:
+            extra = target_price - current_price
+            upsizes = np.flatnonzero(extra > 0)
+            # Overload at the current size (1.0 = exactly at the target utilization)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                overload = (demand[upsizes] / (self.known_capacity[rows[upsizes]] * self.target)).max(axis=1)
+            order = upsizes[np.argsort(-(overload / extra[upsizes]), kind="stable")]
+            # Spend what is left after the downsizes and unchanged VMs on the best upsizes
+            remaining = budget_per_hour - np.where(extra > 0, current_price, target_price).sum()
+            funded = np.cumsum(extra[order]) <= remaining
+            deferred = np.sort(order[~funded])
+            keep[deferred] = True
+            target_price[deferred] = current_price[deferred]
+
+        sizes = [current if kept else self.sizes[index]
+                 for current, kept, index in zip(current_sizes, keep.tolist(), choice.tolist())]
+        cost = float(target_price.sum())
+        within_budget = budget_per_hour is None or cost <= budget_per_hour + 1e-9
+        return FleetPlan(sizes, cost, deferred.tolist(), within_budget)
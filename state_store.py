@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import sqlite3
+import time
+import uuid
+
+# Durable ExecutorAgent state in SQLite (WAL journal). Size changes, cost intervals and
+# resize operations are appended to history tables; vm_state keeps the latest size, cost
+# and accrual time of every VM, so recovery reads one row per VM instead of replaying.
+#
+# Writes are queued in memory and committed together (one transaction, so at most one
+# sync) every flush_interval_seconds or once max_pending writes are queued. A crash loses
+# at most the writes of the last interval. With synchronous="NORMAL" WAL commits are not
+# synced until checkpoints (safe against process crashes); "FULL" syncs each batch.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vm_state (
+    vm TEXT PRIMARY KEY,
+    size TEXT NOT NULL,
+    accrued_until REAL NOT NULL,
+    cost REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS size_history (
+    vm TEXT NOT NULL,
+    size TEXT NOT NULL,
+    since REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS size_history_vm ON size_history (vm, since);
+CREATE TABLE IF NOT EXISTS cost_intervals (
+    vm TEXT NOT NULL,
+    size TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    ended_at REAL NOT NULL,
+    cost REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cost_intervals_end ON cost_intervals (ended_at);
+CREATE INDEX IF NOT EXISTS cost_intervals_vm ON cost_intervals (vm, ended_at);
+CREATE TABLE IF NOT EXISTS resize_operations (
+    id TEXT PRIMARY KEY,
+    vm TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    from_size TEXT,
+    to_size TEXT NOT NULL,
+    status TEXT NOT NULL,
+    submitted_at REAL NOT NULL,
+    finished_at REAL,
+    error TEXT,
+    trace_id TEXT
+);
+CREATE INDEX IF NOT EXISTS resize_operations_status ON resize_operations (status);
+"""
+
+INSERT_COST = "INSERT INTO cost_intervals VALUES (?, ?, ?, ?, ?)"
+INSERT_SIZE = "INSERT INTO size_history VALUES (?, ?, ?)"
+UPSERT_VM = ("INSERT INTO vm_state VALUES (?, ?, ?, ?) ON CONFLICT (vm) DO UPDATE SET "
+             "size = excluded.size, accrued_until = excluded.accrued_until, cost = excluded.cost")
+INSERT_RESIZE = "INSERT INTO resize_operations VALUES (?, ?, ?, ?, ?, 'pending', ?, NULL, NULL, ?)"
+FINISH_RESIZE = "UPDATE resize_operations SET status = ?, finished_at = ?, error = ? WHERE id = ?"
+# Statements are batched per kind with executemany and run in this order; within a kind the
+# queue order is kept (so the latest vm_state row wins and operations exist before they finish)
+WRITE_ORDER = [INSERT_COST, INSERT_SIZE, UPSERT_VM, INSERT_RESIZE, FINISH_RESIZE]
+
+# Share of each interval that overlaps [start, end), so partial intervals are prorated
+OVERLAP = ("(MIN(ended_at, :end) - MAX(started_at, :start)) / "
+           "CASE WHEN ended_at > started_at THEN ended_at - started_at ELSE 1 END")
+
+
+class StateStore:
+    # path: SQLite database file (":memory:" for a throwaway store)
+
+    def __init__(self, path, flush_interval_seconds=1.0, max_pending=5000, synchronous="NORMAL", clock=None):
+        self.path = path
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_pending = max_pending
+        self.clock = clock or time.time
+        self.pending = {sql: [] for sql in WRITE_ORDER}  # Parameters waiting for the next commit
+        self.pending_count = 0
+        self.last_flush = self.clock()
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(f"PRAGMA synchronous={synchronous}")
+        self.connection.executescript(SCHEMA)
+
+    # --- Writes (queued) ----------------------------------------------------------------
+
+    def write(self, sql, params):
+        self.pending[sql].append(params)
+        self.pending_count += 1
+        if self.pending_count >= self.max_pending:
+            self.flush()
+
+    def record_cost(self, vm, size, started_at, ended_at, cost, total_cost):
+        # One accrual interval, and the VM's running total after it
+        self.write(INSERT_COST, (vm, size, started_at, ended_at, cost))
+        self.write(UPSERT_VM, (vm, size, ended_at, total_cost))
+
+    def record_size(self, vm, size, since, accrued_until, cost):
+        self.write(INSERT_SIZE, (vm, size, since))
+        self.write(UPSERT_VM, (vm, size, accrued_until, cost))
+
+    def begin_resize(self, vm, direction, from_size, to_size, trace_id=None):
+        # Returns the operation id to pass to finish_resize
+        operation_id = uuid.uuid4().hex[:16]
+        self.write(INSERT_RESIZE, (operation_id, vm, direction, from_size, to_size, self.clock(), trace_id))
+        return operation_id
+
+    def finish_resize(self, operation_id, error=None):
+        self.write(FINISH_RESIZE, ("failed" if error else "done", self.clock(), error, operation_id))
+
+    # --- Commit -------------------------------------------------------------------------
+
+    def flush(self):
+        # Commit every queued write in one transaction; returns how many were written
+        count = self.pending_count
+        if not count:
+            self.last_flush = self.clock()
+            return 0
+        # On an error the transaction is rolled back and the queue kept for the next flush
+        with self.connection:
+            self.connection.execute("BEGIN")
+            for sql in WRITE_ORDER:
+                if self.pending[sql]:
+                    self.connection.executemany(sql, self.pending[sql])
+        for params in self.pending.values():
+            params.clear()
+        self.pending_count = 0
+        self.last_flush = self.clock()
+        return count
+
+    def flush_if_due(self):
+        if self.pending_count and self.clock() - self.last_flush >= self.flush_interval_seconds:
+            return self.flush()
+        return 0
+
+    async def run_flusher(self):
+        # Background task committing queued writes every flush_interval_seconds
+        while True:
+            await asyncio.sleep(self.flush_interval_seconds)
+            try:
+                self.flush_if_due()
+            except sqlite3.Error as e:
+                logging.error(f"StateStore: Failed to write {self.pending_count} state changes: {str(e)}")
+
+    def close(self):
+        self.flush()
+        self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.connection.close()
+
+    # --- Recovery and queries -----------------------------------------------------------
+
+    def load_vms(self):
+        # {vm: {"current_size", "last_update_time", "cost"}} as last committed
+        rows = self.connection.execute("SELECT vm, size, accrued_until, cost FROM vm_state")
+        return {vm: {"current_size": size, "last_update_time": accrued_until, "cost": cost}
+                for vm, size, accrued_until, cost in rows}
+
+    def interrupted_resizes(self):
+        # Resizes that were in flight when the previous run stopped, marked as interrupted
+        # (Azure may or may not have finished them; the inventory has the actual size)
+        rows = self.connection.execute(
+            "SELECT id, vm, direction, from_size, to_size, trace_id FROM resize_operations WHERE status = 'pending'"
+        ).fetchall()
+        if rows:
+            with self.connection:
+                self.connection.execute("BEGIN")
+                self.connection.execute("UPDATE resize_operations SET status = 'interrupted' WHERE status = 'pending'")
+        return [dict(zip(("id", "vm", "direction", "from_size", "to_size", "trace_id"), row)) for row in rows]
+
+    def cost_between(self, start, end, vm=None):
+        # Cost accrued in [start, end), prorating intervals that straddle either bound
+        sql = f"SELECT COALESCE(SUM(cost * {OVERLAP}), 0) FROM cost_intervals WHERE ended_at > :start AND started_at < :end"
+        params = {"start": start, "end": end}
+        if vm is not None:
+            sql += " AND vm = :vm"
+            params["vm"] = vm
+        return self.connection.execute(sql, params).fetchone()[0]
+
+    def cost_by_vm(self, start, end):
+        sql = (f"SELECT vm, SUM(cost * {OVERLAP}) FROM cost_intervals "
+               f"WHERE ended_at > :start AND started_at < :end GROUP BY vm ORDER BY vm")
+        return dict(self.connection.execute(sql, {"start": start, "end": end}).fetchall())
+
+    def size_history(self, vm):
+        return self.connection.execute("SELECT size, since FROM size_history WHERE vm = ? ORDER BY since",
+                                       (vm,)).fetchall()
+
+    def prune(self, before):
+        # Drop cost intervals and size history older than `before` (vm_state totals are kept)
+        self.flush()
+        with self.connection:
+            self.connection.execute("BEGIN")
+            self.connection.execute("DELETE FROM cost_intervals WHERE ended_at < ?", (before,))
+            self.connection.execute("DELETE FROM size_history WHERE since < ?", (before,))
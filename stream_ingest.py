@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import math
+import struct
+import time
+from metrics_protocol import MetricsRecord, ProtocolError, pack_records, unpack_records
+
+# Push-based metrics from in-VM collectors (monitor_cpu.py --stream) to the MonitoringAgent.
+#
+# A collector keeps one TCP connection open and writes frames: a uint32 big-endian length,
+# then metrics_protocol.pack_records bytes. Each record is the average of the samples the
+# collector took since its previous frame (disk and network as MB per minute, like the
+# Azure path). Backpressure is TCP flow control: the server stops reading a connection while
+# its buffer is full, the collector's drain() then blocks, and it keeps averaging new samples
+# into the next frame instead of queueing them.
+#
+# Collectors are not authenticated: the server should listen on a private address only, and
+# it drops records for VMs outside the monitored set so they never reach the DeciderAgent.
+
+FRAME = struct.Struct("!I")
+MAX_FRAME_BYTES = 1024 * 1024
+
+
+def frame(records):
+    payload = pack_records(records)
+    return FRAME.pack(len(payload)) + payload
+
+
+async def read_frame(reader):
+    # Records of the next frame, or None at end of stream
+    try:
+        header = await reader.readexactly(FRAME.size)
+    except asyncio.IncompleteReadError:
+        return None
+    (length,) = FRAME.unpack(header)
+    if length > MAX_FRAME_BYTES:
+        raise ProtocolError(f"Frame too large: {length} bytes")
+    try:
+        payload = await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        return None
+    return unpack_records(payload)
+
+
+class SampleAggregate:
+    # Running average of one VM's samples, ignoring NaN (unreadable) values per metric
+
+    __slots__ = ["vm_id", "timestamp", "count", "sums", "counts"]
+
+    def __init__(self, vm_id):
+        self.vm_id = vm_id
+        self.timestamp = 0.0
+        self.count = 0
+        self.sums = [0.0, 0.0, 0.0, 0.0]
+        self.counts = [0, 0, 0, 0]
+
+    def add(self, timestamp, values):
+        # values: cpu %, memory %, disk read MB/min, network in MB/min
+        self.timestamp = max(self.timestamp, timestamp)
+        self.count += 1
+        for i, value in enumerate(values):
+            if not math.isnan(value):
+                self.sums[i] += value
+                self.counts[i] += 1
+
+    def record(self, sequence=0):
+        values = [total / count if count else math.nan for total, count in zip(self.sums, self.counts)]
+        return MetricsRecord(self.vm_id, self.timestamp, sequence, *values)
+
+
+class StreamIngestServer:
+    # Accepts collector connections and averages the records of each VM until drain() hands
+    # them to the MonitoringAgent. Memory is bounded by max_buffered_vms: when that many VMs
+    # are waiting, connections with records for further VMs are not read until the next drain.
+    # accepts(vm id) tells which VMs are monitored; records for other VMs are dropped.
+
+    def __init__(self, host="127.0.0.1", port=9200, max_buffered_vms=100000, clock=None, accepts=None):
+        self.host = host
+        self.port = port
+        self.max_buffered_vms = max_buffered_vms
+        self.clock = clock or time.time
+        self.accepts = accepts or (lambda vm_id: True)
+        self.rejected = 0  # Records dropped for unmonitored VMs
+        self.pending = {}  # vm id -> SampleAggregate since the last drain
+        self.last_received = {}  # vm id -> when its latest record arrived
+        self.space = asyncio.Event()
+        self.space.set()
+        self.writers = set()  # Open collector connections
+        self.server = None
+
+    @property
+    def connections(self):
+        return len(self.writers)
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]  # The actual port when 0 was asked for
+        logging.info(f"StreamIngest: Listening for collectors on {self.host}:{self.port}")
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+        for writer in list(self.writers):
+            writer.close()
+        self.space.set()  # Wake handlers waiting for room so they see the closed connection
+
+    async def handle(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        self.writers.add(writer)
+        warned = False
+        try:
+            while True:
+                records = await read_frame(reader)
+                if records is None or writer.is_closing():
+                    break
+                for record in records:
+                    if not self.accepts(record.vm_id):
+                        self.rejected += 1
+                        if not warned:
+                            logging.warning(f"StreamIngest: Ignoring records from {peer} for unmonitored VM {record.vm_id}")
+                            warned = True
+                        continue
+                    while (record.vm_id not in self.pending and len(self.pending) >= self.max_buffered_vms
+                           and not writer.is_closing()):
+                        self.space.clear()
+                        await self.space.wait()  # Backpressure: stop reading until drained
+                    self.add(record)
+        except (ProtocolError, ConnectionError) as e:
+            logging.warning(f"StreamIngest: Dropping collector {peer}: {str(e)}")
+        except asyncio.CancelledError:
+            pass  # Loop shutting down; end quietly (asyncio logs cancelled connection handlers)
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    def add(self, record):
+        aggregate = self.pending.get(record.vm_id)
+        if aggregate is None:
+            aggregate = SampleAggregate(record.vm_id)
+            self.pending[record.vm_id] = aggregate
+        aggregate.add(record.timestamp, (record.cpu, record.memory, record.disk_read, record.network_in))
+        self.last_received[record.vm_id] = self.clock()
+
+    def drain(self):
+        # Averaged records of every VM heard from since the last drain
+        records = [aggregate.record() for aggregate in self.pending.values()]
+        self.pending = {}
+        self.space.set()
+        return records
+
+    def is_fresh(self, vm_id, max_age_seconds):
+        received = self.last_received.get(vm_id)
+        return received is not None and self.clock() - received <= max_age_seconds
+
+
+class StreamingCollector:
+    # Client side: samples every sample_seconds, sends one averaged record per VM every
+    # send_seconds over a persistent connection, and reconnects with backoff.
+    # sampler() returns [(vm id, (cpu %, memory %, disk read MB/min, network in MB/min))];
+    # one VM for an in-VM collector, several for a relay or a test.
+
+    def __init__(self, host, port, sampler, sample_seconds=1.0, send_seconds=5.0, max_backoff_seconds=30.0):
+        self.host = host
+        self.port = port
+        self.sampler = sampler
+        self.sample_seconds = sample_seconds
+        self.send_seconds = send_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.aggregates = {}
+        self.sequence = 0
+        self.frames_sent = 0
+
+    async def run(self):
+        sampling = asyncio.ensure_future(self.sample_forever())
+        try:
+            await self.send_forever()
+        finally:
+            sampling.cancel()
+
+    async def sample_forever(self):
+        while True:
+            now = time.time()
+            for vm_id, values in self.sampler():
+                aggregate = self.aggregates.get(vm_id)
+                if aggregate is None:
+                    aggregate = SampleAggregate(vm_id)
+                    self.aggregates[vm_id] = aggregate
+                aggregate.add(now, values)
+            await asyncio.sleep(self.sample_seconds)
+
+    async def send_forever(self):
+        backoff = 1.0
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError as e:
+                logging.warning(f"StreamingCollector: Cannot reach {self.host}:{self.port}: {str(e)}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff_seconds)
+                continue
+            backoff = 1.0
+            try:
+                while True:
+                    await asyncio.sleep(self.send_seconds)
+                    await self.send(writer)
+            except ConnectionError as e:
+                logging.warning(f"StreamingCollector: Connection to {self.host}:{self.port} lost: {str(e)}")
+            finally:
+                writer.close()
+
+    async def send(self, writer):
+        if not self.aggregates:
+            return
+        aggregates, self.aggregates = self.aggregates, {}
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        records = [aggregate.record(self.sequence) for aggregate in aggregates.values()]
+        for start in range(0, len(records), 1000):
+            writer.write(frame(records[start:start + 1000]))
+        await writer.drain()  # Blocks while the server is not reading; sampling goes on
+        self.frames_sent += 1
@@ -0,0 +1,158 @@
+import bisect
+import logging
+import math
+import threading
+
+# Counters and histograms for the agents, kept in process and exposed in the Prometheus
+# text format (GET /metrics on METRICS_PORT) or as a dict (REGISTRY.snapshot()).
+# Recording is a few list operations, cheap enough for per-VM hot paths.
+#
+# Trace ids: the MonitoringAgent tags every metrics message with a "trace_id"; the
+# DeciderAgent forwards it per VM ("<message trace id>/<vm>") on its decision, and the
+# ExecutorAgent carries it into its logs and resize confirmation, together with the
+# original "sample_time", so one Azure sample can be followed to the resize it caused.
+
+TRACE_ID = "trace_id"  # Message metadata keys
+SAMPLE_TIME = "sample_time"
+SENT_AT = "sent_at"
+
+PREFIX = "vmscaler_"
+# Seconds; from sub-millisecond decisions up to slow resizes
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def reset(self):
+        self.value = 0
+
+    def snapshot(self):
+        return self.value
+
+    def render(self):
+        return [f"# HELP {PREFIX}{self.name} {self.help}",
+                f"# TYPE {PREFIX}{self.name} counter",
+                f"{PREFIX}{self.name} {self.value}"]
+
+
+class Histogram:
+    # Fixed upper bounds like a Prometheus histogram, plus exact count, sum, min and max
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.bounds = list(buckets)
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)  # Last slot: above the largest bound
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, fraction):
+        # Upper bound of the bucket holding the quantile (the max for the overflow bucket)
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else 0.0,
+            "max": self.max if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99)
+        }
+
+    def render(self):
+        name = f"{PREFIX}{self.name}"
+        lines = [f"# HELP {name} {self.help}", f"# TYPE {name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum {self.sum}")
+        lines.append(f"{name}_count {self.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(f"Metric {metric.name} already registered as {type(existing).__name__}")
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in sorted(self.metrics.items())}
+
+    def render(self):
+        lines = []
+        for _, metric in sorted(self.metrics.items()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        for metric in self.metrics.values():
+            metric.reset()
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text):
+    return REGISTRY.register(Counter(name, help_text))
+
+
+def histogram(name, help_text, buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, help_text, buckets))
+
+
+async def start_metrics_server(port, host="127.0.0.1"):
+    # Serves REGISTRY on http://host:port/metrics; returns the runner to clean up on shutdown
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Telemetry: Serving metrics on http://{host}:{port}/metrics")
+    return runner
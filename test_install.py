@@ -3,4 +3,5 @@ import azure.identity
 import azure.mgmt.compute
 import azure.monitor.query
 import asyncio
+import numpy
 print("Modules installés avec succès")
\ No newline at end of file
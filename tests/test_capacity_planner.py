@@ -0,0 +1,54 @@
+import math
+from capacity_planner import CapacityPlanner, load_of
+
+LADDER = ["Standard_B1s", "Standard_B2s", "Standard_B4ms"]
+
+
+def growing(planner, vm_id, per_minute, start=50.0):
+    # Two samples a minute apart
+    planner.observe(vm_id, start, 0)
+    planner.observe(vm_id, start + per_minute, 60)
+
+
+def test_slow_growth_resizes_below_the_top_of_the_ladder():
+    planner = CapacityPlanner(LADDER)
+    growing(planner, "vmss", 1.0)
+    assert planner.plan("vmss", "scale_up", "Standard_B1s", 2, 1, 10, 85.0, 90) == ("scale_up", None)
+
+
+def test_fast_growth_scales_out_for_the_projected_load():
+    planner = CapacityPlanner(LADDER, target_utilization=60)
+    growing(planner, "vmss", 10.0)
+    assert planner.growth("vmss") == 5.0  # Smoothed with the initial rate of 0
+    # 85 % now, 92.5 % after the 90 s lead time: 2 * 92.5 / 60 -> 4 instances
+    assert planner.plan("vmss", "scale_up", "Standard_B1s", 2, 1, 10, 85.0, 90) == ("scale_out", 4)
+    assert planner.plan("vmss", "scale_up", "Standard_B1s", 2, 1, 3, 85.0, 90) == ("scale_out", 3)
+
+
+def test_top_of_the_ladder_scales_out_by_at_least_one():
+    planner = CapacityPlanner(LADDER)
+    assert planner.plan("vmss", "scale_up", "Standard_B4ms", 4, 1, 10, 61.0, 90) == ("scale_out", 5)
+    assert planner.plan("vmss", "scale_up", "Standard_B4ms", 10, 1, 10, 95.0, 90) == ("scale_up", None)
+
+
+def test_scale_in_removes_at_most_half_the_instances():
+    planner = CapacityPlanner(LADDER, target_utilization=60)
+    assert planner.plan("vmss", "scale_down", "Standard_B2s", 8, 1, 10, 10.0, 90) == ("scale_in", 4)
+    assert planner.plan("vmss", "scale_down", "Standard_B2s", 8, 1, 10, 45.0, 90) == ("scale_in", 6)
+    assert planner.plan("vmss", "scale_down", "Standard_B2s", 8, 6, 10, 10.0, 90) == ("scale_in", 6)
+    assert planner.plan("vmss", "scale_down", "Standard_B2s", 1, 1, 10, 10.0, 90) == ("scale_down", None)
+
+
+def test_manual_upgrade_policy_only_scales_horizontally():
+    planner = CapacityPlanner(LADDER)
+    assert planner.plan("vmss", "scale_up", "Standard_B1s", 2, 1, 10, 85.0, 90, vertical=False) == ("scale_out", 3)
+    assert planner.plan("vmss", "scale_up", "Standard_B1s", 10, 1, 10, 85.0, 90, vertical=False) == ("no_action", None)
+    assert planner.plan("vmss", "scale_down", "Standard_B2s", 1, 1, 10, 10.0, 90, vertical=False) == ("no_action", None)
+
+
+def test_unknown_load_keeps_the_instance_count():
+    planner = CapacityPlanner(LADDER)
+    assert math.isnan(load_of(math.nan, math.nan))
+    assert load_of(math.nan, 40.0) == 40.0
+    assert planner.observe("vmss", math.nan, 0) == 0.0
+    assert planner.plan("vmss", "scale_down", "Standard_B2s", 4, 1, 10, math.nan, 90) == ("scale_in", 3)
@@ -0,0 +1,90 @@
+import asyncio
+import spade
+import decider_agent
+from metrics_protocol import ONTOLOGY, MetricsRecord, encode_records
+from sharding import DECIDER, ShardGroup
+from vm_inventory import VMInventory
+
+SELF = "decider@localhost"
+OTHER = "decider-2@localhost"
+
+
+def metrics_message(records):
+    msg = spade.message.Message(to=SELF, sender="monitor@localhost", body=encode_records(records))
+    msg.set_metadata("ontology", ONTOLOGY)
+    return msg
+
+
+def build_decider(monkeypatch):
+    monkeypatch.setattr(decider_agent, "METRICS_PORT", None)
+    monkeypatch.setattr(decider_agent, "SHARDING", False)
+    monkeypatch.setattr(decider_agent, "PER_VM_CONSOLE_OUTPUT", False)
+    agent = decider_agent.DeciderAgent(SELF, "test")
+    asyncio.run(agent.setup())
+    agent.inventory = VMInventory(None)
+    agent.shards = ShardGroup(DECIDER, [OTHER], SELF)
+    return agent
+
+
+def run_cycle(agent, messages):
+    # One DecideBehaviour cycle over the given messages; returns the decisions sent
+    behaviour = next(b for b in agent.behaviours if isinstance(b, decider_agent.DeciderAgent.DecideBehaviour))
+    queue = list(messages)
+    sent = []
+
+    async def receive(timeout=None):
+        return queue.pop(0) if queue else None
+
+    async def send(msg):
+        sent.append(msg.body)
+    behaviour.receive = receive
+    behaviour.send = send
+    asyncio.run(behaviour.run())
+    return sent
+
+
+def split_vms(agent, count=20):
+    vm_ids = [f"vm-{i}" for i in range(count)]
+    mine = [vm_id for vm_id in vm_ids if agent.shards.owns(vm_id)]
+    theirs = [vm_id for vm_id in vm_ids if not agent.shards.owns(vm_id)]
+    assert mine and theirs
+    return mine, theirs
+
+
+def test_records_for_vms_owned_elsewhere_are_dropped(monkeypatch):
+    monkeypatch.setattr(decider_agent, "SEND_NO_ACTION", True)
+    agent = build_decider(monkeypatch)
+    mine, theirs = split_vms(agent)
+    dropped = decider_agent.RECORDS_NOT_OWNED.value
+    sent = run_cycle(agent, [metrics_message([MetricsRecord(vm_id, 1000.0, 1, 50.0, 50.0, 20.0, 200.0)
+                                              for vm_id in mine + theirs])])
+    assert sorted(body.split(":")[0] for body in sent) == sorted(mine)
+    assert sorted(agent.engine.states) == sorted(mine)
+    assert decider_agent.RECORDS_NOT_OWNED.value - dropped == len(theirs)
+
+
+def test_only_scale_decisions_are_sent(monkeypatch):
+    monkeypatch.setattr(decider_agent, "SCALE_UP_WINDOW", (1, 1))
+    agent = build_decider(monkeypatch)
+    agent.shards = ShardGroup(DECIDER, [], SELF)
+    observed = decider_agent.SAMPLE_TO_DECISION_SECONDS.count
+    records = [MetricsRecord(f"vm-{i}", 1000.0, 1, 50.0, 50.0, 20.0, 200.0) for i in range(5)]
+    records.append(MetricsRecord("vm-hot", 1000.0, 1, 95.0, 50.0, 20.0, 200.0))
+    sent = run_cycle(agent, [metrics_message(records)])
+    assert [body.split(":")[:2] for body in sent] == [["vm-hot", "scale_up"]]
+    assert len(agent.engine.states) == 6  # no_action VMs are still decided on
+    assert decider_agent.SAMPLE_TO_DECISION_SECONDS.count - observed == 6
+
+
+def test_vms_moving_away_leave_the_fleet(monkeypatch):
+    agent = build_decider(monkeypatch)
+    agent.shards = ShardGroup(DECIDER, [], SELF)  # Alone: owns everything
+    mine, theirs = split_vms(build_decider(monkeypatch))
+    run_cycle(agent, [metrics_message([MetricsRecord(vm_id, 1000.0, 1, 50.0, 50.0, 20.0, 200.0)
+                                       for vm_id in mine + theirs])])
+    assert len(agent.engine.fleet) == len(mine + theirs)
+
+    agent.shards.seen(OTHER)
+    agent.on_shards_changed(DECIDER, [OTHER], [])
+    assert sorted(agent.engine.states) == sorted(mine)
+    assert sorted(agent.engine.fleet.vm_ids) == sorted(mine)
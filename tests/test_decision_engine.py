@@ -0,0 +1,99 @@
+import math
+from decision_engine import DecisionEngine
+from decider_agent import THRESHOLDS
+from forecaster import TrendForecaster
+from metrics_protocol import MetricsRecord
+from scaling_policy import ScalingPolicy
+
+
+def record(vm_id, sequence, cpu, memory, disk_read=1.0, network_in=1.0):
+    return MetricsRecord(vm_id, 1000.0 + 60 * sequence, sequence, cpu, memory, disk_read, network_in)
+
+
+def test_unknown_memory_still_scales_up():
+    # The monitor sends NaN memory for a size missing from the SKU catalog
+    engine = DecisionEngine(THRESHOLDS)
+    policy = ScalingPolicy(up_window=(3, 5))
+    decisions = []
+    for sequence in range(1, 4):
+        state = engine.ingest(record("vm-unknown-sku", sequence, 100.0, math.nan))
+        assert state is not None
+        raw = engine.evaluate_batch([state])[0]
+        assert raw == engine.evaluate(state) == "scale_up"
+        decisions.append(policy.apply(state.vm_id, raw, state.timestamp))
+    assert decisions == ["no_action", "no_action", "scale_up"]
+
+
+def test_unknown_memory_never_scales_down():
+    engine = DecisionEngine(THRESHOLDS)
+    state = engine.ingest(record("vm-unknown-sku", 1, 1.0, math.nan))
+    assert engine.evaluate_batch([state]) == ["no_action"]
+    assert engine.evaluate(state) == "no_action"
+
+
+def test_missing_metric_keeps_previous_value():
+    engine = DecisionEngine(THRESHOLDS)
+    engine.ingest(record("vm-1", 1, 10.0, 10.0))
+    state = engine.ingest(record("vm-1", 2, 10.0, math.nan))
+    assert state.memory == 10.0
+    assert engine.evaluate_batch([state]) == ["scale_down"]
+
+
+def test_record_without_any_metric_is_not_decided():
+    engine = DecisionEngine(THRESHOLDS)
+    assert engine.ingest(record("vm-1", 1, math.nan, math.nan, math.nan, math.nan)) is None
+
+
+def test_forecaster_skips_unknown_metrics():
+    forecaster = TrendForecaster(warmup_samples=2)
+    forecaster.update("vm-1", [10.0, math.nan, 1.0, 1.0], 0)
+    forecaster.update("vm-1", [20.0, 50.0, 1.0, 1.0], 60)
+    forecaster.update("vm-1", [30.0, 50.0, 1.0, 1.0], 120)
+    predicted = forecaster.forecast("vm-1", 60)
+    assert not any(math.isnan(value) for value in predicted)
+    assert predicted[1] == 50.0
+
+
+def test_reset_frees_the_row_but_keeps_the_tier():
+    tiers = {"relaxed": {"upper": {"cpu": 95, "memory": 95, "disk_read": 100, "network_in": 1000},
+                         "lower": THRESHOLDS["lower"]}}
+    engine = DecisionEngine(THRESHOLDS, tiers, {"vm-1": "relaxed"})
+    engine.ingest(record("vm-1", 1, 90.0, 50.0))
+    engine.ingest(record("vm-2", 1, 90.0, 50.0))
+    engine.reset("vm-1")
+    assert "vm-1" not in engine.states
+    assert engine.fleet.vm_ids == ["vm-2"]
+    assert engine.fleet.decisions() == {"vm-2": "scale_up"}
+
+    # Back on this shard: fresh samples, same tier
+    state = engine.ingest(record("vm-1", 5, 90.0, 50.0))
+    assert state.sequence == 5
+    assert engine.evaluate_batch([state]) == ["no_action"]
+
+    engine.forget("vm-2")
+    assert engine.fleet.vm_ids == ["vm-1"]
+
+
+def test_restarted_monitor_restarts_the_sequence():
+    # Same monitor JID, sequence numbers from 1 again after a restart
+    engine = DecisionEngine(THRESHOLDS)
+    for sequence in range(1, 501):
+        engine.ingest(record("vm-1", sequence, 90.0, 50.0), "monitor@host")
+    accepted = [engine.ingest(record("vm-1", 500 + sequence, 10.0, 10.0)._replace(sequence=sequence), "monitor@host")
+                for sequence in range(1, 200)]
+    state = engine.states["vm-1"]
+    assert all(accepted)
+    assert state.stale == 0
+    assert state.missed == 0
+    assert state.sequence == 199
+    assert state.cpu == 10.0
+
+
+def test_replayed_record_is_still_stale():
+    engine = DecisionEngine(THRESHOLDS)
+    engine.ingest(record("vm-1", 1, 10.0, 10.0))
+    engine.ingest(record("vm-1", 2, 20.0, 10.0))
+    assert engine.ingest(record("vm-1", 2, 30.0, 10.0)) is None
+    assert engine.ingest(record("vm-1", 1, 30.0, 10.0)) is None
+    state = engine.states["vm-1"]
+    assert (state.stale, state.cpu) == (2, 20.0)
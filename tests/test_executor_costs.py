@@ -0,0 +1,19 @@
+import executor_agent
+from sku_optimizer import STATIC_CATALOG
+
+
+def test_ladder_prices_match_the_optimizer_catalog():
+    for size, price in executor_agent.VM_COSTS.items():
+        assert price == STATIC_CATALOG[size]["price_per_hour"]
+
+
+def test_hourly_cost_falls_back_to_the_catalog(monkeypatch):
+    monkeypatch.setattr(executor_agent.inventory, "skus", {})
+    # Not on the executor's ladder, but the cost-aware decider may pick it
+    assert executor_agent.hourly_cost("Standard_D4s_v5") == STATIC_CATALOG["Standard_D4s_v5"]["price_per_hour"]
+    assert executor_agent.hourly_cost("Standard_Unknown") == 0.0
+
+
+def test_hourly_cost_prefers_the_live_price(monkeypatch):
+    monkeypatch.setattr(executor_agent.inventory, "skus", {"Standard_D4s_v5": {"price_per_hour": 0.5}})
+    assert executor_agent.hourly_cost("Standard_D4s_v5") == 0.5
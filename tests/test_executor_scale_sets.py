@@ -0,0 +1,138 @@
+import asyncio
+import time
+import spade
+import executor_agent
+import monitoring_agent
+from resize_pipeline import ResizePipeline
+from sku_optimizer import STATIC_CATALOG
+from simulation import FakeComputeClient, SimulatedFleet, SimulationStats
+from vm_inventory import VMInventory
+
+GROUPS = [("sim", "rg")]
+
+
+class ExecutorHarness:
+    # The ExecutorAgent's instruction handling against the simulation's fake compute backend,
+    # without XMPP: confirmations to the DeciderAgent are collected in sent
+
+    def __init__(self, monkeypatch, upgrade_policy="Automatic", inventory_path=None):
+        self.fleet = SimulatedFleet(["vm-1", "vmss-1"], "Standard_B2s", None, time.time())
+        self.fleet.add_scale_set("vmss-1", 4)
+        self.fleet.upgrade_policies["vmss-1"] = upgrade_policy
+        self.stats = SimulationStats()
+        self.compute = FakeComputeClient(self.fleet, self.stats, resize_seconds=0, scale_out_seconds=0)
+        self.inventory = VMInventory(inventory_path)
+        self.inventory.skus = {size: dict(sku) for size, sku in STATIC_CATALOG.items()}
+        monkeypatch.setattr(executor_agent, "inventory", self.inventory)
+
+        agent = executor_agent.ExecutorAgent("executor@localhost", "test")
+        agent.store = None
+        agent.vms = {name: {"current_size": "Standard_B2s", "last_update_time": time.time(), "cost": 0.0}
+                     for name in self.fleet.names}
+        self.agent = agent
+        self.behaviour = executor_agent.ExecutorAgent.ExecuteBehaviour()
+        self.behaviour.set_agent(agent)
+        self.behaviour.traces = {}
+        self.sent = []
+
+        async def send(msg):
+            self.sent.append(msg.body)
+        self.behaviour.send = send
+
+    async def start(self):
+        await self.inventory.refresh_vms(lambda subscription: self.compute, GROUPS)
+        self.inventory.save()
+        self.agent.vms["vmss-1"]["capacity"] = self.inventory.capacity_of("vmss-1")
+        self.behaviour.pipeline = ResizePipeline(lambda subscription: self.compute, 10,
+                                                 on_done=self.behaviour.on_resized)
+
+    async def instruct(self, body):
+        self.behaviour.handle_instruction(spade.message.Message(to="executor@localhost", body=body))
+        await self.behaviour.pipeline.drain()
+
+
+def run(harness, test):
+    async def main():
+        await harness.start()
+        await test()
+    asyncio.run(main())
+
+
+def test_scale_out_and_in_change_the_capacity(monkeypatch):
+    harness = ExecutorHarness(monkeypatch)
+
+    async def test():
+        await harness.instruct("vmss-1:scale_out:6")
+        assert harness.fleet.capacities["vmss-1"] == 6
+        assert harness.fleet.sizes["vmss-1"] == "Standard_B2s"
+        assert harness.agent.vms["vmss-1"]["capacity"] == 6
+        assert harness.inventory.capacity_of("vmss-1") == 6
+
+        await harness.instruct("vmss-1:scale_in:3")
+        assert harness.fleet.capacities["vmss-1"] == 3
+        assert harness.agent.vms["vmss-1"]["capacity"] == 3
+        assert [body.split(":")[:3] for body in harness.sent] == [["vmss-1", "scale_out", "6"],
+                                                                   ["vmss-1", "scale_in", "3"]]
+        assert harness.stats.counters == {"capacity_changes_started": 2}
+    run(harness, test)
+
+
+def test_capacity_changes_in_the_wrong_direction_are_ignored(monkeypatch):
+    harness = ExecutorHarness(monkeypatch)
+
+    async def test():
+        await harness.instruct("vmss-1:scale_out:2")
+        await harness.instruct("vmss-1:scale_in:4")
+        await harness.instruct("vm-1:scale_out:3")  # Not a scale set
+        assert harness.fleet.capacities["vmss-1"] == 4
+        assert harness.sent == []
+        assert harness.stats.counters == {}
+    run(harness, test)
+
+
+def test_scale_set_resize_with_automatic_upgrades(monkeypatch):
+    harness = ExecutorHarness(monkeypatch)
+
+    async def test():
+        await harness.instruct("vmss-1:scale_up")
+        assert harness.fleet.sizes["vmss-1"] == "Standard_B4ms"
+        assert harness.fleet.capacities["vmss-1"] == 4
+        assert harness.agent.vms["vmss-1"]["current_size"] == "Standard_B4ms"
+    run(harness, test)
+
+
+def test_scale_set_with_manual_upgrades_is_not_resized(monkeypatch):
+    # Running instances would keep their size while the executor recorded the new one
+    harness = ExecutorHarness(monkeypatch, upgrade_policy="Manual")
+
+    async def test():
+        assert not harness.inventory.resizes_in_place("vmss-1")
+        assert harness.inventory.resizes_in_place("vm-1")
+        await harness.instruct("vmss-1:scale_up")
+        await harness.instruct("vmss-1:scale_down:Standard_B1s")
+        assert harness.fleet.sizes["vmss-1"] == "Standard_B2s"
+        assert harness.agent.vms["vmss-1"]["current_size"] == "Standard_B2s"
+        assert harness.sent == []
+
+        await harness.instruct("vmss-1:scale_out:5")  # Capacity changes still go through
+        assert harness.fleet.capacities["vmss-1"] == 5
+    run(harness, test)
+
+
+def test_monitor_reads_the_new_size_right_after_a_resize(monkeypatch, tmp_path):
+    # Another agent's view of the shared snapshot, e.g. the MonitoringAgent's
+    path = str(tmp_path / "vm_inventory.json")
+    harness = ExecutorHarness(monkeypatch, inventory_path=path)
+    monitor_inventory = VMInventory(path)
+    monkeypatch.setattr(monitoring_agent, "inventory", monitor_inventory)
+
+    async def test():
+        assert monitor_inventory.load()
+        assert monitor_inventory.size_of("vm-1") == "Standard_B2s"
+        await harness.instruct("vm-1:scale_up")
+        await harness.instruct("vmss-1:scale_out:6")
+        assert monitor_inventory.load()  # Without waiting for the listing TTL
+        assert monitor_inventory.size_of("vm-1") == "Standard_B4ms"
+        assert monitoring_agent.total_memory_bytes(monitor_inventory.size_of("vm-1")) == 16 * 1024 ** 3
+        assert monitor_inventory.capacity_of("vmss-1") == 6
+    run(harness, test)
@@ -0,0 +1,48 @@
+import math
+import numpy as np
+from fleet_evaluator import DECISIONS, FleetEvaluator
+
+THRESHOLDS = {
+    "upper": {"cpu": 80, "memory": 80, "disk_read": 50, "network_in": 500},
+    "lower": {"cpu": 20, "memory": 20, "disk_read": 10, "network_in": 100}
+}
+STRICT = {
+    "upper": {"cpu": 50, "memory": 50, "disk_read": 50, "network_in": 500},
+    "lower": {"cpu": 10, "memory": 10, "disk_read": 10, "network_in": 100}
+}
+
+
+def test_evaluate():
+    fleet = FleetEvaluator(THRESHOLDS, capacity=2)  # Grows past its initial capacity
+    fleet.update("up", [90, 50, 20, 200])
+    fleet.update("down", [5, 5, 5, 50])
+    fleet.update("steady", [50, 50, 20, 200])
+    fleet.update("unknown", [5, math.nan, 5, 50])
+    assert fleet.decisions() == {"up": "scale_up", "down": "scale_down", "steady": "no_action", "unknown": "no_action"}
+
+
+def test_tiers():
+    fleet = FleetEvaluator(THRESHOLDS, {"strict": STRICT}, {"vm-1": "strict"})
+    fleet.update("vm-1", [60, 20, 20, 200])
+    fleet.update("vm-2", [60, 20, 20, 200])
+    assert fleet.decisions() == {"vm-1": "scale_up", "vm-2": "no_action"}
+
+
+def test_tier_changes_do_not_touch_the_callers_mapping():
+    vm_tiers = {"vm-1": "strict"}
+    fleet = FleetEvaluator(THRESHOLDS, {"strict": STRICT}, vm_tiers)
+    fleet.update("vm-1", [60, 20, 20, 200])
+    fleet.assign_tier("vm-2", "strict")
+    fleet.remove("vm-1")
+    assert vm_tiers == {"vm-1": "strict"}
+
+
+def test_remove_keeps_rows_contiguous():
+    fleet = FleetEvaluator(THRESHOLDS)
+    for i, cpu in enumerate([90, 50, 5]):
+        fleet.update(f"vm-{i}", [cpu, 5, 5, 50])
+    fleet.remove("vm-0")
+    assert len(fleet) == 2
+    assert fleet.index == {"vm-2": 0, "vm-1": 1}
+    assert np.isnan(fleet.metrics[2]).all()
+    assert [DECISIONS[code] for code in fleet.evaluate().tolist()] == ["scale_down", "no_action"]
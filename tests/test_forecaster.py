@@ -0,0 +1,73 @@
+import os
+import decider_agent
+from decider_agent import FORECAST_CONFIDENCE, FORECAST_MARGIN_SECONDS, RESIZE_LEAD_TIME_SECONDS, THRESHOLDS, policy_decision
+from decision_engine import DecisionEngine
+from forecaster import LeadTimeEstimator, TrendForecaster
+from metrics_protocol import MetricsRecord
+from replay_logs import load_samples, replay, synthetic_ramp
+from scaling_policy import ScalingPolicy
+
+
+def new_policy():
+    return ScalingPolicy(decider_agent.SCALE_UP_WINDOW, decider_agent.SCALE_DOWN_WINDOW,
+                         decider_agent.SCALE_UP_COOLDOWN_SECONDS, decider_agent.SCALE_DOWN_COOLDOWN_SECONDS)
+
+
+def first_scale_up_leads(actions, breaches):
+    # Seconds between each breaching VM's first scale-up and its first breach (None: no scale-up)
+    return {vm_id: next((breach - timestamp for timestamp, action, _ in actions.get(vm_id, []) if action == "scale_up"), None)
+            for vm_id, breach in breaches.items()}
+
+
+def test_forecast_scales_up_a_resize_lead_time_before_the_breach():
+    # On ramps of 1.5 to 5 CPU points per minute, the resize is started early enough to
+    # finish before the first breaching sample
+    samples = synthetic_ramp(50)
+    _, reactive_actions, breaches = replay(samples, new_policy())
+    _, actions, _ = replay(samples, new_policy(), TrendForecaster(confidence=FORECAST_CONFIDENCE))
+    leads = first_scale_up_leads(actions, breaches)
+    assert len(leads) == 49
+    assert min(leads.values()) >= RESIZE_LEAD_TIME_SECONDS
+    assert max(first_scale_up_leads(reactive_actions, breaches).values()) < 0  # Reactive scaling is always late
+
+
+def test_forecast_adds_no_resizes_on_recorded_logs():
+    log = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "monitoring_agent.log")
+    samples = load_samples([log])
+    assert replay(samples, new_policy(), TrendForecaster(confidence=FORECAST_CONFIDENCE))[0] == replay(samples, new_policy())[0]
+
+
+def test_single_breaching_sample_is_not_forecast_into_a_scale_up():
+    # A flat load with one noisy sample above the threshold: the sample is held back by the
+    # breach window and the forecast (which extrapolates the jump) must not override that
+    engine = DecisionEngine(THRESHOLDS)
+    policy = new_policy()
+    forecaster = TrendForecaster(confidence=FORECAST_CONFIDENCE)
+    horizon = RESIZE_LEAD_TIME_SECONDS + FORECAST_MARGIN_SECONDS
+    decisions = []
+    for sequence, cpu in enumerate([50.0] * 10 + [85.0] + [50.0] * 5, start=1):
+        state = engine.ingest(MetricsRecord("vm-1", 60.0 * sequence, sequence, cpu, 40.0, 20.0, 200.0))
+        raw_decision = engine.evaluate_batch([state])[0]
+        decision, predicted = policy_decision(policy, forecaster, engine, state, raw_decision, state.timestamp, horizon)
+        decisions.append((raw_decision, decision))
+    assert decisions[10] == ("scale_up", "no_action")
+    assert forecaster.predicts_breach("vm-1", THRESHOLDS["upper"], horizon) == []
+    assert all(decision == "no_action" for _, decision in decisions)
+
+
+def test_noise_is_not_forecast_into_a_breach():
+    # CPU swinging around 60%: the point forecast ends above 80%, but not by more than its error
+    samples = [60, 52, 68, 55, 64, 50, 66, 54, 62, 72]
+    horizon = RESIZE_LEAD_TIME_SECONDS + FORECAST_MARGIN_SECONDS
+    for confidence, expected in ((0.0, ["cpu"]), (FORECAST_CONFIDENCE, [])):
+        forecaster = TrendForecaster(confidence=confidence)
+        for minute, cpu in enumerate(samples):
+            forecaster.update("vm-1", [cpu, 40.0, 20.0, 200.0], 60.0 * minute)
+        assert forecaster.forecast("vm-1", horizon)[0] > 80
+        assert forecaster.predicts_breach("vm-1", THRESHOLDS["upper"], horizon) == expected
+
+
+def test_lead_time_estimator():
+    estimator = LeadTimeEstimator(300, smoothing=0.5)
+    assert estimator.observe(100) == 100  # The first measurement replaces the initial guess
+    assert estimator.observe(200) == 150
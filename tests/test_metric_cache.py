@@ -0,0 +1,31 @@
+import math
+from metric_cache import MetricWindowCache
+
+
+def test_metric_missing_from_the_first_bucket_is_unknown():
+    cache = MetricWindowCache(retention_minutes=10)
+    cache.add("vm-1", [(60.0, {"cpu": 40.0}), (120.0, {"cpu": 50.0, "memory_available": 2e9})])
+    points = cache.window("vm-1", 10)
+    assert math.isnan(points[0][1][1])  # Not 0 bytes free
+    assert points[1][1][1] == 2e9
+
+    stats = cache.window_stats("vm-1", 10)
+    assert stats["memory_available"]["min"] == stats["memory_available"]["max"] == 2e9
+    assert stats["cpu"]["avg"] == 45.0
+    assert math.isnan(stats["disk_read_bytes"]["avg"])
+
+
+def test_missing_metric_keeps_the_previous_value():
+    cache = MetricWindowCache(retention_minutes=10)
+    cache.add("vm-1", [(60.0, {"cpu": 40.0, "memory_available": 1e9}), (120.0, {"cpu": 50.0})])
+    timestamp, metrics = cache.latest("vm-1")
+    assert (timestamp, metrics["cpu"], metrics["memory_available"]) == (120.0, 50.0, 1e9)
+    assert math.isnan(metrics["network_in_bytes"])
+
+
+def test_refetched_bucket_is_replaced_and_old_points_evicted():
+    cache = MetricWindowCache(retention_minutes=3)
+    assert cache.add("vm-1", [(60.0 * i, {"cpu": float(i)}) for i in range(1, 5)]) == 4
+    assert cache.add("vm-1", [(240.0, {"cpu": 9.0}), (300.0, {"cpu": 5.0})]) == 1
+    assert [point[0] for point in cache.window("vm-1", 10)] == [180.0, 240.0, 300.0]
+    assert cache.window("vm-1", 10)[1][1][0] == 9.0
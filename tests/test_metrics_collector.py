@@ -0,0 +1,150 @@
+import asyncio
+import math
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from metric_cache import MetricWindowCache
+from metrics_collector import (METRIC_NAMES, METRIC_NAMESPACE, SCALE_SET_NAMESPACE, iter_batched_fleet_metrics,
+                               iter_fleet_metrics)
+
+SUBSCRIPTION = "sub-a"
+RESOURCE_GROUP = "rg"
+LOCATION = "West Europe"
+SAMPLE_TIME = datetime(2025, 5, 21, 16, 0, tzinfo=timezone.utc)
+
+
+def metrics_result(resource_uri):
+    # One datapoint per metric, with metric IDs carrying the resource ID as Azure Monitor does
+    value = SimpleNamespace(timestamp=SAMPLE_TIME, average=50.0, total=1024.0)
+    return SimpleNamespace(metrics=[
+        SimpleNamespace(name=name, id=f"{resource_uri}/providers/Microsoft.Insights/metrics/{name}",
+                        timeseries=[SimpleNamespace(data=[value])])
+        for name in METRIC_NAMES
+    ])
+
+
+class FakeEndpoint:
+    # Azure Monitor stand-in that records every request: regional batch clients from
+    # client_for(region), and the per-resource query_resource of MetricsQueryClient
+    def __init__(self, omit=()):
+        self.batch_calls = []  # (region, namespace, resource IDs)
+        self.timespans = []  # (start, end) of each batch call
+        self.single_calls = 0
+        self.omit = set(omit)
+
+    def client_for(self, region):
+        endpoint = self
+
+        class BatchClient:
+            async def query_resources(self, resource_ids, metric_namespace=None, metric_names=None, timespan=None,
+                                      granularity=None, aggregations=None):
+                endpoint.batch_calls.append((region, metric_namespace, list(resource_ids)))
+                endpoint.timespans.append(timespan)
+                return [metrics_result(uri) for uri in resource_ids if uri.rsplit("/", 1)[-1] not in endpoint.omit]
+        return BatchClient()
+
+    async def query_resource(self, resource_uri, metric_names, timespan=None, granularity=None):
+        self.single_calls += 1
+        return metrics_result(resource_uri)
+
+
+def collect(results):
+    async def drain():
+        return [item async for item in results]
+    return asyncio.run(drain())
+
+
+def test_batched_requests_scale_with_vms_over_batch_size():
+    endpoint = FakeEndpoint()
+    vms = [{"id": f"vm-{i:03d}"} for i in range(500)]
+    results = collect(iter_batched_fleet_metrics(endpoint.client_for, vms, SUBSCRIPTION, RESOURCE_GROUP, LOCATION,
+                                                 50, 10, 30))
+    assert len(endpoint.batch_calls) == 10
+    assert all(len(resource_ids) == 50 for _, _, resource_ids in endpoint.batch_calls)
+    assert sorted(vm["id"] for vm, _, _ in results) == [vm["id"] for vm in vms]
+    for vm, datapoints, error in results:
+        assert error is None
+        assert datapoints == [(SAMPLE_TIME.timestamp(), {"cpu": 50.0, "memory_available": 50.0,
+                                                         "disk_read_bytes": 1024.0, "network_in_bytes": 1024.0})]
+
+
+def test_batch_size_is_capped_at_the_api_limit():
+    endpoint = FakeEndpoint()
+    vms = [{"id": f"vm-{i:03d}"} for i in range(120)]
+    collect(iter_batched_fleet_metrics(endpoint.client_for, vms, SUBSCRIPTION, RESOURCE_GROUP, LOCATION, 500, 10, 30))
+    assert [len(resource_ids) for _, _, resource_ids in endpoint.batch_calls] == [50, 50, 20]
+
+
+def test_unbatched_requests_are_one_per_vm():
+    endpoint = FakeEndpoint()
+    vms = [{"id": f"vm-{i:03d}"} for i in range(500)]
+    results = collect(iter_fleet_metrics(endpoint, vms, SUBSCRIPTION, RESOURCE_GROUP, 50, 30))
+    assert endpoint.single_calls == 500
+    assert all(error is None for _, _, error in results)
+
+
+def test_batches_are_grouped_by_subscription_region_and_resource_type():
+    vms = ([{"id": f"weu-{i}"} for i in range(60)]
+           + [{"id": f"neu-{i}", "location": "North Europe"} for i in range(30)]
+           + [{"id": f"sub-b-{i}", "subscription": "sub-b"} for i in range(10)]
+           + [{"id": f"other-rg-{i}", "resource_group": "rg-2"} for i in range(5)]
+           + [{"id": "pool", "scale_set": True}])
+    endpoint = FakeEndpoint()
+    results = collect(iter_batched_fleet_metrics(endpoint.client_for, vms, SUBSCRIPTION, RESOURCE_GROUP, LOCATION,
+                                                 50, 10, 30))
+    assert len(results) == len(vms)
+    assert all(error is None for _, _, error in results)
+
+    groups = {}
+    for region, namespace, resource_ids in endpoint.batch_calls:
+        subscriptions = {uri.split("/")[2] for uri in resource_ids}
+        assert len(subscriptions) == 1  # One subscription per request
+        assert all(f"/providers/{namespace}/" in uri for uri in resource_ids)
+        groups.setdefault((subscriptions.pop(), region, namespace), []).extend(resource_ids)
+    assert {key: len(resource_ids) for key, resource_ids in groups.items()} == {
+        ("sub-a", "westeurope", METRIC_NAMESPACE): 65,  # Resource groups share a batch
+        ("sub-a", "northeurope", METRIC_NAMESPACE): 30,
+        ("sub-b", "westeurope", METRIC_NAMESPACE): 10,
+        ("sub-a", "westeurope", SCALE_SET_NAMESPACE): 1
+    }
+    assert len(endpoint.batch_calls) == sum(math.ceil(count / 50) for count in (65, 30, 10, 1))
+    assert "/resourceGroups/rg-2/providers/Microsoft.Compute/virtualMachines/other-rg-0" in groups[
+        ("sub-a", "westeurope", METRIC_NAMESPACE)][-5]
+
+
+def test_vm_missing_from_a_batch_response_is_reported():
+    endpoint = FakeEndpoint(omit={"vm-1"})
+    vms = [{"id": f"vm-{i}"} for i in range(3)]
+    results = {vm["id"]: error for vm, _, error in collect(iter_batched_fleet_metrics(
+        endpoint.client_for, vms, SUBSCRIPTION, RESOURCE_GROUP, LOCATION, 50, 10, 30))}
+    assert results == {"vm-0": None, "vm-1": "missing from batch response", "vm-2": None}
+
+
+def test_uncached_vm_does_not_widen_the_other_batches():
+    # A new (or deallocated, silent) VM has nothing cached and needs the whole retention window
+    cache = MetricWindowCache(retention_minutes=60)
+    now = SAMPLE_TIME
+    vms = [{"id": f"vm-{i:03d}"} for i in range(101)]
+    for vm in vms[1:]:
+        cache.add(vm["id"], [((now - timedelta(minutes=2)).timestamp(), {"cpu": 10.0})])
+    endpoint = FakeEndpoint()
+    results = collect(iter_batched_fleet_metrics(endpoint.client_for, vms, SUBSCRIPTION, RESOURCE_GROUP, LOCATION,
+                                                 50, 10, 30, lambda vm: cache.query_timespan(vm["id"], now)))
+
+    assert len(results) == 101
+    calls = sorted(zip([len(ids) for _, _, ids in endpoint.batch_calls], endpoint.timespans))
+    assert [(size, end - start) for size, (start, end) in calls] == [
+        (1, timedelta(minutes=60)), (50, timedelta(minutes=2)), (50, timedelta(minutes=2))]
+
+
+def test_batches_split_where_starts_drift_apart():
+    cache = MetricWindowCache(retention_minutes=60)
+    now = SAMPLE_TIME
+    lags = [1, 2, 3, 10, 11, 30]  # Minutes since each VM's newest cached point
+    vms = [{"id": f"vm-{lag}"} for lag in lags]
+    for vm, lag in zip(vms, lags):
+        cache.add(vm["id"], [((now - timedelta(minutes=lag)).timestamp(), {"cpu": 10.0})])
+    endpoint = FakeEndpoint()
+    collect(iter_batched_fleet_metrics(endpoint.client_for, vms, SUBSCRIPTION, RESOURCE_GROUP, LOCATION,
+                                       50, 10, 30, lambda vm: cache.query_timespan(vm["id"], now)))
+    batches = sorted(sorted(uri.rsplit("/", 1)[-1] for uri in ids) for _, _, ids in endpoint.batch_calls)
+    assert batches == [["vm-1", "vm-2", "vm-3"], ["vm-10", "vm-11"], ["vm-30"]]
@@ -0,0 +1,82 @@
+import base64
+import math
+import pytest
+from decision_engine import sequence_delta
+from metrics_protocol import (HEADER, MAGIC, MAX_RECORDS_PER_MESSAGE, PROTOCOL_VERSION, MetricsRecord, ProtocolError,
+                              decode_records, encode_records, pack_records, split_records, unpack_records)
+
+
+def record(vm_id="vm-1", sequence=1, cpu=50.5, memory=25.25):
+    return MetricsRecord(vm_id, 1716307200.123, sequence, cpu, memory, 1.5, 200.0)
+
+
+def test_several_vms_round_trip_in_one_message():
+    records = [record("vm-1"), record("vm-réseau-été", 7, 99.0, 0.0), record("虚拟机-3", 8)]
+    assert decode_records(encode_records(records)) == records
+
+
+def test_nan_values_round_trip():
+    (decoded,) = decode_records(encode_records([record(cpu=math.nan, memory=math.nan)]))
+    assert math.isnan(decoded.cpu) and math.isnan(decoded.memory)
+    assert (decoded.disk_read, decoded.network_in) == (1.5, 200.0)
+
+
+def test_sequence_wraps_around_uint32():
+    (decoded,) = unpack_records(pack_records([record(sequence=2 ** 32 + 5)]))
+    assert decoded.sequence == 5
+    (last,) = unpack_records(pack_records([record(sequence=2 ** 32 - 1)]))
+    assert last.sequence == 0xFFFFFFFF
+    assert sequence_delta(decoded.sequence, last.sequence) == 6  # Still newer after the wrap
+
+
+def test_empty_message_round_trips():
+    assert decode_records(encode_records([])) == []
+
+
+def test_bad_magic_and_version_are_rejected():
+    data = pack_records([record()])
+    with pytest.raises(ProtocolError, match="Not a metrics message"):
+        unpack_records(b"XXXX" + data[4:])
+    with pytest.raises(ProtocolError, match="Unsupported protocol version"):
+        unpack_records(HEADER.pack(MAGIC, PROTOCOL_VERSION + 1, 1) + data[HEADER.size:])
+    with pytest.raises(ProtocolError, match="too short"):
+        unpack_records(MAGIC)
+
+
+def test_truncated_records_are_rejected():
+    data = pack_records([record(), record("vm-2")])
+    for cut in (HEADER.size, HEADER.size + 3, len(data) - 1):
+        with pytest.raises(ProtocolError, match="Truncated"):
+            unpack_records(data[:cut])
+
+
+def test_invalid_vm_id_is_rejected():
+    data = bytearray(pack_records([record("vm-é")]))
+    data[HEADER.size + 4] = 0xFF  # Break the UTF-8 of "é"
+    with pytest.raises(ProtocolError, match="corrupt"):
+        unpack_records(bytes(data))
+
+
+def test_trailing_bytes_are_rejected():
+    with pytest.raises(ProtocolError, match="Trailing bytes"):
+        unpack_records(pack_records([record()]) + b"\x00")
+
+
+def test_non_base64_body_is_rejected():
+    with pytest.raises(ProtocolError, match="not base64"):
+        decode_records("vm-1:scale_up")
+    with pytest.raises(ProtocolError, match="Not a metrics message"):
+        decode_records(base64.b64encode(b"hello world").decode("ascii"))
+
+
+def test_oversized_inputs_are_refused_when_packing():
+    with pytest.raises(ProtocolError, match="VM id too long"):
+        pack_records([record("v" * 256)])
+    with pytest.raises(ProtocolError, match="Too many records"):
+        pack_records([record()] * (MAX_RECORDS_PER_MESSAGE + 1))
+
+
+def test_split_records_respects_the_message_limit():
+    records = [record(f"vm-{i}") for i in range(5)]
+    assert [len(chunk) for chunk in split_records(records, 2)] == [2, 2, 1]
+    assert [len(chunk) for chunk in split_records(records, 0)] == [1] * 5
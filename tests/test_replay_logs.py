@@ -0,0 +1,58 @@
+import os
+import decider_agent
+import executor_agent
+from replay_logs import load_samples, replay
+from scaling_policy import ScalingPolicy
+
+RECORDED_LOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "monitoring_agent.log")
+
+
+def new_policy():
+    # The DeciderAgent's defaults
+    return ScalingPolicy(decider_agent.SCALE_UP_WINDOW, decider_agent.SCALE_DOWN_WINDOW,
+                         decider_agent.SCALE_UP_COOLDOWN_SECONDS, decider_agent.SCALE_DOWN_COOLDOWN_SECONDS)
+
+
+def samples_for(cpus, vm_id="vm-1"):
+    # One sample per minute with the given CPU values; the other metrics stay under their
+    # lower thresholds, so a low CPU sample is a scale-down signal
+    return [(60.0 * minute, vm_id, {"cpu": cpu, "memory": 10.0, "disk_read": 5.0, "network_in": 50.0})
+            for minute, cpu in enumerate(cpus)]
+
+
+def test_decider_ladder_matches_the_executor():
+    assert decider_agent.VERTICAL_SIZES == executor_agent.VM_SIZES
+
+
+def test_recorded_logs():
+    samples = load_samples([RECORDED_LOG])
+    assert len(samples) == 28
+    single_sample, _, _ = replay(samples)
+    damped, actions, _ = replay(samples, new_policy())
+    assert single_sample == 22
+    assert damped == 4
+    assert [[action for _, action, _ in vm_actions] for vm_actions in actions.values()] == [["scale_up", "scale_up"]] * 2
+
+
+def test_flapping_load_is_not_resized():
+    # CPU alternating between 90% and 10%: every sample resizes without the policy. With it,
+    # 3 of 5 breaching samples scale up (twice, 300 s cooldown in between) and 5 of 10 low
+    # samples never reach the 8 needed to scale down.
+    samples = samples_for([90.0, 10.0] * 15)
+    single_sample, _, _ = replay(samples)
+    damped, actions, _ = replay(samples, new_policy())
+    assert single_sample == 30
+    assert damped == 2
+    assert [(timestamp, action) for timestamp, action, _ in actions["vm-1"]] == [(240.0, "scale_up"), (600.0, "scale_up")]
+
+
+def test_cooldown_restarts_on_decisions_past_the_ladder_top():
+    # Sustained breach, then a drop, with a fast scale-down window (2 of 3). Scale-ups sent at
+    # the top of the ladder (minutes 12 and 17) are ignored by the executor but restart the
+    # cooldown, as in the DeciderAgent, so the first scale-down waits until minute 22.
+    policy = ScalingPolicy(decider_agent.SCALE_UP_WINDOW, (2, 3),
+                           decider_agent.SCALE_UP_COOLDOWN_SECONDS, decider_agent.SCALE_DOWN_COOLDOWN_SECONDS)
+    resizes, actions, _ = replay(samples_for([95.0] * 20 + [5.0] * 20), policy)
+    assert resizes == 4
+    assert [(timestamp, action) for timestamp, action, _ in actions["vm-1"]] == [
+        (120.0, "scale_up"), (420.0, "scale_up"), (1320.0, "scale_down"), (2220.0, "scale_down")]
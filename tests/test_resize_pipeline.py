@@ -0,0 +1,122 @@
+import asyncio
+from resize_pipeline import QUEUE_SECONDS, ResizePipeline
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeCompute:
+    # Compute client whose operations finish when the test releases them; records each PATCH
+    def __init__(self, fail=()):
+        self.updates = []
+        self.gates = {}
+        self.fail = set(fail)
+        self.virtual_machines = self
+        self.virtual_machine_scale_sets = self
+
+    async def begin_update(self, resource_group, name, parameters):
+        self.updates.append((resource_group, name, parameters))
+        gate = self.gates[name] = asyncio.Event()
+        compute = self
+
+        class Poller:
+            async def result(self):
+                await gate.wait()
+                if name in compute.fail:
+                    raise RuntimeError("Simulated resize failure")
+        return Poller()
+
+    async def release(self, name):
+        while name not in self.gates:
+            await asyncio.sleep(0)
+        self.gates[name].set()
+        for _ in range(5):  # Let the resize finish and the next one start
+            await asyncio.sleep(0)
+
+
+def run(test):
+    asyncio.run(test())
+
+
+def test_duration_excludes_the_wait_for_a_free_slot():
+    async def test():
+        clock = FakeClock()
+        compute = FakeCompute()
+        done = []
+
+        async def on_done(vm_name, direction, new_size, duration, error):
+            done.append((vm_name, new_size, duration, error))
+
+        QUEUE_SECONDS.reset()
+        pipeline = ResizePipeline(lambda subscription: compute, 1, on_done, clock)
+        assert pipeline.submit("vm-0", "scale_up", "Standard_B2s", "rg", "sub")
+        assert pipeline.submit("vm-1", "scale_up", "Standard_B2s", "rg", "sub")
+        assert pipeline.submit("vm-2", "scale_up", "Standard_B2s", "rg", "sub-2")  # Own subscription slot
+        await asyncio.sleep(0)
+        assert [name for _, name, _ in compute.updates] == ["vm-0", "vm-2"]
+
+        clock.now = 90.0
+        await compute.release("vm-0")
+        clock.now = 150.0
+        await compute.release("vm-1")
+        await compute.release("vm-2")
+        await pipeline.drain()
+
+        # vm-1 waited 90 s for vm-0's slot, then took 60 s
+        assert done == [("vm-0", "Standard_B2s", 90.0, None), ("vm-1", "Standard_B2s", 60.0, None),
+                        ("vm-2", "Standard_B2s", 150.0, None)]
+        assert QUEUE_SECONDS.count == 3
+        assert QUEUE_SECONDS.max == 90.0
+        assert compute.updates[0][2].hardware_profile.vm_size == "Standard_B2s"
+    run(test)
+
+
+def test_resize_in_flight_is_coalesced():
+    async def test():
+        compute = FakeCompute()
+        pipeline = ResizePipeline(lambda subscription: compute, 10, clock=FakeClock())
+        assert pipeline.submit("vm-0", "scale_up", "Standard_B2s", "rg", "sub")
+        assert pipeline.is_resizing("vm-0")
+        assert not pipeline.submit("vm-0", "scale_up", "Standard_B4ms", "rg", "sub")
+        await compute.release("vm-0")
+        await pipeline.drain()
+        assert not pipeline.is_resizing("vm-0")
+        assert len(compute.updates) == 1
+    run(test)
+
+
+def test_failed_resize_is_reported():
+    async def test():
+        compute = FakeCompute(fail={"vm-0"})
+        done = []
+
+        async def on_done(vm_name, direction, new_size, duration, error):
+            done.append((vm_name, error))
+
+        pipeline = ResizePipeline(lambda subscription: compute, 10, on_done, FakeClock())
+        pipeline.submit("vm-0", "scale_up", "Standard_B2s", "rg", "sub")
+        await compute.release("vm-0")
+        await pipeline.drain()
+        assert done == [("vm-0", "Simulated resize failure")]
+    run(test)
+
+
+def test_submit_does_not_wait_for_azure():
+    # The executor keeps draining its mailbox while resizes run: submitting many resizes
+    # returns at once, with at most max_concurrent_per_subscription PATCHes sent
+    async def test():
+        compute = FakeCompute()
+        pipeline = ResizePipeline(lambda subscription: compute, 10, clock=FakeClock())
+        for i in range(100):
+            assert pipeline.submit(f"vm-{i}", "scale_up", "Standard_B2s", "rg", "sub")
+        await asyncio.sleep(0)
+        assert len(pipeline.in_flight) == 100
+        assert len(compute.updates) == 10
+        pipeline.cancel_all()
+        await asyncio.gather(*pipeline.in_flight.values(), return_exceptions=True)
+    run(test)
@@ -0,0 +1,110 @@
+import math
+import numpy as np
+import pytest
+from sku_optimizer import STATIC_CATALOG, SkuOptimizer, catalog_from_inventory
+
+# Small catalog with round numbers; disk and network are unlimited (no capacity)
+CATALOG = {
+    "small": {"vcpus": 1, "memory_gb": 4, "disk_mb_per_second": None, "network_mbps": None, "price_per_hour": 1.0},
+    "medium": {"vcpus": 2, "memory_gb": 8, "disk_mb_per_second": None, "network_mbps": None, "price_per_hour": 2.0},
+    "large": {"vcpus": 4, "memory_gb": 16, "disk_mb_per_second": None, "network_mbps": None, "price_per_hour": 4.0}
+}
+
+
+def test_choose_upsizes_an_overloaded_vm():
+    optimizer = SkuOptimizer(STATIC_CATALOG)
+    # 1 vCPU fully used needs 2 vCPUs at 70%; Standard_B2s is the cheapest with 2 vCPUs
+    assert optimizer.choose("Standard_B1s", [100.0, 50.0, 1.0, 1.0]) == "Standard_B2s"
+
+
+def test_choose_downsizes_an_idle_vm():
+    optimizer = SkuOptimizer(STATIC_CATALOG)
+    assert optimizer.choose("Standard_B2s", [10.0, 10.0, 1.0, 1.0]) == "Standard_B1s"
+
+
+def test_choose_unknown_size():
+    optimizer = SkuOptimizer(STATIC_CATALOG)
+    assert optimizer.choose("Standard_Unknown", [100.0, 50.0, 1.0, 1.0]) is None
+
+
+def test_choose_respects_allowed_sizes():
+    optimizer = SkuOptimizer(CATALOG, allowed_sizes=["small", "large"])
+    assert optimizer.choose("small", [100.0, 10.0, 0.0, 0.0]) == "large"
+
+
+def test_cheapest_fit():
+    optimizer = SkuOptimizer(CATALOG)
+    demand = np.array([[0.5, 1.0, 0.0, 0.0],   # fits the smallest
+                       [2.0, 1.0, 0.0, 0.0],   # needs 2 / 0.7 vCPUs
+                       [math.nan, 1.0, 0.0, 0.0],  # unknown counts as no demand
+                       [100.0, 1.0, 0.0, 0.0]])  # fits nothing
+    choice, fitted = optimizer.cheapest_fit(demand)
+    assert [optimizer.sizes[index] for index in choice] == ["small", "large", "small", "large"]
+    assert fitted.tolist() == [True, True, True, False]
+
+
+def test_solve_fleet_matches_choose():
+    optimizer = SkuOptimizer(STATIC_CATALOG)
+    sizes = ["Standard_B1s", "Standard_B2s", "Standard_D4s_v5", "Standard_B4ms"]
+    metrics = [[100.0, 50.0, 1.0, 1.0], [10.0, 10.0, 1.0, 1.0], [70.0, 90.0, 600.0, 100.0], [50.0, 50.0, 0.0, 0.0]]
+    plan = optimizer.solve_fleet(sizes, metrics)
+    assert plan.sizes == [optimizer.choose(size, row) for size, row in zip(sizes, metrics)]
+    assert plan.cost_per_hour == pytest.approx(sum(STATIC_CATALOG[size]["price_per_hour"] for size in plan.sizes))
+    assert plan.deferred == []
+    assert plan.within_budget
+
+
+def test_solve_fleet_keeps_unknown_sizes_and_missing_metrics():
+    optimizer = SkuOptimizer(CATALOG)
+    plan = optimizer.solve_fleet(["mystery", "small"], [[100.0, 10.0, 0.0, 0.0], [100.0, math.nan, 0.0, 0.0]])
+    assert plan.sizes == ["mystery", "small"]
+    assert plan.cost_per_hour == pytest.approx(1.0)
+
+
+# Two small VMs that need medium (the first more overloaded) and a large VM that fits small
+BUDGET_SIZES = ["small", "small", "large"]
+BUDGET_METRICS = [[100.0, 10.0, 0.0, 0.0], [90.0, 10.0, 0.0, 0.0], [10.0, 10.0, 0.0, 0.0]]
+
+
+def test_solve_fleet_without_budget():
+    plan = SkuOptimizer(CATALOG).solve_fleet(BUDGET_SIZES, BUDGET_METRICS)
+    assert plan.sizes == ["medium", "medium", "small"]
+    assert plan.cost_per_hour == pytest.approx(5.0)
+
+
+def test_solve_fleet_defers_upsizes_over_budget():
+    # The downsize frees enough for one upsize: the most overloaded VM gets it
+    plan = SkuOptimizer(CATALOG).solve_fleet(BUDGET_SIZES, BUDGET_METRICS, budget_per_hour=4.0)
+    assert plan.sizes == ["medium", "small", "small"]
+    assert plan.deferred == [1]
+    assert plan.cost_per_hour == pytest.approx(4.0)
+    assert plan.within_budget
+
+
+def test_solve_fleet_reports_budget_it_cannot_meet():
+    plan = SkuOptimizer(CATALOG).solve_fleet(BUDGET_SIZES, BUDGET_METRICS, budget_per_hour=2.0)
+    assert plan.sizes == ["small", "small", "small"]
+    assert plan.deferred == [0, 1]
+    assert plan.cost_per_hour == pytest.approx(3.0)
+    assert not plan.within_budget
+
+
+def test_catalog_from_inventory():
+    skus = {
+        "Standard_B2s": {"vcpus": 2, "memory_gb": 4, "disk_bytes_per_second": 10 * 1024 * 1024, "price_per_hour": 0.05},
+        "Standard_B4ms": {"vcpus": 4, "memory_gb": 16},  # No live price: the fallback's
+        "Standard_New": {"vcpus": 8, "memory_gb": 64}  # No price anywhere: left out
+    }
+    catalog = catalog_from_inventory(skus)
+    assert set(catalog) == {"Standard_B2s", "Standard_B4ms"}
+    assert catalog["Standard_B2s"] == {"vcpus": 2, "memory_gb": 4, "disk_mb_per_second": 10.0,
+                                       "network_mbps": STATIC_CATALOG["Standard_B2s"]["network_mbps"],
+                                       "price_per_hour": 0.05}
+    assert catalog["Standard_B4ms"]["price_per_hour"] == STATIC_CATALOG["Standard_B4ms"]["price_per_hour"]
+    assert catalog["Standard_B4ms"]["disk_mb_per_second"] == STATIC_CATALOG["Standard_B4ms"]["disk_mb_per_second"]
+
+
+def test_catalog_from_inventory_without_fallback():
+    catalog = catalog_from_inventory({"Standard_X": {"vcpus": 2, "price_per_hour": 0.1}}, fallback={})
+    assert catalog == {"Standard_X": {"vcpus": 2, "memory_gb": None, "disk_mb_per_second": None,
+                                      "network_mbps": None, "price_per_hour": 0.1}}
@@ -0,0 +1,101 @@
+import sqlite3
+import pytest
+from state_store import StateStore
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_committed_state_survives_a_crash(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = StateStore(path)
+    store.record_size("vm-1", "Standard_B1s", 1000.0, 1000.0, 0.0)
+    store.record_cost("vm-1", "Standard_B1s", 1000.0, 4600.0, 0.01, 0.01)
+    store.record_size("vm-1", "Standard_B2s", 4600.0, 4600.0, 0.01)
+    store.flush()
+    store.record_cost("vm-1", "Standard_B2s", 4600.0, 8200.0, 0.04, 0.05)  # Never flushed
+    store.connection.close()  # No close(): no final flush, no checkpoint
+
+    recovered = StateStore(path)
+    assert recovered.load_vms() == {"vm-1": {"current_size": "Standard_B2s", "last_update_time": 4600.0,
+                                             "cost": 0.01}}
+    assert recovered.size_history("vm-1") == [("Standard_B1s", 1000.0), ("Standard_B2s", 4600.0)]
+    recovered.close()
+
+
+def test_pending_resizes_are_marked_interrupted(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = StateStore(path, clock=FakeClock())
+    done = store.begin_resize("vm-1", "scale_up", "Standard_B1s", "Standard_B2s", "trace-1")
+    store.begin_resize("vm-2", "scale_down", "Standard_B2s", "Standard_B1s", "trace-2")
+    store.finish_resize(done)
+    store.flush()
+    store.connection.close()
+
+    recovered = StateStore(path)
+    (interrupted,) = recovered.interrupted_resizes()
+    assert {key: interrupted[key] for key in ("vm", "direction", "to_size", "trace_id")} == {
+        "vm": "vm-2", "direction": "scale_down", "to_size": "Standard_B1s", "trace_id": "trace-2"}
+    statuses = dict(recovered.connection.execute("SELECT vm, status FROM resize_operations"))
+    assert statuses == {"vm-1": "done", "vm-2": "interrupted"}
+    assert recovered.interrupted_resizes() == []  # Reported once
+    recovered.close()
+
+
+def test_failed_flush_keeps_the_queue(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = StateStore(path)
+    store.connection.execute("PRAGMA busy_timeout=0")
+    store.record_size("vm-1", "Standard_B2s", 1000.0, 1000.0, 0.0)
+
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")  # Another writer holds the lock
+    with pytest.raises(sqlite3.OperationalError):
+        store.flush()
+    assert store.pending_count == 2
+    other.execute("ROLLBACK")
+    other.close()
+
+    assert store.flush() == 2
+    assert store.pending_count == 0
+    assert store.load_vms()["vm-1"]["current_size"] == "Standard_B2s"
+    assert store.size_history("vm-1") == [("Standard_B2s", 1000.0)]  # Written once
+    store.close()
+
+
+def test_full_queue_is_flushed_early():
+    clock = FakeClock()
+    store = StateStore(":memory:", flush_interval_seconds=60, max_pending=4, clock=clock)
+    store.record_cost("vm-1", "Standard_B1s", 0.0, 60.0, 0.1, 0.1)
+    assert store.flush_if_due() == 0  # Not due yet
+    assert store.pending_count == 2
+    store.record_cost("vm-1", "Standard_B1s", 60.0, 120.0, 0.1, 0.2)  # Fourth write: flushed now
+    assert store.pending_count == 0
+    assert store.cost_between(0.0, 120.0) == pytest.approx(0.2)
+
+    store.record_cost("vm-1", "Standard_B1s", 120.0, 180.0, 0.1, 0.3)
+    clock.now += 60
+    assert store.flush_if_due() == 2
+    store.close()
+
+
+def test_costs_are_prorated_at_the_range_bounds():
+    store = StateStore(":memory:")
+    store.record_cost("vm-1", "Standard_B1s", 0.0, 100.0, 1.0, 1.0)
+    store.record_cost("vm-1", "Standard_B2s", 100.0, 200.0, 2.0, 3.0)
+    store.record_cost("vm-2", "Standard_B1s", 50.0, 150.0, 4.0, 4.0)
+    store.record_cost("vm-2", "Standard_B1s", 150.0, 150.0, 0.5, 4.5)  # Zero-length interval
+    store.flush()
+
+    # vm-1: 1.0 * 0.25 + 2.0 * 0.25; vm-2: 4.0 * 0.5
+    assert store.cost_between(75.0, 125.0, "vm-1") == pytest.approx(0.75)
+    assert store.cost_by_vm(75.0, 125.0) == pytest.approx({"vm-1": 0.75, "vm-2": 2.0})
+    assert store.cost_between(75.0, 175.0) == pytest.approx(1.0 * 0.25 + 2.0 * 0.75 + 4.0 * 0.75)
+    assert store.cost_between(300.0, 400.0) == 0
+    assert store.cost_between(0.0, 200.0, "vm-1") == pytest.approx(3.0)
+    store.close()
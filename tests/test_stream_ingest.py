@@ -0,0 +1,151 @@
+import asyncio
+import math
+from metrics_protocol import MetricsRecord
+from stream_ingest import FRAME, MAX_FRAME_BYTES, StreamIngestServer, StreamingCollector, frame
+
+
+def record(vm_id, cpu, memory=50.0, timestamp=1000.0):
+    return MetricsRecord(vm_id, timestamp, 1, cpu, memory, 1.0, 2.0)
+
+
+async def until(condition, timeout=2.0):
+    # Wait for the server side of the loopback connection to catch up
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "Timed out waiting for the server"
+        await asyncio.sleep(0.01)
+
+
+async def serve(**options):
+    server = StreamIngestServer("127.0.0.1", 0, **options)
+    await server.start()
+    reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+    return server, reader, writer
+
+
+def run(test):
+    asyncio.run(test())
+
+
+def test_frames_split_across_writes_are_averaged_per_vm():
+    async def test():
+        server, _, writer = await serve()
+        data = frame([record("vm-a", 20.0, timestamp=1000.0), record("vm-b", 90.0)])
+        data += frame([record("vm-a", 40.0, math.nan, timestamp=1005.0)])
+        for i in range(0, len(data), 7):  # Headers and payloads arrive in pieces
+            writer.write(data[i:i + 7])
+            await writer.drain()
+        await until(lambda: sum(aggregate.count for aggregate in server.pending.values()) == 3)
+
+        records = {record.vm_id: record for record in server.drain()}
+        assert records["vm-a"].cpu == 30.0
+        assert records["vm-a"].memory == 50.0  # The NaN sample is left out of the average
+        assert records["vm-a"].timestamp == 1005.0
+        assert records["vm-b"].cpu == 90.0
+        assert server.drain() == []
+        assert server.is_fresh("vm-a", 30)
+        assert not server.is_fresh("vm-c", 30)
+        writer.close()
+        await server.close()
+    run(test)
+
+
+def test_full_buffer_stops_reading_until_drained():
+    async def test():
+        server, _, writer = await serve(max_buffered_vms=2)
+        writer.write(frame([record("vm-a", 10.0), record("vm-b", 20.0), record("vm-c", 30.0),
+                            record("vm-a", 30.0)]))
+        await writer.drain()
+        await until(lambda: len(server.pending) == 2)
+        await asyncio.sleep(0.05)
+        assert sorted(server.pending) == ["vm-a", "vm-b"]  # vm-c waits for room
+        assert server.pending["vm-a"].count == 1
+
+        assert sorted(record.vm_id for record in server.drain()) == ["vm-a", "vm-b"]
+        await until(lambda: "vm-a" in server.pending)
+        records = {record.vm_id: record for record in server.drain()}
+        assert sorted(records) == ["vm-a", "vm-c"]
+        assert records["vm-a"].cpu == 30.0
+        writer.close()
+        await server.close()
+    run(test)
+
+
+def test_records_for_unmonitored_vms_are_dropped():
+    async def test():
+        server, _, writer = await serve(max_buffered_vms=1, accepts={"vm-a"}.__contains__)
+        writer.write(frame([record("intruder-1", 99.0), record("intruder-2", 99.0), record("vm-a", 40.0)]))
+        await writer.drain()
+        await until(lambda: "vm-a" in server.pending)  # Dropped records take no buffer room
+        assert server.rejected == 2
+        assert [record.vm_id for record in server.drain()] == ["vm-a"]
+        assert not server.is_fresh("intruder-1", 30)
+        writer.close()
+        await server.close()
+    run(test)
+
+
+def test_oversized_frame_drops_the_connection():
+    async def test():
+        server, reader, writer = await serve()
+        await until(lambda: server.connections == 1)
+        writer.write(FRAME.pack(MAX_FRAME_BYTES + 1))
+        await writer.drain()
+        assert await reader.read() == b""  # Closed by the server
+        await until(lambda: server.connections == 0)
+        writer.close()
+        await server.close()
+    run(test)
+
+
+def test_collector_streams_to_the_server():
+    async def test():
+        server = StreamIngestServer("127.0.0.1", 0)
+        await server.start()
+        collector = StreamingCollector("127.0.0.1", server.port, lambda: [("vm-a", (25.0, math.nan, 1.0, 2.0))],
+                                       sample_seconds=0.01, send_seconds=0.05)
+        task = asyncio.ensure_future(collector.run())
+        await until(lambda: "vm-a" in server.pending)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        (streamed,) = server.drain()
+        assert (streamed.cpu, streamed.disk_read, streamed.network_in) == (25.0, 1.0, 2.0)
+        assert math.isnan(streamed.memory)
+        assert collector.frames_sent >= 1
+        await server.close()
+    run(test)
+
+
+def test_monitor_forwards_one_average_per_decider_interval(monkeypatch):
+    # The decider's windows count samples and its forecaster steps are one sample interval,
+    # so a minute of 5-second frames must reach it as one record
+    import decider_agent
+    import monitoring_agent
+
+    assert monitoring_agent.STREAM_FORWARD_INTERVAL_SECONDS == decider_agent.FORECAST_INTERVAL_SECONDS
+    agent = monitoring_agent.MonitoringAgent("monitor@localhost", "test")
+    agent.shards = None
+    agent.stream_server = StreamIngestServer("127.0.0.1", 0)
+    behaviour = monitoring_agent.MonitoringAgent.StreamBehaviour()
+    behaviour.set_agent(agent)
+    sent = []
+    slept = []
+
+    async def send_metrics(records):
+        sent.extend(records)
+
+    async def sleep(seconds):
+        slept.append(seconds)
+    behaviour.send_metrics = send_metrics
+    monkeypatch.setattr(monitoring_agent.asyncio, "sleep", sleep)
+    monkeypatch.setattr(monitoring_agent.time, "time", lambda: 1030.0)
+
+    for i in range(12):
+        agent.stream_server.add(record("vm-a", 85.0 + i % 2 * 10, timestamp=960.0 + 5 * i))
+    asyncio.run(behaviour.run())
+    assert slept == [50.0]  # Until the next interval boundary
+    (forwarded,) = sent
+    assert (forwarded.vm_id, forwarded.cpu, forwarded.timestamp) == ("vm-a", 90.0, 1015.0)
+    assert forwarded.sequence == monitoring_agent.sequence_numbers["vm-a"]
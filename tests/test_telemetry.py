@@ -0,0 +1,87 @@
+import math
+import pytest
+from telemetry import Counter, Histogram, Registry
+
+
+def test_quantile_is_the_upper_bound_of_its_bucket():
+    histogram = Histogram("latency_seconds", "Latency", (1, 2, 5))
+    for value in (0.5, 1.5, 2, 3):  # A value on a bound counts in that bound's bucket
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 1, 0]
+    assert histogram.quantile(0.25) == 1
+    assert histogram.quantile(0.5) == 2
+    assert histogram.quantile(0.75) == 2
+    assert histogram.quantile(1.0) == 3  # Bucket bound 5, capped at the largest value seen
+
+
+def test_quantile_in_the_overflow_bucket_is_the_max():
+    histogram = Histogram("latency_seconds", "Latency", (1, 2, 5))
+    for value in (0.5, 1.5, 10, 20):
+        histogram.observe(value)
+    assert histogram.counts == [1, 1, 0, 2]
+    assert histogram.quantile(0.5) == 2
+    assert histogram.quantile(0.75) == 20
+    assert histogram.quantile(0.99) == 20
+
+
+def test_quantile_below_the_smallest_bound_is_the_max():
+    histogram = Histogram("latency_seconds", "Latency", (1, 2, 5))
+    histogram.observe(0.2)
+    assert histogram.quantile(0.5) == 0.2
+
+
+def test_empty_histogram():
+    histogram = Histogram("latency_seconds", "Latency", (1, 2, 5))
+    assert histogram.quantile(0.5) == 0.0
+    assert histogram.quantile(0.99) == 0.0
+    assert histogram.snapshot() == {"count": 0, "sum": 0.0, "min": 0.0, "max": 0.0, "p50": 0.0, "p99": 0.0}
+
+    histogram.observe(3)
+    histogram.reset()
+    assert histogram.count == 0 and histogram.counts == [0, 0, 0, 0]
+    assert histogram.min == math.inf and histogram.quantile(0.5) == 0.0
+
+
+def test_render_prometheus_text_format():
+    registry = Registry()
+    histogram = registry.register(Histogram("resize_seconds", "Resize duration", (1, 2)))
+    counter = registry.register(Counter("errors_total", "Errors"))
+    counter.inc(3)
+    for value in (0.5, 1.5, 1.5, 4):
+        histogram.observe(value)
+    assert registry.render() == (
+        "# HELP vmscaler_errors_total Errors\n"
+        "# TYPE vmscaler_errors_total counter\n"
+        "vmscaler_errors_total 3\n"
+        "# HELP vmscaler_resize_seconds Resize duration\n"
+        "# TYPE vmscaler_resize_seconds histogram\n"
+        'vmscaler_resize_seconds_bucket{le="1"} 1\n'
+        'vmscaler_resize_seconds_bucket{le="2"} 3\n'
+        'vmscaler_resize_seconds_bucket{le="+Inf"} 4\n'
+        "vmscaler_resize_seconds_sum 7.5\n"
+        "vmscaler_resize_seconds_count 4\n"
+    )
+    assert registry.snapshot() == {
+        "errors_total": 3,
+        "resize_seconds": {"count": 4, "sum": 7.5, "min": 0.5, "max": 4, "p50": 2, "p99": 4}
+    }
+
+
+def test_empty_registry_renders_a_blank_line():
+    assert Registry().render() == "\n"
+
+
+def test_duplicate_name_returns_the_registered_metric():
+    registry = Registry()
+    first = registry.register(Counter("errors_total", "Errors"))
+    first.inc()
+    assert registry.register(Counter("errors_total", "Errors")) is first
+    assert first.value == 1
+
+
+def test_duplicate_name_with_another_type_is_rejected():
+    registry = Registry()
+    registry.register(Counter("errors_total", "Errors"))
+    with pytest.raises(ValueError, match="already registered as Counter"):
+        registry.register(Histogram("errors_total", "Errors"))
+    assert isinstance(registry.metrics["errors_total"], Counter)
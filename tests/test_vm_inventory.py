@@ -0,0 +1,86 @@
+import asyncio
+from types import SimpleNamespace
+from vm_inventory import VMInventory
+
+
+class AsyncList:
+    def __init__(self, items):
+        self.items = items
+
+    async def __aiter__(self):
+        for item in self.items:
+            yield item
+
+
+def scale_set(name, sku, mode=None, etag='"1"'):
+    return SimpleNamespace(
+        name=name, etag=etag, location="westeurope", sku=sku,
+        id=f"/subscriptions/sub/resourceGroups/rg/providers/Microsoft.Compute/virtualMachineScaleSets/{name}",
+        upgrade_policy=SimpleNamespace(mode=mode) if mode else None
+    )
+
+
+def client(vms, scale_sets):
+    return SimpleNamespace(
+        virtual_machines=SimpleNamespace(list=lambda resource_group: AsyncList(vms)),
+        virtual_machine_scale_sets=SimpleNamespace(list=lambda resource_group: AsyncList(scale_sets))
+    )
+
+
+def test_scale_set_without_sku_does_not_abort_the_listing():
+    vm = SimpleNamespace(
+        name="vm-1", etag='"1"', location="westeurope",
+        id="/subscriptions/sub/resourceGroups/rg/providers/Microsoft.Compute/virtualMachines/vm-1",
+        hardware_profile=SimpleNamespace(vm_size="Standard_B1s")
+    )
+    scale_sets = [scale_set("flex-1", None),
+                  scale_set("vmss-1", SimpleNamespace(name="Standard_B2s", capacity=3), "Rolling"),
+                  scale_set("vmss-2", SimpleNamespace(name="Standard_B2s", capacity=2), "Manual")]
+    inventory = VMInventory(None)
+    assert asyncio.run(inventory.refresh_vms(lambda subscription: client([vm], scale_sets), [("sub", "rg")])) == 3
+
+    assert sorted(inventory.vms) == ["vm-1", "vmss-1", "vmss-2"]
+    assert inventory.size_of("vm-1") == "Standard_B1s"
+    assert inventory.capacity_of("vmss-1") == 3
+    assert inventory.resizes_in_place("vm-1")
+    assert inventory.resizes_in_place("vmss-1")
+    assert not inventory.resizes_in_place("vmss-2")
+
+
+def test_snapshot_entries_without_an_upgrade_policy_are_listed_again():
+    inventory = VMInventory(None)
+    inventory.vms = {"vmss-1": {"size": "Standard_B2s", "capacity": 3, "scale_set": True, "etag": '"1"',
+                                "location": "westeurope", "resource_group": "rg", "subscription": "sub"}}
+    scale_sets = [scale_set("vmss-1", SimpleNamespace(name="Standard_B2s", capacity=3), "Automatic")]
+    assert asyncio.run(inventory.refresh_vms(lambda subscription: client([], scale_sets), [("sub", "rg")])) == 1
+    assert inventory.vms["vmss-1"]["upgrade_policy"] == "Automatic"
+    # Unchanged ETag from then on
+    assert asyncio.run(inventory.refresh_vms(lambda subscription: client([], scale_sets), [("sub", "rg")])) == 0
+
+
+def test_persisted_change_goes_on_top_of_the_newest_snapshot(tmp_path):
+    path = str(tmp_path / "vm_inventory.json")
+    executor = VMInventory(path)
+    executor.vms = {"vm-1": {"size": "Standard_B1s", "etag": '"1"'}, "vmss-1": {"size": "Standard_B2s", "capacity": 2}}
+    executor.save()
+    decider = VMInventory(path)
+    decider.load()
+
+    # Meanwhile another agent lists the SKUs
+    monitor = VMInventory(path)
+    monitor.load()
+    monitor.skus = {"Standard_B2s": {"memory_gb": 4.0}}
+    monitor.vms["vmss-1"]["capacity"] = 3
+    monitor.save()
+
+    executor.set_size("vm-1", "Standard_B2s", persist=True)
+    decider.set_capacity("vmss-1", 4)  # In memory only, until the executor's snapshot arrives
+    assert decider.load()
+    assert decider.size_of("vm-1") == "Standard_B2s"
+    assert decider.vms["vm-1"]["etag"] is None  # Listed again on the next refresh
+    assert decider.capacity_of("vmss-1") == 3
+    assert decider.memory_bytes("Standard_B2s") == 4 * 1024 ** 3
+
+    executor.set_capacity("vmss-1", 4, persist=True)
+    assert decider.load()
+    assert decider.capacity_of("vmss-1") == 4
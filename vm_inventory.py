@@ -0,0 +1,315 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+# Shared VM inventory and SKU catalog. One agent lists the VMs of each resource group and
+# the VM SKUs of each region in bulk (one paged list call each, instead of a GET per VM)
+# and writes a JSON snapshot; every agent reads sizes, memory, vCPUs and prices from it.
+#
+# Snapshot layout:
+#   {"vms": {vm name: {"size", "location", "resource_group", "subscription", "etag"}},
+#    (a VM Scale Set is listed like a VM, its "size" being the instances' size, plus
+#    "scale_set": true, "capacity", its instance count, and "upgrade_policy")
+#    "skus": {size: {"vcpus", "memory_gb", "price_per_hour", ...}},
+#    "vms_fetched_at": epoch, "skus_fetched_at": {region: epoch}}
+
+RETAIL_PRICES_URL = "https://prices.azure.com/api/retail/prices"
+
+# Scale set upgrade policies that move running instances to a new SKU. With "Manual" only
+# instances created afterwards get it.
+IN_PLACE_UPGRADE_POLICIES = ("Automatic", "Rolling")
+
+# ResourceSku capabilities kept in the catalog (name in Azure -> key in the snapshot)
+SKU_CAPABILITIES = {
+    "vCPUs": "vcpus",
+    "MemoryGB": "memory_gb",
+    "UncachedDiskBytesPerSecond": "disk_bytes_per_second",
+    "MaxNetworkInterfaces": "max_network_interfaces"
+}
+
+
+def size_name(vm_size):
+    # hardware_profile.vm_size may come back as a VirtualMachineSizeTypes enum member
+    return getattr(vm_size, "value", vm_size)
+
+
+def resource_group_of(resource_id):
+    # "/subscriptions/<sub>/resourceGroups/<rg>/providers/..." -> "<rg>"
+    parts = resource_id.split("/")
+    lowered = [part.lower() for part in parts]
+    return parts[lowered.index("resourcegroups") + 1] if "resourcegroups" in lowered else None
+
+
+def parse_sku(sku):
+    # vCPUs, memory and the other SKU_CAPABILITIES of one ResourceSku, or None when it
+    # is not a VM size or cannot be deployed in this subscription
+    if sku.resource_type != "virtualMachines":
+        return None
+    if any(restriction.reason_code == "NotAvailableForSubscription" for restriction in sku.restrictions or []):
+        return None
+    entry = {}
+    for capability in sku.capabilities or []:
+        key = SKU_CAPABILITIES.get(capability.name)
+        if key is not None:
+            try:
+                entry[key] = float(capability.value)
+            except (TypeError, ValueError):
+                continue
+    return entry if "memory_gb" in entry else None
+
+
+class VMInventory:
+    # vm_ttl_seconds: how long the VM list is trusted before it is listed again
+    # sku_ttl_seconds: same for the SKU catalog of a region (it changes rarely)
+    # path: JSON snapshot shared between agents (None keeps the inventory in memory only)
+
+    def __init__(self, path=None, vm_ttl_seconds=300, sku_ttl_seconds=86400, clock=time.time):
+        self.path = path
+        self.vm_ttl_seconds = vm_ttl_seconds
+        self.sku_ttl_seconds = sku_ttl_seconds
+        self.clock = clock
+        self.vms = {}
+        self.skus = {}
+        self.vms_fetched_at = None
+        self.skus_fetched_at = {}
+        self.loaded_mtime = None
+
+    # --- Snapshot -----------------------------------------------------------------------
+
+    def load(self):
+        # Re-read the snapshot if another agent has written a newer one. Returns True if it did.
+        if self.path is None:
+            return False
+        try:
+            mtime = os.stat(self.path).st_mtime
+            if mtime == self.loaded_mtime:
+                return False
+            with open(self.path, encoding="utf-8") as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logging.warning(f"VMInventory: Could not read {self.path}: {str(e)}")
+            return False
+        self.vms = snapshot.get("vms", {})
+        self.skus = snapshot.get("skus", {})
+        self.vms_fetched_at = snapshot.get("vms_fetched_at")
+        self.skus_fetched_at = snapshot.get("skus_fetched_at", {})
+        self.loaded_mtime = mtime
+        return True
+
+    def save(self):
+        # Atomic replace, so readers never see a half-written snapshot
+        if self.path is None:
+            return
+        snapshot = {
+            "vms": self.vms,
+            "skus": self.skus,
+            "vms_fetched_at": self.vms_fetched_at,
+            "skus_fetched_at": self.skus_fetched_at
+        }
+        temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as snapshot_file:
+            json.dump(snapshot, snapshot_file)
+        os.replace(temporary_path, self.path)
+        self.loaded_mtime = os.stat(self.path).st_mtime
+
+    # --- Refresh ------------------------------------------------------------------------
+
+    def vms_stale(self, now=None):
+        now = self.clock() if now is None else now
+        return self.vms_fetched_at is None or now - self.vms_fetched_at >= self.vm_ttl_seconds
+
+    def skus_stale(self, region, now=None):
+        now = self.clock() if now is None else now
+        fetched_at = self.skus_fetched_at.get(region)
+        return fetched_at is None or now - fetched_at >= self.sku_ttl_seconds
+
+    async def refresh_if_stale(self, get_client, groups, regions, prices=False):
+        # groups: (subscription, resource group) pairs to list VMs from
+        # regions: (subscription, region) pairs to list SKUs for
+        # Picks up a fresher snapshot written by another agent first, so only one agent
+        # per TTL actually calls Azure. Returns True if anything was listed.
+        self.load()
+        now = self.clock()
+        refreshed = False
+        if self.vms_stale(now):
+            await self.refresh_vms(get_client, groups)
+            refreshed = True
+        for subscription, region in regions:
+            if self.skus_stale(region, now):
+                await self.refresh_skus(get_client, subscription, region)
+                if prices:
+                    try:
+                        await self.refresh_prices(region)
+                    except Exception as e:
+                        logging.warning(f"VMInventory: Could not fetch retail prices for {region}: {str(e)}")
+                refreshed = True
+        if refreshed:
+            self.save()
+        return refreshed
+
+    async def refresh_vms(self, get_client, groups):
+        # One paged list call per resource group for VMs and one for scale sets. An entry whose
+        # ETag is unchanged is kept as is; VMs that disappeared from a listed group are dropped.
+        async def list_group(subscription, resource_group):
+            client = get_client(subscription)
+            vms = [vm async for vm in client.virtual_machines.list(resource_group)]
+            scale_sets = [scale_set async for scale_set in client.virtual_machine_scale_sets.list(resource_group)]
+            return subscription, resource_group, vms + scale_sets
+
+        changed = 0
+        listed = set()
+        results = await asyncio.gather(*(list_group(sub, rg) for sub, rg in groups), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logging.error(f"VMInventory: Failed to list VMs: {str(result)}")
+                continue
+            subscription, resource_group, vms = result
+            for vm in vms:
+                if getattr(vm, "hardware_profile", None) is None and vm.sku is None:
+                    # Flexible scale set without a VM profile: its VMs are listed on their own
+                    continue
+                listed.add(vm.name)
+                entry = self.vms.get(vm.name)
+                if (entry is not None and vm.etag and entry.get("etag") == vm.etag
+                        and (not entry.get("scale_set") or "upgrade_policy" in entry)):
+                    continue
+                entry = {
+                    "location": vm.location,
+                    "resource_group": resource_group_of(vm.id) or resource_group,
+                    "subscription": subscription,
+                    "etag": vm.etag
+                }
+                if getattr(vm, "hardware_profile", None) is not None:
+                    entry["size"] = size_name(vm.hardware_profile.vm_size)
+                else:
+                    # VirtualMachineScaleSet: size and instance count are in its SKU
+                    policy = vm.upgrade_policy.mode if getattr(vm, "upgrade_policy", None) is not None else None
+                    entry.update(size=vm.sku.name, capacity=vm.sku.capacity, scale_set=True,
+                                 upgrade_policy=size_name(policy))
+                self.vms[vm.name] = entry
+                changed += 1
+
+        # Only prune groups that were listed successfully
+        listed_groups = {(r[0], r[1].lower()) for r in results if not isinstance(r, Exception)}
+        for vm_name, entry in list(self.vms.items()):
+            group = (entry["subscription"], entry["resource_group"].lower())
+            if group in listed_groups and vm_name not in listed:
+                del self.vms[vm_name]
+                changed += 1
+        self.vms_fetched_at = self.clock()
+        logging.info(f"VMInventory: Listed {len(listed)} VMs in {len(listed_groups)} resource groups, "
+                     f"{changed} changed")
+        return changed
+
+    async def refresh_skus(self, get_client, subscription, region):
+        # One paged list call for every SKU of the region; prices already known are kept
+        client = get_client(subscription)
+        count = 0
+        async for sku in client.resource_skus.list(filter=f"location eq '{region}'"):
+            entry = parse_sku(sku)
+            if entry is None:
+                continue
+            price = self.skus.get(sku.name, {}).get("price_per_hour")
+            if price is not None:
+                entry["price_per_hour"] = price
+            self.skus[sku.name] = entry
+            count += 1
+        self.skus_fetched_at[region] = self.clock()
+        logging.info(f"VMInventory: Loaded {count} VM SKUs for {region}")
+        return count
+
+    async def refresh_prices(self, region, session=None):
+        # Linux pay-as-you-go hourly prices from the public Azure Retail Prices API
+        import aiohttp
+
+        query = (f"serviceName eq 'Virtual Machines' and armRegionName eq '{region}' "
+                 f"and priceType eq 'Consumption'")
+        owns_session = session is None
+        session = session or aiohttp.ClientSession()
+        prices = {}
+        try:
+            url, params = RETAIL_PRICES_URL, {"$filter": query}
+            while url:
+                async with session.get(url, params=params) as response:
+                    response.raise_for_status()
+                    page = await response.json()
+                for item in page.get("Items", []):
+                    if "Windows" in item.get("productName", "") or any(
+                            tag in item.get("skuName", "") for tag in ("Spot", "Low Priority")):
+                        continue
+                    name = item.get("armSkuName")
+                    if name:
+                        prices[name] = min(prices.get(name, float("inf")), item["retailPrice"])
+                url, params = page.get("NextPageLink"), None
+        finally:
+            if owns_session:
+                await session.close()
+        for name, price in prices.items():
+            if name in self.skus:
+                self.skus[name]["price_per_hour"] = price
+        return len(prices)
+
+    # --- Lookups ------------------------------------------------------------------------
+
+    def size_of(self, vm_name):
+        entry = self.vms.get(vm_name)
+        return entry["size"] if entry else None
+
+    def set_size(self, vm_name, size, persist=False):
+        # Record a resize done by this agent until the next listing confirms it. persist also
+        # writes it to the snapshot, so the other agents use the new size (and its memory) on
+        # their next cycle instead of after the listing TTL.
+        self.update_entry(vm_name, "size", size, persist)
+
+    def capacity_of(self, vm_name):
+        # Instance count of a scale set, None for a VM
+        entry = self.vms.get(vm_name)
+        return entry.get("capacity") if entry else None
+
+    def resizes_in_place(self, vm_name):
+        # False for a scale set whose running instances would keep their size after a resize
+        # (upgrade policy not in IN_PLACE_UPGRADE_POLICIES); True for VMs
+        entry = self.vms.get(vm_name)
+        if entry is None or not entry.get("scale_set"):
+            return True
+        return entry.get("upgrade_policy") in IN_PLACE_UPGRADE_POLICIES
+
+    def set_capacity(self, vm_name, capacity, persist=False):
+        # Record a scale-out or scale-in done by this agent until the next listing confirms it
+        # (persist: as for set_size)
+        self.update_entry(vm_name, "capacity", capacity, persist)
+
+    def update_entry(self, vm_name, key, value, persist=False):
+        # A persisted change goes on top of the newest snapshot, so it does not undo what
+        # another agent wrote since this one last read it
+        if persist:
+            self.load()
+        entry = self.vms.get(vm_name)
+        if entry is None:
+            return
+        entry[key] = value
+        entry["etag"] = None  # Listed again on the next refresh
+        if persist:
+            try:
+                self.save()
+            except OSError as e:
+                logging.warning(f"VMInventory: Could not write {self.path}: {str(e)}")
+
+    def sku(self, size):
+        return self.skus.get(size_name(size))
+
+    def memory_bytes(self, size):
+        entry = self.sku(size)
+        return entry["memory_gb"] * 1024 * 1024 * 1024 if entry else None
+
+    def vcpus(self, size):
+        entry = self.sku(size)
+        return entry.get("vcpus") if entry else None
+
+    def price(self, size):
+        entry = self.sku(size)
+        return entry.get("price_per_hour") if entry else None